@@ -7,6 +7,7 @@ import time
 import math
 import numpy
 import pprint
+from drone_utils.lidar import parse_lidarData
 
 def transport(client, baggage_pos, transfer_pos):
     client.moveToPosition(baggage_pos['x'], baggage_pos['y'], 3, 5, -90)
@@ -26,15 +27,6 @@ def debug_pos(client):
     roll, pitch, yaw = hakosim.hakosim_types.Quaternionr.quaternion_to_euler(pose.orientation)
     print(f"ANGLE: {math.degrees(roll)} {math.degrees(pitch)} {math.degrees(yaw)}")
 
-def parse_lidarData(data):
-
-    # reshape array of floats to array of [X,Y,Z]
-    points = numpy.array(data.point_cloud, dtype=numpy.dtype('f4'))
-    points = numpy.reshape(points, (int(points.shape[0]/3), 3))
-    
-    return points
-
-
 def main():
     if len(sys.argv) != 2:
         print(f"Usage: {sys.argv[0]} <config_path>")
@@ -7,23 +7,28 @@ import time
 import math
 import numpy
 import pprint
+from drone_utils.geometry import quaternion_to_euler
+from drone_utils.mission import Mission
 
 def transport(client, baggage_pos, transfer_pos):
-    client.moveToPosition(baggage_pos['x'], baggage_pos['y'], 3, 5, -90)
-    client.moveToPosition(baggage_pos['x'], baggage_pos['y'], 3, 5)
-    client.moveToPosition(baggage_pos['x'], baggage_pos['y'], 3, 5, 0)
-    client.moveToPosition(baggage_pos['x'], baggage_pos['y'], 0.3, 5, 0)
-    client.grab_baggage(True)
-    client.moveToPosition(baggage_pos['x'], baggage_pos['y'], 3, 5)
-    client.moveToPosition(transfer_pos['x'], transfer_pos['y'], 3, 5)
-    client.moveToPosition(transfer_pos['x'], transfer_pos['y'], transfer_pos['z'], 5)
-    client.grab_baggage(False)
-    client.moveToPosition(transfer_pos['x'], transfer_pos['y'], 3, 5)
+    mission = Mission(client)
+    mission.move(baggage_pos['x'], baggage_pos['y'], 3, 5, -90)
+    mission.move(baggage_pos['x'], baggage_pos['y'], 3, 5)
+    mission.move(baggage_pos['x'], baggage_pos['y'], 3, 5, 0)
+    mission.move(baggage_pos['x'], baggage_pos['y'], 0.3, 5, 0)
+    mission.grab_baggage(True)
+    mission.move(baggage_pos['x'], baggage_pos['y'], 3, 5)
+    mission.move(transfer_pos['x'], transfer_pos['y'], 3, 5)
+    mission.move(transfer_pos['x'], transfer_pos['y'], transfer_pos['z'], 5)
+    mission.grab_baggage(False)
+    mission.move(transfer_pos['x'], transfer_pos['y'], 3, 5)
+    mission.run()
+    mission.report()
 
 def debug_pos(client):
     pose = client.simGetVehiclePose()
     print(f"POS  : {pose.position.x_val} {pose.position.y_val} {pose.position.z_val}")
-    roll, pitch, yaw = hakosim.hakosim_types.Quaternionr.quaternion_to_euler(pose.orientation)
+    roll, pitch, yaw = quaternion_to_euler(pose.orientation)
     print(f"ANGLE: {math.degrees(roll)} {math.degrees(pitch)} {math.degrees(yaw)}")
 
 def parse_lidarData(data):
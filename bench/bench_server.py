@@ -0,0 +1,238 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Load-test harness for server.py.
+
+Starts server.py under uvicorn with the fake hakosim backend
+(HAKO_FAKE_SIM=1, see bench/fake_hakosim.py), or targets an already
+running server with --url, and measures at each concurrency level:
+  - /api/control/move and /api/control/state latency percentiles
+  - MJPEG frames/s and bytes/s per viewer of /api/control/stream.mjpg
+  - server CPU time per viewer (local Linux server only)
+  - sync-loop interval jitter, cumulative since start (fake backend only)
+Results are written as JSON for regression tracking.
+
+Example:
+  python bench/bench_server.py --levels 1,10,50,200 --duration 5 --output bench_output.json
+"""
+
+import argparse
+import http.client
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+
+def percentiles(samples):
+    if not samples:
+        return {'count': 0}
+    s = sorted(samples)
+    def p(q):
+        return s[min(len(s) - 1, int(len(s) * q))] * 1000
+    return {'count': len(s), 'mean_ms': sum(s) / len(s) * 1000, 'p50_ms': p(0.50),
+            'p90_ms': p(0.90), 'p99_ms': p(0.99), 'max_ms': s[-1] * 1000}
+
+
+def process_cpu_sec(pid):
+    """
+    utime + stime of a local process from /proc (Linux); None elsewhere.
+    """
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rsplit(')', 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+    except (OSError, IndexError, ValueError):
+        return None
+
+
+class Target:
+    def __init__(self, url):
+        u = urllib.parse.urlparse(url)
+        self.host = u.hostname
+        self.port = u.port or 80
+
+    def connection(self, timeout=10.0):
+        return http.client.HTTPConnection(self.host, self.port, timeout=timeout)
+
+    def wait_ready(self, timeout=30.0):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            try:
+                conn = self.connection(timeout=1.0)
+                conn.request('GET', '/ping')
+                if conn.getresponse().status == 200:
+                    return True
+            except OSError:
+                pass
+            time.sleep(0.2)
+        return False
+
+
+def request_worker(target, stop, method, path, body, latencies, errors):
+    conn = target.connection()
+    headers = {'Content-Type': 'application/json'} if body is not None else {}
+    while not stop.is_set():
+        t0 = time.perf_counter()
+        try:
+            conn.request(method, path, body=body, headers=headers)
+            resp = conn.getresponse()
+            resp.read()
+            if resp.status >= 400:
+                errors.append(resp.status)
+            else:
+                latencies.append(time.perf_counter() - t0)
+        except (OSError, http.client.HTTPException):
+            errors.append('connection')
+            conn.close()
+            conn = target.connection()
+    conn.close()
+
+
+def run_requests(target, clients, duration, method, path, body=None):
+    stop = threading.Event()
+    latencies = []
+    errors = []
+    threads = [threading.Thread(target=request_worker, args=(target, stop, method, path, body, latencies, errors), daemon=True)
+               for _ in range(clients)]
+    for t in threads:
+        t.start()
+    time.sleep(duration)
+    stop.set()
+    for t in threads:
+        t.join(timeout=15.0)
+    result = percentiles(latencies)
+    result['requests_per_sec'] = len(latencies) / duration
+    result['errors'] = len(errors)
+    return result
+
+
+def mjpeg_viewer(target, stop, fps, stats):
+    frames = 0
+    received = 0
+    try:
+        conn = target.connection()
+        conn.request('GET', f"/api/control/stream.mjpg?fps={fps}")
+        resp = conn.getresponse()
+        while not stop.is_set():
+            # part headers, then Content-Length bytes of JPEG
+            line = resp.fp.readline()
+            if not line:
+                break
+            received += len(line)
+            if line.lower().startswith(b'content-length:'):
+                length = int(line.split(b':', 1)[1])
+                resp.fp.readline()
+                received += len(resp.fp.read(length)) + 2
+                frames += 1
+        conn.close()
+    except (OSError, http.client.HTTPException, ValueError):
+        stats['errors'] += 1
+    with stats['lock']:
+        stats['frames'].append(frames)
+        stats['bytes'].append(received)
+
+
+def run_mjpeg(target, viewers, duration, fps, server_pid=None):
+    stop = threading.Event()
+    stats = {'lock': threading.Lock(), 'frames': [], 'bytes': [], 'errors': 0}
+    cpu0 = process_cpu_sec(server_pid) if server_pid else None
+    threads = [threading.Thread(target=mjpeg_viewer, args=(target, stop, fps, stats), daemon=True) for _ in range(viewers)]
+    for t in threads:
+        t.start()
+    time.sleep(duration)
+    cpu1 = process_cpu_sec(server_pid) if server_pid else None
+    stop.set()
+    for t in threads:
+        t.join(timeout=5.0)
+    frames = stats['frames']
+    result = {
+        'viewers': viewers,
+        'fps_per_viewer_mean': (sum(frames) / len(frames) / duration) if frames else 0.0,
+        'fps_per_viewer_min': (min(frames) / duration) if frames else 0.0,
+        'bytes_per_sec_per_viewer': (sum(stats['bytes']) / len(stats['bytes']) / duration) if stats['bytes'] else 0.0,
+        'errors': stats['errors'],
+    }
+    if cpu0 is not None and cpu1 is not None:
+        result['server_cpu_sec_per_sec'] = (cpu1 - cpu0) / duration
+        result['server_cpu_sec_per_sec_per_viewer'] = (cpu1 - cpu0) / duration / viewers
+    return result
+
+
+def read_fake_stats(path):
+    if not path or not os.path.exists(path):
+        return None
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def start_server(port, stats_path):
+    env = dict(os.environ)
+    env['HAKO_FAKE_SIM'] = '1'
+    env['HAKO_FAKE_STATS_PATH'] = stats_path
+    cmd = [sys.executable, '-m', 'uvicorn', 'server:app', '--port', str(port), '--log-level', 'warning']
+    return subprocess.Popen(cmd, cwd=ROOT, env=env)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="server.py load test")
+    parser.add_argument('--url', help="benchmark an already running server instead of starting one")
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--levels', default='1,10,50,100,200', help="comma separated client counts")
+    parser.add_argument('--duration', type=float, default=5.0, help="seconds per measurement")
+    parser.add_argument('--fps', type=int, default=15, help="requested MJPEG fps")
+    parser.add_argument('--output', default='bench_output.json')
+    args = parser.parse_args()
+
+    levels = [int(v) for v in args.levels.split(',') if v]
+    stats_path = os.path.join(tempfile.gettempdir(), f"hako_fake_stats_{os.getpid()}.json")
+    server = None
+    if args.url:
+        target = Target(args.url)
+    else:
+        server = start_server(args.port, stats_path)
+        target = Target(f"http://127.0.0.1:{args.port}")
+    try:
+        if not target.wait_ready():
+            print("ERROR: server did not become ready")
+            return 1
+        server_pid = server.pid if server else None
+        move_body = json.dumps({'dx': 0.1, 'dy': 0.0, 'dz': 0.0, 'yaw': 0.0})
+        results = {'timestamp': time.time(), 'duration_sec': args.duration, 'fake_backend': server is not None, 'levels': []}
+        for n in levels:
+            print(f"INFO: level {n} clients")
+            level = {'clients': n}
+            level['state'] = run_requests(target, n, args.duration, 'GET', '/api/control/state')
+            level['move'] = run_requests(target, n, args.duration, 'POST', '/api/control/move', move_body)
+            level['mjpeg'] = run_mjpeg(target, n, args.duration, args.fps, server_pid)
+            fake = read_fake_stats(stats_path)
+            if fake is not None:
+                level['sync_loop_cumulative'] = fake.get('sync_loop')
+            results['levels'].append(level)
+            print(json.dumps(level))
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"INFO: results written to {args.output}")
+    finally:
+        if server is not None:
+            server.terminate()
+            try:
+                server.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                server.kill()
+            if os.path.exists(stats_path):
+                os.remove(stats_path)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
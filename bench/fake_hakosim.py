@@ -0,0 +1,200 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import json
+import math
+import os
+import threading
+import time
+
+
+class Vector3r:
+    def __init__(self, x_val=0.0, y_val=0.0, z_val=0.0):
+        self.x_val = x_val
+        self.y_val = y_val
+        self.z_val = z_val
+
+
+class Quaternionr:
+    def __init__(self, x_val=0.0, y_val=0.0, z_val=0.0, w_val=1.0):
+        self.x_val = x_val
+        self.y_val = y_val
+        self.z_val = z_val
+        self.w_val = w_val
+
+
+class Pose:
+    def __init__(self, position_val=None, orientation_val=None):
+        self.position = position_val if position_val is not None else Vector3r()
+        self.orientation = orientation_val if orientation_val is not None else Quaternionr()
+
+
+class FakeVehicle:
+    def __init__(self, name):
+        self.name = name
+        self.arm = False
+        self.api_control = False
+
+
+def _make_frames(count, width, height, quality):
+    """
+    Synthetic JPEG frames. Uses OpenCV when available; otherwise frames are
+    placeholder byte strings of a comparable size (fine for throughput tests,
+    not decodable).
+    """
+    try:
+        import numpy as np
+        import cv2
+    except ImportError:
+        size = width * height // 10
+        return [b'\xff\xd8' + bytes([i % 256]) * size + b'\xff\xd9' for i in range(count)]
+    frames = []
+    yy, xx = np.mgrid[0:height, 0:width]
+    for i in range(count):
+        img = np.empty((height, width, 3), dtype=np.uint8)
+        img[..., 0] = (xx + i * 8) % 256
+        img[..., 1] = (yy + i * 4) % 256
+        img[..., 2] = (xx + yy) % 256
+        cv2.putText(img, f"FAKE {i}", (20, 40), cv2.FONT_HERSHEY_SIMPLEX, 1.0, (255, 255, 255), 2)
+        ok, jpeg = cv2.imencode('.jpg', img, [cv2.IMWRITE_JPEG_QUALITY, quality])
+        frames.append(jpeg.tobytes())
+    return frames
+
+
+class FakeMultirotorClient:
+    """
+    Local stand-in for hakosim.MultirotorClient used for benchmarks.
+
+    Serves a synthetic pose (slow circle) and a rotating set of JPEG frames
+    that change at `frame_rate`. Commands succeed after a configurable
+    latency. Timestamps of run_nowait() calls are recorded so the sync-loop
+    jitter of the server can be measured; with stats_path set they are
+    dumped as JSON about once per second.
+    Settings can also come from HAKO_FAKE_* environment variables.
+    """
+    def __init__(self, config_path=None, default_drone_name="Drone", frame_rate=None,
+                 width=None, height=None, command_latency_sec=None, stats_path=None):
+        env = os.environ
+        self.default_drone_name = default_drone_name
+        self.vehicles = {default_drone_name: FakeVehicle(default_drone_name)}
+        self.pdu_manager = object()
+        self.frame_rate = frame_rate or float(env.get('HAKO_FAKE_FRAME_RATE', '30'))
+        self.command_latency_sec = command_latency_sec if command_latency_sec is not None \
+            else float(env.get('HAKO_FAKE_COMMAND_LATENCY_SEC', '0.05'))
+        self.stats_path = stats_path or env.get('HAKO_FAKE_STATS_PATH')
+        self._frames = _make_frames(30, width or int(env.get('HAKO_FAKE_WIDTH', '640')),
+                                    height or int(env.get('HAKO_FAKE_HEIGHT', '480')),
+                                    int(env.get('HAKO_FAKE_JPEG_QUALITY', '80')))
+        self._start = time.monotonic()
+        self._lock = threading.Lock()
+        self._offset = [0.0, 0.0, 0.0]
+        self._axis = [0.0] * 8
+        self._button = [False] * 16
+        self._last_tick = None
+        self._last_dump = self._start
+        self.counters = {'run_nowait': 0, 'pose_reads': 0, 'image_reads': 0, 'commands': 0,
+                         'joystick_reads': 0, 'joystick_writes': 0}
+        self.tick_intervals = []
+
+    # --- connection ---
+    def confirmConnection(self):
+        return True
+
+    def enableApiControl(self, v, vehicle_name=None):
+        self.vehicles[vehicle_name or self.default_drone_name].api_control = v
+        return True
+
+    def armDisarm(self, v, vehicle_name=None):
+        self.vehicles[vehicle_name or self.default_drone_name].arm = v
+        return True
+
+    def get_vehicle_name(self, vehicle_name):
+        return vehicle_name
+
+    def run_nowait(self):
+        now = time.monotonic()
+        with self._lock:
+            self.counters['run_nowait'] += 1
+            if self._last_tick is not None:
+                self.tick_intervals.append(now - self._last_tick)
+                if len(self.tick_intervals) > 100000:
+                    del self.tick_intervals[:50000]
+            self._last_tick = now
+        if self.stats_path and now - self._last_dump >= 1.0:
+            self._last_dump = now
+            self.dump_stats(self.stats_path)
+
+    # --- state ---
+    def simGetVehiclePose(self, vehicle_name=None):
+        with self._lock:
+            self.counters['pose_reads'] += 1
+            offset = list(self._offset)
+        t = time.monotonic() - self._start
+        yaw = 0.1 * t
+        return Pose(Vector3r(5.0 * math.cos(yaw) + offset[0], 5.0 * math.sin(yaw) + offset[1], 1.0 + offset[2]),
+                    Quaternionr(0.0, 0.0, math.sin(yaw / 2), math.cos(yaw / 2)))
+
+    def simGetImage(self, camera_id, image_type, vehicle_name=None):
+        with self._lock:
+            self.counters['image_reads'] += 1
+        index = int((time.monotonic() - self._start) * self.frame_rate) % len(self._frames)
+        return self._frames[index]
+
+    def getGameJoystickData(self, vehicle_name=None):
+        with self._lock:
+            self.counters['joystick_reads'] += 1
+            return {'axis': list(self._axis), 'button': list(self._button)}
+
+    def putGameJoystickData(self, data, vehicle_name=None):
+        axis = data['axis'] if isinstance(data, dict) else data.axis
+        with self._lock:
+            self.counters['joystick_writes'] += 1
+            self._axis = list(axis)
+        return True
+
+    # --- commands ---
+    def _command(self):
+        with self._lock:
+            self.counters['commands'] += 1
+        if self.command_latency_sec > 0:
+            time.sleep(self.command_latency_sec)
+        return True
+
+    def takeoff(self, height, timeout_sec=-1, vehicle_name=None):
+        return self._command()
+
+    def land(self, timeout_sec=-1, vehicle_name=None):
+        return self._command()
+
+    def moveToPosition(self, x, y, z, speed, yaw_deg=None, timeout_sec=-1, vehicle_name=None):
+        return self._command()
+
+    def grab_baggage(self, grab, timeout_sec=-1, vehicle_name=None):
+        return self._command()
+
+    # --- stats ---
+    def stats(self):
+        with self._lock:
+            intervals = sorted(self.tick_intervals)
+            counters = dict(self.counters)
+        result = {'counters': counters, 'sync_loop': {'samples': len(intervals)}}
+        if intervals:
+            mean = sum(intervals) / len(intervals)
+            result['sync_loop'].update({
+                'interval_mean_ms': mean * 1000,
+                'interval_p50_ms': intervals[len(intervals) // 2] * 1000,
+                'interval_p99_ms': intervals[min(len(intervals) - 1, int(len(intervals) * 0.99))] * 1000,
+                'interval_max_ms': intervals[-1] * 1000,
+                'jitter_std_ms': math.sqrt(sum((v - mean) ** 2 for v in intervals) / len(intervals)) * 1000,
+            })
+        return result
+
+    def reset_stats(self):
+        with self._lock:
+            self.tick_intervals = []
+
+    def dump_stats(self, path):
+        tmp = f"{path}.tmp"
+        with open(tmp, 'w') as f:
+            json.dump(self.stats(), f)
+        os.replace(tmp, path)
@@ -5,40 +5,168 @@ import time
 import math
 import numpy as np
 import cv2
+from drone_utils.image_decode import decode_jpeg, decode_flags, copy_into
 
-def image_display_thread(client, fps=15):
-    interval = 1.0 / fps
-    while True:
-        start_time = time.time()
 
-        try:
-            response = client.simGetImage("0", hakosim.ImageType.Scene)
-            if response:
-                img_np = np.frombuffer(response, dtype=np.uint8)
-                img_rgb = cv2.imdecode(img_np, cv2.IMREAD_COLOR)
+class LatestQueue:
+    """
+    Single-slot queue: put() replaces any frame that was not taken yet,
+    so a slow stage always works on the newest frame.
+    """
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._item = None
+        self.dropped = 0
+
+    def put(self, item):
+        with self._cond:
+            if self._item is not None:
+                self.dropped += 1
+            self._item = item
+            self._cond.notify()
+
+    def get(self, timeout=None):
+        with self._cond:
+            if self._item is None:
+                self._cond.wait(timeout)
+            item = self._item
+            self._item = None
+            return item
+
+
+class CameraPipeline:
+    """
+    fetch -> decode -> consume pipeline for simulator camera frames.
+
+    Fetch and decode run on their own threads and are connected by
+    LatestQueue, so a slow decode or consumer drops stale frames instead of
+    delaying the next fetch. Frames handed to the consumer are
+    (fetch_time, image); every frame is a new array owned by the consumer,
+    unless get_frame() is given an `out` buffer to copy it into.
+    """
+    def __init__(self, client, camera_id="0", fps=15, scale=1, grayscale=False, roi=None):
+        self.client = client
+        self.camera_id = camera_id
+        self.interval = 1.0 / fps
+        # reduced-size / grayscale / ROI decoding, see drone_utils.image_decode
+        self.scale = scale
+        self.grayscale = grayscale
+        self.roi = roi
+        self.flags = decode_flags(scale, grayscale)
+        self.encoded = LatestQueue()
+        self.decoded = LatestQueue()
+        self._stop = threading.Event()
+        self._threads = []
+        self.fetched = 0
+        self.decode_errors = 0
+        self.consumed = 0
+        self.latency_sum = 0.0
+        self.latency_max = 0.0
+
+    def start(self):
+        self._stop.clear()
+        self._threads = [threading.Thread(target=self._fetch_loop, daemon=True),
+                         threading.Thread(target=self._decode_loop, daemon=True)]
+        for t in self._threads:
+            t.start()
 
-                if img_rgb is None or img_rgb.size == 0:
-                    print("Error: Failed to decode image")
+    def stop(self):
+        self._stop.set()
+        for t in self._threads:
+            t.join(timeout=1.0)
+
+    def _fetch_loop(self):
+        next_time = time.perf_counter()
+        while not self._stop.is_set():
+            try:
+                response = self.client.simGetImage(self.camera_id, hakosim.ImageType.Scene)
+                if response:
+                    self.fetched += 1
+                    self.encoded.put((time.perf_counter(), response))
                 else:
-                    cv2.imshow("Camera View", img_rgb)
-                    if cv2.waitKey(1) & 0xFF == ord('q'):
-                        break
+                    print("Error: No image received from client")
+            except Exception as e:
+                print(f"Error: {e}")
+            next_time += self.interval
+            delay = next_time - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
             else:
-                print("Error: No image received from client")
+                next_time = time.perf_counter()
+
+    def _decode(self, data):
+        # cv2.imdecode always allocates its result (the Python binding has no
+        # dst argument), so frames are not decoded into reused buffers
+        if self.roi is not None:
+            return decode_jpeg(data, self.scale, self.grayscale, self.roi)
+        return cv2.imdecode(np.frombuffer(data, dtype=np.uint8), self.flags)
+
+    def _decode_loop(self):
+        while not self._stop.is_set():
+            item = self.encoded.get(timeout=0.1)
+            if item is None:
+                continue
+            fetch_time, data = item
+            img = self._decode(data)
+            if img is None or img.size == 0:
+                self.decode_errors += 1
+                print("Error: Failed to decode image")
+                continue
+            self.decoded.put((fetch_time, img))
+
+    def get_frame(self, timeout=None, out=None):
+        """
+        Returns the newest decoded (fetch_time, image) or None on timeout.
+        With `out` (uint8, see image_decode.output_shape()), the image is
+        copied into it and image is a view of out, so a consumer that passes
+        the same buffer every time does not allocate per frame.
+        """
+        item = self.decoded.get(timeout)
+        if item is not None:
+            if out is not None:
+                item = (item[0], copy_into(out, item[1]))
+            latency = time.perf_counter() - item[0]
+            self.consumed += 1
+            self.latency_sum += latency
+            self.latency_max = max(self.latency_max, latency)
+        return item
 
-        except Exception as e:
-            print(f"Error: {e}")
+    def run_headless(self, callback):
+        """
+        Hands every decoded frame to callback(fetch_time, image) until stop().
+        """
+        while not self._stop.is_set():
+            item = self.get_frame(timeout=0.1)
+            if item is not None:
+                callback(*item)
 
-        elapsed_time = time.time() - start_time
-        wait_time = max(0, interval - elapsed_time)
-        time.sleep(wait_time)
+    def report(self):
+        mean = (self.latency_sum / self.consumed * 1000) if self.consumed > 0 else 0.0
+        print(f"INFO: fetched={self.fetched} consumed={self.consumed} "
+              f"dropped(fetch->decode)={self.encoded.dropped} dropped(decode->consume)={self.decoded.dropped} "
+              f"decode_errors={self.decode_errors} latency mean={mean:.1f}ms max={self.latency_max * 1000:.1f}ms")
+
+
+def image_display_thread(client, fps=15):
+    pipeline = CameraPipeline(client, fps=fps)
+    pipeline.start()
+    try:
+        while True:
+            item = pipeline.get_frame(timeout=1.0)
+            if item is not None:
+                cv2.imshow("Camera View", item[1])
+            if cv2.waitKey(1) & 0xFF == ord('q'):
+                break
+    finally:
+        pipeline.stop()
+        pipeline.report()
 
     cv2.destroyAllWindows()
 
 
 def main():
-    if len(sys.argv) != 2:
-        print(f"Usage: {sys.argv[0]} <config_path>")
+    if len(sys.argv) != 2 and not (len(sys.argv) == 3 and sys.argv[2] == '--headless'):
+        print(f"Usage: {sys.argv[0]} <config_path> [--headless]")
         return 1
 
     client = hakosim.MultirotorClient(sys.argv[1], "Drone")
@@ -46,7 +174,18 @@ def main():
     client.enableApiControl(True)
     client.armDisarm(True)
 
-    image_display_thread(client)
+    if len(sys.argv) == 3:
+        pipeline = CameraPipeline(client)
+        pipeline.start()
+        try:
+            pipeline.run_headless(lambda t, img: None)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            pipeline.stop()
+            pipeline.report()
+    else:
+        image_display_thread(client)
 
 
     return 0
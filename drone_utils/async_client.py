@@ -0,0 +1,266 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import asyncio
+import math
+import time
+from drone_utils import geometry
+
+
+class MotionHandle:
+    """
+    Awaitable, cancellable handle of one motion command.
+
+    `await handle` returns True when the simulator reports completion and
+    False on timeout. handle.cancel() stops the vehicle where it is.
+    on_progress(handle) is called from the poller after every pose update.
+    """
+    def __init__(self, owner, vehicle_name, kind, command, target, timeout_sec, on_progress=None):
+        self.owner = owner
+        self.vehicle_name = vehicle_name
+        self.kind = kind
+        self.command = command
+        self.target = target
+        self.on_progress = on_progress
+        self.start_time = time.perf_counter()
+        self.deadline = self.start_time + timeout_sec if timeout_sec > 0 else math.inf
+        self.start_position = None
+        self.position = None
+        self.progress = 0.0
+        self.resends = 0
+        self.future = asyncio.get_running_loop().create_future()
+
+    def __await__(self):
+        return self.future.__await__()
+
+    def done(self):
+        return self.future.done()
+
+    def cancel(self):
+        if self.future.done():
+            return False
+        self.owner._hold(self.vehicle_name)
+        self.future.cancel()
+        return True
+
+    def _update(self, position):
+        if self.start_position is None:
+            self.start_position = position
+        self.position = position
+        total = math.dist(self.start_position, self.target)
+        if total > 1e-6:
+            self.progress = max(0.0, min(1.0, 1.0 - math.dist(position, self.target) / total))
+        if self.on_progress is not None:
+            try:
+                self.on_progress(self)
+            except Exception as e:
+                print(f"WARNING: progress callback failed: {e}")
+
+    def _finish(self, result):
+        if not self.future.done():
+            if result:
+                self.progress = 1.0
+            self.future.set_result(result)
+
+
+class AsyncMultirotorClient:
+    """
+    asyncio facade of the MultirotorClient motion API.
+
+    takeoff/moveToPosition/land only write the command PDU and return a
+    MotionHandle. A single poller task reads the pose of every vehicle with
+    a pending command in one pass per tick, checks the command results and
+    resolves the handles, so one event loop can drive many vehicles.
+
+    Results use the same handshake as Mission: before any command is
+    written, a result = 1 left by the previous command of that vehicle (a
+    replaced move, or the hold written on cancel) is reset to 0 and written
+    back. result = 1 only completes a handle when the vehicle is within
+    ARRIVAL_TOLERANCE of its target; otherwise it is the late completion of
+    a replaced command, and the command is sent again (at most MAX_RESENDS
+    times).
+    """
+    ARRIVAL_TOLERANCE = 0.5
+    MAX_RESENDS = 3
+
+    def __init__(self, client, poll_interval=0.02, timeout_sec=60.0, auto_poll=True):
+        self.client = client
+        self.poll_interval = poll_interval
+        self.timeout_sec = timeout_sec
+        # with auto_poll=False the owner calls poll_once() itself (see SwarmCoordinator)
+        self.auto_poll = auto_poll
+        self.poses = {}
+        self._handles = {}
+        # last command written per vehicle, whose result may still be pending
+        self._commands = {}
+        self._task = None
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._poll())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        for handle in list(self._handles.values()):
+            handle.future.cancel()
+        self._handles.clear()
+
+    def _name(self, vehicle_name):
+        return vehicle_name if vehicle_name is not None else self.client.default_drone_name
+
+    def _get_pose(self, vehicle_name):
+        if vehicle_name == self.client.default_drone_name:
+            return self.client.simGetVehiclePose()
+        return self.client.simGetVehiclePose(vehicle_name=vehicle_name)
+
+    def _position(self, vehicle_name):
+        pose = self._get_pose(vehicle_name)
+        return (pose.position.x_val, pose.position.y_val, pose.position.z_val)
+
+    def _packet(self, channel_id, vehicle_name):
+        return self.client.get_packet(channel_id, self.client.get_vehicle_name(vehicle_name))
+
+    @staticmethod
+    def _take_result(command):
+        """
+        Consumes a completion: if result is 1, resets it to 0 and writes
+        the PDU back. Returns True if a completion was consumed.
+        """
+        pdu = command.read()
+        if pdu is None or pdu['header']['result'] != 1:
+            return False
+        pdu['header']['result'] = 0
+        command.write()
+        return True
+
+    def _write(self, vehicle_name, command):
+        previous = self._commands.get(vehicle_name)
+        if previous is not None:
+            self._take_result(previous)
+        self._commands[vehicle_name] = command
+        return command.write()
+
+    def _submit(self, vehicle_name, kind, command, target, on_progress):
+        previous = self._handles.get(vehicle_name)
+        if previous is not None and not previous.done():
+            # a new command supersedes the running one
+            previous.future.cancel()
+        if not self._write(vehicle_name, command):
+            raise RuntimeError(f"failed to write {kind} command for {vehicle_name}")
+        handle = MotionHandle(self, vehicle_name, kind, command, target, self.timeout_sec, on_progress)
+        self._handles[vehicle_name] = handle
+        if self.auto_poll:
+            self.start()
+        return handle
+
+    def _hold(self, vehicle_name):
+        # stop a running command by moving to the current position
+        import libs.pdu_info as pdu_info
+        pose = self._get_pose(vehicle_name)
+        command, pdu_cmd = self._packet(pdu_info.HAKO_AVATAR_CHANNEL_ID_CMD_MOVE, vehicle_name)
+        pdu_cmd['x'] = pose.position.x_val
+        pdu_cmd['y'] = pose.position.y_val
+        pdu_cmd['z'] = pose.position.z_val
+        pdu_cmd['speed'] = 1
+        pdu_cmd['yaw_deg'] = geometry.yaw_deg(pose.orientation)
+        # its result is consumed by the next _write for this vehicle
+        self._write(vehicle_name, command)
+        self._handles.pop(vehicle_name, None)
+
+    def takeoff(self, height, speed=5, vehicle_name=None, on_progress=None) -> MotionHandle:
+        import libs.pdu_info as pdu_info
+        name = self._name(vehicle_name)
+        pose = self._get_pose(name)
+        command, pdu_cmd = self._packet(pdu_info.HAKO_AVATAR_CHANNEL_ID_CMD_TAKEOFF, name)
+        pdu_cmd['height'] = height
+        pdu_cmd['speed'] = speed
+        pdu_cmd['yaw_deg'] = geometry.yaw_deg(pose.orientation)
+        return self._submit(name, 'takeoff', command, (pose.position.x_val, pose.position.y_val, height), on_progress)
+
+    def moveToPosition(self, x, y, z, speed, yaw_deg=None, vehicle_name=None, on_progress=None) -> MotionHandle:
+        import libs.pdu_info as pdu_info
+        name = self._name(vehicle_name)
+        command, pdu_cmd = self._packet(pdu_info.HAKO_AVATAR_CHANNEL_ID_CMD_MOVE, name)
+        pdu_cmd['x'] = x
+        pdu_cmd['y'] = y
+        pdu_cmd['z'] = z
+        pdu_cmd['speed'] = speed
+        if yaw_deg is None:
+            yaw_deg = geometry.yaw_deg(self._get_pose(name).orientation)
+        pdu_cmd['yaw_deg'] = yaw_deg
+        return self._submit(name, 'move', command, (x, y, z), on_progress)
+
+    def land(self, speed=5, vehicle_name=None, on_progress=None) -> MotionHandle:
+        import libs.pdu_info as pdu_info
+        name = self._name(vehicle_name)
+        pose = self._get_pose(name)
+        command, pdu_cmd = self._packet(pdu_info.HAKO_AVATAR_CHANNEL_ID_CMD_LAND, name)
+        pdu_cmd['height'] = 0
+        pdu_cmd['speed'] = speed
+        pdu_cmd['yaw_deg'] = geometry.yaw_deg(pose.orientation)
+        return self._submit(name, 'land', command, (pose.position.x_val, pose.position.y_val, 0.0), on_progress)
+
+    async def grab_baggage(self, grab, vehicle_name=None):
+        # no non-blocking command path for the magnet; run it off the event loop
+        name = self._name(vehicle_name)
+        if name == self.client.default_drone_name:
+            return await asyncio.to_thread(self.client.grab_baggage, grab)
+        return await asyncio.to_thread(self.client.grab_baggage, grab, vehicle_name=name)
+
+    def poll_once(self, positions=None):
+        """
+        Updates every pending handle once. `positions` maps vehicle name to
+        an already read (x, y, z); vehicles missing from it are read here.
+        """
+        now = time.perf_counter()
+        for name, handle in list(self._handles.items()):
+            if handle.done():
+                del self._handles[name]
+                continue
+            if positions is not None and name in positions:
+                position = positions[name]
+            else:
+                position = self._position(name)
+            self.poses[name] = position
+            handle._update(position)
+            if self._take_result(handle.command):
+                distance = math.dist(position, handle.target)
+                if distance <= self.ARRIVAL_TOLERANCE:
+                    handle._finish(True)
+                    del self._handles[name]
+                    continue
+                # completion of the replaced command, or the rewrite was ignored
+                handle.resends += 1
+                if handle.resends > self.MAX_RESENDS:
+                    print(f"WARNING: simulator did not accept {handle.kind} command for {name}")
+                    handle._finish(False)
+                    del self._handles[name]
+                    continue
+                print(f"WARNING: stale {handle.kind} result {distance:.2f} m from target for {name}, resending")
+                # the PDU read back still holds this command's fields
+                handle.command.write()
+            if now >= handle.deadline:
+                print(f"WARNING: {handle.kind} command timed out for {name}")
+                handle._finish(False)
+                del self._handles[name]
+
+    async def _poll(self):
+        next_time = time.perf_counter()
+        while True:
+            try:
+                self.poll_once()
+            except Exception as e:
+                print(f"ERROR: pose poller: {e}")
+            next_time += self.poll_interval
+            delay = next_time - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            else:
+                next_time = time.perf_counter()
+                await asyncio.sleep(0)
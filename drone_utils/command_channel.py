@@ -0,0 +1,91 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import asyncio
+import json
+import os
+
+# Command forwarding from HTTP workers to the simulator-owner process over a
+# Unix domain socket. One JSON object per line in each direction:
+#   request   {"op": ..., ...arguments}
+#   response  {"status": <HTTP status>, "body": ...}
+# The owner handles requests one at a time on its event loop, so commands
+# from all workers reach the simulator in a single ordered queue.
+
+
+async def serve(path, handler):
+    """
+    Starts the owner side. handler(request: dict) is a coroutine returning
+    (status, body). A socket file left behind by a dead owner is replaced.
+    """
+    if os.path.exists(path):
+        os.remove(path)
+
+    async def on_client(reader, writer):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    status, body = await handler(json.loads(line))
+                except Exception as e:
+                    status, body = 500, f"{type(e).__name__}: {e}"
+                writer.write(json.dumps({'status': status, 'body': body}).encode() + b'\n')
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    return await asyncio.start_unix_server(on_client, path=path)
+
+
+class CommandClient:
+    """
+    Worker side. Keeps one connection per process and reconnects after an
+    error; concurrent calls are serialized. Raises OSError when the owner
+    cannot be reached.
+    """
+    def __init__(self, path, timeout_sec=5.0):
+        self.path = path
+        self.timeout_sec = timeout_sec
+        self._reader = None
+        self._writer = None
+        self._lock = asyncio.Lock()
+
+    async def _connect(self):
+        if self._writer is None or self._writer.is_closing():
+            self._reader, self._writer = await asyncio.open_unix_connection(self.path)
+
+    def _reset(self):
+        if self._writer is not None:
+            self._writer.close()
+        self._reader = self._writer = None
+
+    async def call(self, op, **args):
+        """
+        Sends one command and returns (status, body).
+        """
+        request = json.dumps({'op': op, **args}).encode() + b'\n'
+        async with self._lock:
+            try:
+                await self._connect()
+                self._writer.write(request)
+                await self._writer.drain()
+                line = await asyncio.wait_for(self._reader.readline(), self.timeout_sec)
+            except asyncio.TimeoutError:
+                # a late reply would be read as the answer to the next call
+                self._reset()
+                raise OSError(f"no reply to '{op}' within {self.timeout_sec}s")
+            except OSError:
+                self._reset()
+                raise
+            if not line:
+                self._reset()
+                raise ConnectionResetError("owner closed the connection")
+        response = json.loads(line)
+        return response['status'], response['body']
+
+    def close(self):
+        self._reset()
@@ -0,0 +1,342 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import json
+import os
+import queue
+import struct
+import sys
+import threading
+import zlib
+from array import array
+
+# Flight recorder: telemetry rows are appended to per-column arrays in the
+# caller's thread (no I/O, no locks per row) and handed off in chunks to a writer
+# thread that compresses and appends them to the log file.
+#
+# File layout (little-endian):
+#   file header   8s magic, u32 len + JSON schema
+#   block         4s kind, u32 payload length, payload
+#     b'CHNK'     chunk header, then one zlib stream per column, then zlib JSON events
+#     b'INDX'     u64 previous index offset, u32 count, count x (f64 t_min, f64 t_max, u64 offset)
+#   footer        8s magic, u64 offset of the last index block
+#
+# Index blocks are written every INDEX_EVERY chunks and on close; a reader
+# follows the chain back from the footer. If the process died before the
+# footer was written, the reader rebuilds the index by scanning blocks.
+
+_MAGIC = b'HKFLT\x00\x00\x01'
+_FOOTER_MAGIC = b'HKFLTEND'
+_BLOCK = struct.Struct('<4sI')
+_CHUNK = struct.Struct('<IIdd')        # rows, events, t_min, t_max
+_INDEX_HEAD = struct.Struct('<QI')
+_INDEX_ENTRY = struct.Struct('<ddQ')
+_FOOTER = struct.Struct('<8sQ')
+
+# (name, array typecode)
+COLUMNS = (
+    ('t', 'd'),
+    ('x', 'f'), ('y', 'f'), ('z', 'f'),
+    ('qw', 'f'), ('qx', 'f'), ('qy', 'f'), ('qz', 'f'),
+    ('in_dx', 'f'), ('in_dy', 'f'), ('in_dz', 'f'), ('in_yaw', 'f'),
+    ('armed', 'B'), ('flying', 'B'),
+)
+
+CHUNK_ROWS = 500          # 10 s at 50 Hz
+INDEX_EVERY = 16
+
+
+class FlightRecorder:
+    """
+    Append-only telemetry log. record() and event() only touch in-memory
+    arrays; compression and disk writes happen on a background thread. If
+    the writer falls behind by more than max_pending chunks, new chunks are
+    dropped (counted in dropped_chunks) instead of blocking the caller.
+    """
+    def __init__(self, path, chunk_rows=CHUNK_ROWS, compresslevel=1, max_pending=64):
+        self.path = path
+        self.chunk_rows = chunk_rows
+        self.compresslevel = compresslevel
+        self.rows = 0
+        self.chunks = 0
+        self.dropped_chunks = 0
+        self.bytes_written = 0
+        self._queue = queue.Queue(maxsize=max_pending)
+        # record()/flush() run on the control loop; events may come from other threads
+        self._events_lock = threading.Lock()
+        self._new_chunk()
+        self._file = open(path, 'wb')
+        schema = json.dumps({'columns': COLUMNS, 'chunk_rows': chunk_rows}).encode()
+        self._write(_MAGIC + struct.pack('<I', len(schema)) + schema)
+        self._index = []
+        self._last_index = 0
+        self._thread = threading.Thread(target=self._writer, name='flight-recorder', daemon=True)
+        self._thread.start()
+
+    def _new_chunk(self):
+        self._columns = [array(code) for _, code in COLUMNS]
+        self._events = []
+
+    def record(self, t, pose=None, control_input=None, armed=False, flying=False):
+        """
+        Appends one telemetry row. pose is a hakosim Pose, control_input has
+        dx/dy/dz/yaw (server JoystickInput); missing values are stored as 0.
+        """
+        c = self._columns
+        c[0].append(t)
+        if pose is not None:
+            p = pose.position
+            q = pose.orientation
+            c[1].append(p.x_val); c[2].append(p.y_val); c[3].append(p.z_val)
+            c[4].append(q.w_val); c[5].append(q.x_val); c[6].append(q.y_val); c[7].append(q.z_val)
+        else:
+            for i in range(1, 8):
+                c[i].append(0.0)
+        if control_input is not None:
+            c[8].append(control_input.dx); c[9].append(control_input.dy)
+            c[10].append(control_input.dz); c[11].append(control_input.yaw)
+        else:
+            for i in range(8, 12):
+                c[i].append(0.0)
+        c[12].append(1 if armed else 0)
+        c[13].append(1 if flying else 0)
+        self.rows += 1
+        if len(c[0]) >= self.chunk_rows:
+            self.flush()
+
+    def event(self, t, name, **data):
+        """
+        Records a command or state change, e.g. event(t, 'move', dx=0.5).
+        """
+        with self._events_lock:
+            self._events.append((t, name, data))
+
+    def flush(self):
+        """
+        Hands the current chunk to the writer thread.
+        """
+        with self._events_lock:
+            if not len(self._columns[0]) and not self._events:
+                return
+            item = (self._columns, self._events)
+            self._new_chunk()
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            self.dropped_chunks += 1
+
+    def close(self):
+        self.flush()
+        self._queue.put(None)
+        self._thread.join()
+        self._write_index()
+        self._write(_FOOTER.pack(_FOOTER_MAGIC, self._last_index))
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+    # --- writer thread ---
+
+    def _write(self, data):
+        self._file.write(data)
+        self.bytes_written += len(data)
+
+    def _writer(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            self._write_chunk(*item)
+            if len(self._index) >= INDEX_EVERY:
+                self._write_index()
+            self._file.flush()
+
+    def _write_chunk(self, columns, events):
+        times = columns[0]
+        t_values = list(times) + [e[0] for e in events]
+        t_min, t_max = (min(t_values), max(t_values)) if t_values else (0.0, 0.0)
+        parts = []
+        for col in columns:
+            data = zlib.compress(col.tobytes(), self.compresslevel)
+            parts.append(struct.pack('<I', len(data)) + data)
+        ev = zlib.compress(json.dumps(events).encode(), self.compresslevel)
+        parts.append(struct.pack('<I', len(ev)) + ev)
+        payload = _CHUNK.pack(len(times), len(events), t_min, t_max) + b''.join(parts)
+        offset = self._file.tell()
+        self._write(_BLOCK.pack(b'CHNK', len(payload)) + payload)
+        self._index.append((t_min, t_max, offset))
+        self.chunks += 1
+
+    def _write_index(self):
+        if not self._index:
+            return
+        payload = _INDEX_HEAD.pack(self._last_index, len(self._index)) + b''.join(
+            _INDEX_ENTRY.pack(*entry) for entry in self._index)
+        offset = self._file.tell()
+        self._write(_BLOCK.pack(b'INDX', len(payload)) + payload)
+        self._last_index = offset
+        self._index = []
+
+
+class FlightLog:
+    """
+    Reader for FlightRecorder files. query(t0, t1) decompresses only the
+    chunks whose time range overlaps [t0, t1].
+    """
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+        head = self._file.read(len(_MAGIC) + 4)
+        if head[:len(_MAGIC)] != _MAGIC:
+            raise ValueError(f"not a flight log: {path}")
+        (schema_len,) = struct.unpack('<I', head[len(_MAGIC):])
+        self.schema = json.loads(self._file.read(schema_len))
+        self.columns = [tuple(c) for c in self.schema['columns']]
+        self._data_start = self._file.tell()
+        self.index = self._read_index_chain()
+        if self.index is None:
+            self.index = self._scan_index()
+        self.index.sort()
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+    def _read_index_chain(self):
+        f = self._file
+        f.seek(0, os.SEEK_END)
+        size = f.tell()
+        if size < self._data_start + _FOOTER.size:
+            return None
+        f.seek(size - _FOOTER.size)
+        magic, offset = _FOOTER.unpack(f.read(_FOOTER.size))
+        if magic != _FOOTER_MAGIC:
+            return None
+        index = []
+        while offset:
+            f.seek(offset)
+            kind, length = _BLOCK.unpack(f.read(_BLOCK.size))
+            if kind != b'INDX':
+                return None
+            payload = f.read(length)
+            offset, count = _INDEX_HEAD.unpack_from(payload, 0)
+            for i in range(count):
+                index.append(_INDEX_ENTRY.unpack_from(payload, _INDEX_HEAD.size + i * _INDEX_ENTRY.size))
+        return index
+
+    def _scan_index(self):
+        # unterminated file (writer was killed): walk the blocks
+        f = self._file
+        f.seek(self._data_start)
+        index = []
+        while True:
+            offset = f.tell()
+            head = f.read(_BLOCK.size)
+            if len(head) < _BLOCK.size:
+                break
+            kind, length = _BLOCK.unpack(head)
+            if kind == b'CHNK':
+                payload = f.read(_CHUNK.size)
+                if len(payload) < _CHUNK.size:
+                    break
+                _, _, t_min, t_max = _CHUNK.unpack(payload)
+                index.append((t_min, t_max, offset))
+                f.seek(length - _CHUNK.size, os.SEEK_CUR)
+            elif kind == b'INDX':
+                f.seek(length, os.SEEK_CUR)
+            else:
+                break
+        # drop a chunk cut off at the end of the file
+        f.seek(0, os.SEEK_END)
+        end = f.tell()
+        while index:
+            f.seek(index[-1][2])
+            _, length = _BLOCK.unpack(f.read(_BLOCK.size))
+            if index[-1][2] + _BLOCK.size + length <= end:
+                break
+            index.pop()
+        return index
+
+    def _read_chunk(self, offset):
+        f = self._file
+        f.seek(offset)
+        kind, length = _BLOCK.unpack(f.read(_BLOCK.size))
+        payload = f.read(length)
+        rows, n_events, _, _ = _CHUNK.unpack_from(payload, 0)
+        pos = _CHUNK.size
+        columns = {}
+        for name, code in self.columns:
+            (n,) = struct.unpack_from('<I', payload, pos)
+            pos += 4
+            col = array(code)
+            col.frombytes(zlib.decompress(payload[pos:pos + n]))
+            columns[name] = col
+            pos += n
+        (n,) = struct.unpack_from('<I', payload, pos)
+        events = json.loads(zlib.decompress(payload[pos + 4:pos + 4 + n]))
+        return columns, events
+
+    def time_range(self):
+        if not self.index:
+            return None
+        return min(e[0] for e in self.index), max(e[1] for e in self.index)
+
+    def query(self, t0=float('-inf'), t1=float('inf')):
+        """
+        Telemetry rows with t0 <= t <= t1 as {column: array}, in time order.
+        """
+        result = {name: array(code) for name, code in self.columns}
+        for t_min, t_max, offset in self.index:
+            if t_max < t0 or t_min > t1:
+                continue
+            columns, _ = self._read_chunk(offset)
+            times = columns['t']
+            if t0 <= t_min and t_max <= t1:
+                for name, col in columns.items():
+                    result[name].extend(col)
+                continue
+            keep = [i for i, t in enumerate(times) if t0 <= t <= t1]
+            for name, col in columns.items():
+                result[name].extend(col[i] for i in keep)
+        return result
+
+    def events(self, t0=float('-inf'), t1=float('inf')):
+        """
+        Events with t0 <= t <= t1 as (t, name, data), in time order.
+        """
+        found = []
+        for t_min, t_max, offset in self.index:
+            if t_max < t0 or t_min > t1:
+                continue
+            _, events = self._read_chunk(offset)
+            found.extend((t, name, data) for t, name, data in events if t0 <= t <= t1)
+        found.sort(key=lambda e: e[0])
+        return found
+
+
+def main():
+    if len(sys.argv) not in (2, 4):
+        print(f"Usage: {sys.argv[0]} <flight_log> [t0 t1]")
+        return 1
+    with FlightLog(sys.argv[1]) as log:
+        print(f"INFO: chunks={len(log.index)} range={log.time_range()}")
+        t0, t1 = (float(sys.argv[2]), float(sys.argv[3])) if len(sys.argv) == 4 else (float('-inf'), float('inf'))
+        rows = log.query(t0, t1)
+        print(f"INFO: rows={len(rows['t'])}")
+        for t, name, data in log.events(t0, t1):
+            print(f"  {t:.3f} {name} {data}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,138 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import math
+from functools import lru_cache
+import numpy
+
+# Quaternions are (w, x, y, z); Euler angles are (roll, pitch, yaw) in radians,
+# the same convention as hakosim_types.Quaternionr.quaternion_to_euler().
+
+
+# --- scalar fast paths ---
+
+@lru_cache(maxsize=256)
+def _euler(w, x, y, z):
+    roll = math.atan2(2.0 * (w * x + y * z), 1.0 - 2.0 * (x * x + y * y))
+    sinp = 2.0 * (w * y - z * x)
+    pitch = math.copysign(math.pi / 2, sinp) if abs(sinp) >= 1.0 else math.asin(sinp)
+    yaw = math.atan2(2.0 * (w * z + x * y), 1.0 - 2.0 * (y * y + z * z))
+    return roll, pitch, yaw
+
+
+@lru_cache(maxsize=256)
+def _yaw(w, x, y, z):
+    return math.atan2(2.0 * (w * z + x * y), 1.0 - 2.0 * (y * y + z * z))
+
+
+def quaternion_to_euler(q):
+    """
+    Returns (roll, pitch, yaw) [rad] of a Quaternionr. Results are cached,
+    so repeated calls on the same orientation within a step are free.
+    """
+    return _euler(q.w_val, q.x_val, q.y_val, q.z_val)
+
+
+def yaw_rad(q) -> float:
+    return _yaw(q.w_val, q.x_val, q.y_val, q.z_val)
+
+
+def yaw_deg(q) -> float:
+    return math.degrees(_yaw(q.w_val, q.x_val, q.y_val, q.z_val))
+
+
+def quaternion_to_matrix(q, dtype=numpy.float64) -> numpy.ndarray:
+    """
+    3x3 rotation matrix (body -> world) of a Quaternionr.
+    """
+    w, x, y, z = q.w_val, q.x_val, q.y_val, q.z_val
+    return numpy.array([
+        [1 - 2 * (y * y + z * z), 2 * (x * y - w * z),     2 * (x * z + w * y)],
+        [2 * (x * y + w * z),     1 - 2 * (x * x + z * z), 2 * (y * z - w * x)],
+        [2 * (x * z - w * y),     2 * (y * z + w * x),     1 - 2 * (x * x + y * y)],
+    ], dtype=dtype)
+
+
+# --- NumPy batch versions ---
+
+def poses_to_arrays(poses):
+    """
+    Converts a sequence of Pose into (positions (N, 3), quaternions (N, 4) as w, x, y, z).
+    """
+    n = len(poses)
+    positions = numpy.empty((n, 3))
+    quaternions = numpy.empty((n, 4))
+    for i, pose in enumerate(poses):
+        p = pose.position
+        q = pose.orientation
+        positions[i] = (p.x_val, p.y_val, p.z_val)
+        quaternions[i] = (q.w_val, q.x_val, q.y_val, q.z_val)
+    return positions, quaternions
+
+
+def quaternions_to_euler(quaternions: numpy.ndarray) -> numpy.ndarray:
+    """
+    (N, 4) quaternions (w, x, y, z) -> (N, 3) Euler angles (roll, pitch, yaw) [rad].
+    """
+    w, x, y, z = quaternions[:, 0], quaternions[:, 1], quaternions[:, 2], quaternions[:, 3]
+    out = numpy.empty((quaternions.shape[0], 3), dtype=numpy.result_type(quaternions, numpy.float32))
+    numpy.arctan2(2.0 * (w * x + y * z), 1.0 - 2.0 * (x * x + y * y), out=out[:, 0])
+    numpy.arcsin(numpy.clip(2.0 * (w * y - z * x), -1.0, 1.0), out=out[:, 1])
+    numpy.arctan2(2.0 * (w * z + x * y), 1.0 - 2.0 * (y * y + z * z), out=out[:, 2])
+    return out
+
+
+def quaternions_to_yaw(quaternions: numpy.ndarray) -> numpy.ndarray:
+    """
+    (N, 4) quaternions (w, x, y, z) -> (N,) yaw [rad].
+    """
+    w, x, y, z = quaternions[:, 0], quaternions[:, 1], quaternions[:, 2], quaternions[:, 3]
+    return numpy.arctan2(2.0 * (w * z + x * y), 1.0 - 2.0 * (y * y + z * z))
+
+
+def quaternions_to_matrices(quaternions: numpy.ndarray) -> numpy.ndarray:
+    """
+    (N, 4) quaternions (w, x, y, z) -> (N, 3, 3) rotation matrices (body -> world).
+    """
+    w, x, y, z = quaternions[:, 0], quaternions[:, 1], quaternions[:, 2], quaternions[:, 3]
+    m = numpy.empty((quaternions.shape[0], 3, 3), dtype=quaternions.dtype)
+    m[:, 0, 0] = 1 - 2 * (y * y + z * z)
+    m[:, 0, 1] = 2 * (x * y - w * z)
+    m[:, 0, 2] = 2 * (x * z + w * y)
+    m[:, 1, 0] = 2 * (x * y + w * z)
+    m[:, 1, 1] = 1 - 2 * (x * x + z * z)
+    m[:, 1, 2] = 2 * (y * z - w * x)
+    m[:, 2, 0] = 2 * (x * z - w * y)
+    m[:, 2, 1] = 2 * (y * z + w * x)
+    m[:, 2, 2] = 1 - 2 * (x * x + y * y)
+    return m
+
+
+def body_to_world(vectors: numpy.ndarray, quaternions: numpy.ndarray, positions: numpy.ndarray = None) -> numpy.ndarray:
+    """
+    Transforms one (N, 3) body-frame vector per pose into the world frame.
+    With positions, the vectors are treated as points and translated too.
+    """
+    out = numpy.einsum('nij,nj->ni', quaternions_to_matrices(quaternions), vectors)
+    if positions is not None:
+        out += positions
+    return out
+
+
+def world_to_body(vectors: numpy.ndarray, quaternions: numpy.ndarray, positions: numpy.ndarray = None) -> numpy.ndarray:
+    """
+    Inverse of body_to_world().
+    """
+    if positions is not None:
+        vectors = vectors - positions
+    return numpy.einsum('nji,nj->ni', quaternions_to_matrices(quaternions), vectors)
+
+
+def world_to_body_yaw(dx, dy, yaw):
+    """
+    Rotates world-frame horizontal offsets into the heading frame; works on
+    scalars and arrays alike.
+    """
+    c = numpy.cos(yaw)
+    s = numpy.sin(yaw)
+    return c * dx + s * dy, -s * dx + c * dy
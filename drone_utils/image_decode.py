@@ -0,0 +1,85 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import cv2
+
+# libjpeg scales during the inverse DCT for these flags, so a 1/8 decode
+# does roughly 1/8 of the work instead of decoding full size and resizing
+_FLAGS = {
+    (1, False): cv2.IMREAD_COLOR,
+    (2, False): cv2.IMREAD_REDUCED_COLOR_2,
+    (4, False): cv2.IMREAD_REDUCED_COLOR_4,
+    (8, False): cv2.IMREAD_REDUCED_COLOR_8,
+    (1, True): cv2.IMREAD_GRAYSCALE,
+    (2, True): cv2.IMREAD_REDUCED_GRAYSCALE_2,
+    (4, True): cv2.IMREAD_REDUCED_GRAYSCALE_4,
+    (8, True): cv2.IMREAD_REDUCED_GRAYSCALE_8,
+}
+
+
+def decode_flags(scale: int = 1, grayscale: bool = False) -> int:
+    flags = _FLAGS.get((scale, grayscale))
+    if flags is None:
+        raise ValueError(f"unsupported scale: {scale} (1, 2, 4 or 8)")
+    return flags
+
+
+def scaled_roi(roi, scale: int):
+    """
+    Converts a full-resolution ROI (x, y, w, h) into the reduced image.
+    """
+    x, y, w, h = roi
+    x0, y0 = x // scale, y // scale
+    x1, y1 = -(-(x + w) // scale), -(-(y + h) // scale)
+    return x0, y0, x1 - x0, y1 - y0
+
+
+def output_shape(width: int, height: int, scale: int = 1, grayscale: bool = False, roi=None):
+    """
+    Shape of the array decode_jpeg() returns for a width x height JPEG;
+    use it to allocate the `out` buffer once.
+    """
+    if roi is not None:
+        _, _, w, h = scaled_roi(roi, scale)
+    else:
+        w, h = -(-width // scale), -(-height // scale)
+    return (h, w) if grayscale else (h, w, 3)
+
+
+def copy_into(out: np.ndarray, img: np.ndarray) -> np.ndarray:
+    """
+    Copies img into the top-left of out (uint8, at least img's size, same
+    channels) and returns that view of out.
+    """
+    h, w = img.shape[0], img.shape[1]
+    if out.shape[0] < h or out.shape[1] < w or out.shape[2:] != img.shape[2:]:
+        raise ValueError(f"output buffer {out.shape} cannot hold {img.shape}")
+    result = out[:h, :w]
+    np.copyto(result, img)
+    return result
+
+
+def decode_jpeg(data, scale: int = 1, grayscale: bool = False, roi=None, out: np.ndarray = None):
+    """
+    Decodes JPEG bytes at 1/scale resolution (DCT scaling), optionally in
+    grayscale and cropped to roi = (x, y, w, h) given in full-resolution
+    pixels. The whole reduced image is decoded and the ROI is returned as a
+    view of it (libjpeg cannot skip blocks outside the ROI here).
+
+    With `out` (see output_shape()), the result is copied into it and a
+    view of out is returned, so a consumer keeps one buffer across frames.
+    cv2.imdecode has no destination argument in the Python binding, so the
+    decode itself still goes through a temporary image.
+    Returns None if the data cannot be decoded.
+    """
+    buf = np.frombuffer(data, dtype=np.uint8)
+    img = cv2.imdecode(buf, decode_flags(scale, grayscale))
+    if img is None or img.size == 0:
+        return None
+    if roi is not None:
+        x, y, w, h = scaled_roi(roi, scale)
+        img = img[max(0, y):y + h, max(0, x):x + w]
+    if out is not None:
+        return copy_into(out, img)
+    return img
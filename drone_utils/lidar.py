@@ -0,0 +1,138 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import math
+from collections import namedtuple
+import numpy
+
+POINT_DTYPE = numpy.dtype('<f4')
+
+LidarScan = namedtuple('LidarScan', ['points', 'time_stamp', 'pose'])
+
+
+def points_from_buffer(buffer, point_step: int = 12, offset: int = 0, count: int = None) -> numpy.ndarray:
+    """
+    Returns an (N, 3) float32 view of the XYZ points stored in a raw buffer.
+    No data is copied: the result shares memory with `buffer`.
+    point_step is the byte size of one point record (12 for packed XYZ),
+    offset the byte offset of X inside a record.
+    """
+    raw = numpy.frombuffer(buffer, dtype=numpy.uint8)
+    if count is None:
+        count = (raw.shape[0] - offset) // point_step if point_step > 0 else 0
+    if count <= 0:
+        return numpy.empty((0, 3), dtype=POINT_DTYPE)
+    if point_step == 12 and offset == 0:
+        return numpy.frombuffer(buffer, dtype=POINT_DTYPE, count=count * 3).reshape(count, 3)
+    # padded records (e.g. XYZ + intensity): strided view over the same memory
+    return numpy.ndarray(shape=(count, 3), dtype=POINT_DTYPE, buffer=raw,
+                         offset=offset, strides=(point_step, POINT_DTYPE.itemsize))
+
+
+def _copy_out(points: numpy.ndarray, out: numpy.ndarray) -> numpy.ndarray:
+    if out.shape[0] < points.shape[0]:
+        raise ValueError(f"output buffer too small: {out.shape[0]} < {points.shape[0]} points")
+    result = out[:points.shape[0]]
+    numpy.copyto(result, points)
+    return result
+
+
+def parse_lidarData(data, out: numpy.ndarray = None) -> numpy.ndarray:
+    """
+    Converts LidarData.point_cloud into an (N, 3) float32 array.
+    Buffer-like point clouds (bytes, memoryview, ndarray) are viewed in place;
+    a Python float list is written straight into the array without an
+    intermediate copy. If `out` (an (M, 3) float32 array) is given, the
+    points are written into it and out[:N] is returned.
+    """
+    cloud = data.point_cloud
+    if isinstance(cloud, numpy.ndarray):
+        points = cloud.reshape(-1, 3) if cloud.dtype == POINT_DTYPE else cloud.astype(POINT_DTYPE).reshape(-1, 3)
+    elif isinstance(cloud, (bytes, bytearray, memoryview)):
+        points = points_from_buffer(cloud)
+    else:
+        count = len(cloud) // 3
+        if out is not None:
+            if out.shape[0] < count:
+                raise ValueError(f"output buffer too small: {out.shape[0]} < {count} points")
+            result = out[:count]
+            result.reshape(-1)[:] = cloud[:count * 3]
+            return result
+        return numpy.fromiter(cloud, dtype=POINT_DTYPE, count=count * 3).reshape(count, 3)
+
+    if out is not None:
+        return _copy_out(points, out)
+    return points
+
+
+def _xyz_layout(pdu_data):
+    """
+    Returns (point_step, x_offset) from a PointCloud2 PDU.
+    Falls back to packed XYZ when the field table is missing.
+    """
+    point_step = int(pdu_data.get('point_step', 12) or 12)
+    offset = 0
+    for field in pdu_data.get('fields', []) or []:
+        if field.get('name') == 'x':
+            offset = int(field.get('offset', 0))
+            break
+    return point_step, offset
+
+
+def _euler_to_quaternion(hakosim_types, roll, pitch, yaw):
+    cr, sr = math.cos(roll * 0.5), math.sin(roll * 0.5)
+    cp, sp = math.cos(pitch * 0.5), math.sin(pitch * 0.5)
+    cy, sy = math.cos(yaw * 0.5), math.sin(yaw * 0.5)
+    return hakosim_types.Quaternionr(
+        x_val=sr * cp * cy - cr * sp * sy,
+        y_val=cr * sp * cy + sr * cp * sy,
+        z_val=cr * cp * sy - sr * sp * cy,
+        w_val=cr * cp * cy + sr * sp * sy)
+
+
+def getLidarScan(client, vehicle_name=None, out: numpy.ndarray = None) -> LidarScan:
+    """
+    Reads the LiDAR PDU and returns a LidarScan with an (N, 3) float32
+    array of its points (or out[:N] if an output buffer is given). Unlike
+    client.getLidarData(), the point cloud is never turned into a Python
+    float list.
+
+    The points are a view of the PDU's point bytes only when the decoder
+    hands them over as a buffer (the 'data__raw' bytes that hakoniwa_pdu's
+    converter produces, see rc-custom-pdu.py). The hako_pdu decoder behind
+    client.pdu_manager returns 'data' as a list of ints, which is copied
+    once into a bytes object here. It does not expose the raw PDU memory.
+    Returns None if the PDU cannot be read.
+    """
+    # imported here so that parse_lidarData() also works with other hakosim packages
+    import libs.hakosim_types as hakosim_types
+    import libs.pdu_info as pdu_info
+
+    name = client.get_vehicle_name(vehicle_name if vehicle_name is not None else client.default_drone_name)
+    pdu_data = client.pdu_manager.get_pdu(name, pdu_info.HAKO_AVATAR_CHANNEL_ID_LIDAR_DATA).read()
+    if pdu_data is None:
+        print('ERROR: hako_asset_pdu_read')
+        return None
+
+    raw = pdu_data.get('data__raw', pdu_data.get('data'))
+    if not isinstance(raw, (bytes, bytearray, memoryview)):
+        # list of ints from the decoder: one copy into contiguous bytes
+        raw = bytes(raw)
+    point_step, offset = _xyz_layout(pdu_data)
+    count = int(pdu_data.get('width', 0)) * int(pdu_data.get('height', 1) or 1)
+    points = points_from_buffer(raw, point_step, offset, count if count > 0 else None)
+    if out is not None:
+        points = _copy_out(points, out)
+
+    stamp = pdu_data['header']['stamp']
+    time_stamp = int(stamp['sec']) * 1_000_000 + int(stamp['nanosec']) // 1000
+
+    pose = None
+    pos_data = client.pdu_manager.get_pdu(name, pdu_info.HAKO_AVATAR_CHANNEL_ID_LIDAR_POS).read()
+    if pos_data is not None:
+        linear = pos_data['linear']
+        angular = pos_data['angular']
+        pose = hakosim_types.Pose(
+            hakosim_types.Vector3r(linear['x'], linear['y'], linear['z']),
+            _euler_to_quaternion(hakosim_types, angular['x'], angular['y'], angular['z']))
+    return LidarScan(points, time_stamp, pose)
@@ -0,0 +1,219 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import math
+import time
+from collections import namedtuple
+import numpy
+from drone_utils.lidar import getLidarScan, POINT_DTYPE
+from drone_utils.geometry import quaternion_to_matrix
+
+# nearest obstacle per sector: distances[i] covers body-frame azimuth
+# [-pi + i * 2pi/n, -pi + (i+1) * 2pi/n), numpy.inf if the sector is empty
+LidarResult = namedtuple('LidarResult', ['time_stamp', 'points', 'world_points', 'sector_distances', 'nearest'])
+
+
+class LidarPipeline:
+    """
+    Streaming LiDAR processing on preallocated arrays:
+    range/ROI crop -> voxel downsample -> world transform -> per-sector nearest obstacle.
+
+    All intermediate buffers are owned by the pipeline and reused from scan
+    to scan, so the arrays in a LidarResult are only valid until the next
+    call to process().
+    """
+    def __init__(self, min_range=0.05, max_range=10.0, roi_min=None, roi_max=None,
+                 voxel_size=0.0, num_sectors=36, max_points=65536):
+        self.min_range = min_range
+        self.max_range = max_range
+        self.roi_min = None if roi_min is None else numpy.asarray(roi_min, dtype=POINT_DTYPE)
+        self.roi_max = None if roi_max is None else numpy.asarray(roi_max, dtype=POINT_DTYPE)
+        self.voxel_size = voxel_size
+        self.num_sectors = num_sectors
+        self.sector_distances = numpy.empty(num_sectors, dtype=POINT_DTYPE)
+        self._allocate(max_points)
+
+    def _allocate(self, max_points):
+        self.max_points = max_points
+        self._voxel = numpy.empty((max_points, 3), dtype=POINT_DTYPE)
+        self._cropped = numpy.empty((max_points, 3), dtype=POINT_DTYPE)
+        self._world = numpy.empty((max_points, 3), dtype=POINT_DTYPE)
+        self._r2 = numpy.empty(max_points, dtype=POINT_DTYPE)
+        self._dist = numpy.empty(max_points, dtype=POINT_DTYPE)
+        self._angle = numpy.empty(max_points, dtype=POINT_DTYPE)
+        self._sector = numpy.empty(max_points, dtype=numpy.intp)
+        self._mask = numpy.empty(max_points, dtype=bool)
+        self._tmp_mask = numpy.empty(max_points, dtype=bool)
+        # voxel downsampling
+        self._cell = numpy.empty((max_points, 3), dtype=POINT_DTYPE)
+        self._cell_index = numpy.empty((max_points, 3), dtype=numpy.int64)
+        self._keys = numpy.empty(max_points, dtype=numpy.int64)
+        self._voxel_keys = numpy.empty(max_points, dtype=numpy.int64)
+        self._order = numpy.empty(max_points, dtype=numpy.int64)
+        self._arange = numpy.arange(max_points, dtype=numpy.int64)
+
+    def _ensure_capacity(self, n):
+        if n > self.max_points:
+            self._allocate(max(n, self.max_points * 2))
+
+    def crop(self, points: numpy.ndarray) -> numpy.ndarray:
+        """
+        Keeps points with min_range < |p| <= max_range that lie inside the ROI box.
+        """
+        n = points.shape[0]
+        self._ensure_capacity(n)
+        r2 = self._r2[:n]
+        mask = self._mask[:n]
+        tmp = self._tmp_mask[:n]
+        numpy.einsum('ij,ij->i', points, points, out=r2)
+        numpy.greater(r2, self.min_range * self.min_range, out=mask)
+        numpy.less_equal(r2, self.max_range * self.max_range, out=tmp)
+        mask &= tmp
+        if self.roi_min is not None:
+            numpy.all(points >= self.roi_min, axis=1, out=tmp)
+            mask &= tmp
+        if self.roi_max is not None:
+            numpy.all(points <= self.roi_max, axis=1, out=tmp)
+            mask &= tmp
+        k = int(numpy.count_nonzero(mask))
+        out = self._cropped[:k]
+        # note: compress still builds a temporary index array (k int64) internally
+        numpy.compress(mask, points, axis=0, out=out)
+        return out
+
+    def _key_bits(self, n):
+        """
+        (bits per axis, bits of the point index) for packing the voxel cell and
+        the point index into one int64 sort key, or None if they do not fit.
+        """
+        if not math.isfinite(self.max_range):
+            return None
+        half = int(math.ceil(self.max_range / self.voxel_size)) + 1
+        axis_bits = (2 * half + 1).bit_length()
+        index_bits = max(1, (n - 1).bit_length())
+        if 3 * axis_bits + index_bits > 63:
+            return None
+        return axis_bits, index_bits, half
+
+    def downsample(self, points: numpy.ndarray) -> numpy.ndarray:
+        """
+        Voxel-grid downsampling: one point (the first) per occupied voxel.
+
+        Cell and point index are packed into one int64 key per point and
+        sorted in place, all in preallocated buffers. If max_range is
+        infinite, voxel_size is too small for the cell to fit in the key, or
+        points lie beyond max_range, this falls back to numpy.unique, which
+        allocates per scan.
+        """
+        n = points.shape[0]
+        if self.voxel_size <= 0 or n == 0:
+            return points
+        bits = self._key_bits(n)
+        if bits is None:
+            return self._downsample_unique(points)
+        axis_bits, index_bits, half = bits
+        cell = self._cell[:n]
+        cell_index = self._cell_index[:n]
+        keys = self._keys[:n]
+        voxel_keys = self._voxel_keys[:n]
+        order = self._order[:n]
+        first = self._mask[:n]
+        numpy.divide(points, self.voxel_size, out=cell)
+        numpy.floor(cell, out=cell)
+        numpy.copyto(cell_index, cell, casting='unsafe')
+        cell_index += half
+        if cell_index.min() < 0 or cell_index.max() >= (1 << axis_bits):
+            # points beyond max_range (downsample() called without crop())
+            return self._downsample_unique(points)
+        keys[:] = cell_index[:, 0]
+        for axis in (1, 2):
+            keys <<= axis_bits
+            keys |= cell_index[:, axis]
+        keys <<= index_bits
+        keys |= self._arange[:n]
+        # sorted by (cell, index): the first key of each cell is its first point
+        keys.sort()
+        numpy.right_shift(keys, index_bits, out=voxel_keys)
+        first[0] = True
+        numpy.not_equal(voxel_keys[1:], voxel_keys[:-1], out=first[1:])
+        numpy.bitwise_and(keys, (1 << index_bits) - 1, out=order)
+        k = int(numpy.count_nonzero(first))
+        # numpy.compress allocates an index array even with out=; instead push the
+        # indices of repeated cells past the end and sort, keeping the first k
+        rest = self._tmp_mask[:n]
+        numpy.logical_not(first, out=rest)
+        numpy.putmask(order, rest, n)
+        order.sort()
+        selected = order[:k]
+        out = self._voxel[:k]
+        # mode='raise' (the default) buffers `out`; the indices are in range anyway
+        numpy.take(points, selected, axis=0, out=out, mode='clip')
+        return out
+
+    def _downsample_unique(self, points):
+        keys = numpy.floor(points / self.voxel_size).astype(numpy.int64)
+        _, index = numpy.unique(keys, axis=0, return_index=True)
+        index.sort()
+        k = index.shape[0]
+        out = self._voxel[:k]
+        numpy.take(points, index, axis=0, out=out)
+        return out
+
+    def to_world(self, points: numpy.ndarray, pose) -> numpy.ndarray:
+        """
+        Transforms sensor-frame points into the world frame using the LiDAR pose.
+        """
+        n = points.shape[0]
+        out = self._world[:n]
+        if pose is None:
+            out[:] = points
+            return out
+        rot = quaternion_to_matrix(pose.orientation, dtype=POINT_DTYPE)
+        numpy.matmul(points, rot.T, out=out)
+        out += numpy.array([pose.position.x_val, pose.position.y_val, pose.position.z_val], dtype=POINT_DTYPE)
+        return out
+
+    def sector_min_distance(self, points: numpy.ndarray) -> numpy.ndarray:
+        """
+        Nearest obstacle distance per azimuth sector in the sensor frame.
+        """
+        n = points.shape[0]
+        dist = self._dist[:n]
+        angle = self._angle[:n]
+        sector = self._sector[:n]
+        numpy.einsum('ij,ij->i', points, points, out=dist)
+        numpy.sqrt(dist, out=dist)
+        numpy.arctan2(points[:, 1], points[:, 0], out=angle)
+        angle += math.pi
+        angle *= self.num_sectors / (2 * math.pi)
+        numpy.floor(angle, out=angle)
+        sector[:] = angle
+        numpy.clip(sector, 0, self.num_sectors - 1, out=sector)
+        self.sector_distances.fill(numpy.inf)
+        numpy.minimum.at(self.sector_distances, sector, dist)
+        return self.sector_distances
+
+    def process(self, scan) -> LidarResult:
+        points = self.crop(scan.points)
+        points = self.downsample(points)
+        world_points = self.to_world(points, scan.pose)
+        sectors = self.sector_min_distance(points)
+        nearest = float(sectors.min()) if points.shape[0] > 0 else math.inf
+        return LidarResult(scan.time_stamp, points, world_points, sectors, nearest)
+
+    def stream(self, client, vehicle_name=None, period_sec=0.0):
+        """
+        Generator yielding a LidarResult for each successive scan.
+        Scans with an unchanged time stamp are skipped.
+        """
+        last_stamp = None
+        while True:
+            t0 = time.perf_counter()
+            scan = getLidarScan(client, vehicle_name)
+            if scan is not None and scan.time_stamp != last_stamp:
+                last_stamp = scan.time_stamp
+                yield self.process(scan)
+            if period_sec > 0:
+                delay = period_sec - (time.perf_counter() - t0)
+                if delay > 0:
+                    time.sleep(delay)
@@ -0,0 +1,257 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import bisect
+import math
+import threading
+
+# Prometheus text exposition (format 0.0.4) of counters, gauges and
+# histograms. Hot paths never take a lock: every thread updates its own
+# shard and render() sums the shards, so a slightly stale scrape is the only
+# cost of concurrency.
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.02, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class _Sharded:
+    """
+    Per-thread list of `size` numbers; values() sums all threads.
+    """
+    def __init__(self, size):
+        self._size = size
+        self._local = threading.local()
+        self._shards = []
+        self._lock = threading.Lock()
+
+    def shard(self):
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = [0] * self._size
+            with self._lock:
+                self._shards.append(shard)
+            self._local.shard = shard
+        return shard
+
+    def values(self):
+        with self._lock:
+            shards = list(self._shards)
+        total = [0] * self._size
+        for shard in shards:
+            for i, v in enumerate(shard):
+                total[i] += v
+        return total
+
+
+class Counter:
+    """
+    Monotonic count, or the result of fn() at scrape time for totals kept
+    elsewhere (fn must never decrease).
+    """
+    def __init__(self, fn=None):
+        self._data = _Sharded(1)
+        self._fn = fn
+
+    def inc(self, amount=1):
+        self._data.shard()[0] += amount
+
+    def value(self):
+        if self._fn is not None:
+            try:
+                return self._fn()
+            except Exception:
+                return math.nan
+        return self._data.values()[0]
+
+    def samples(self, name, labels):
+        yield name, labels, self.value()
+
+
+class Gauge:
+    """
+    Last value set, or the result of fn() at scrape time.
+    """
+    def __init__(self, fn=None):
+        self._value = 0.0
+        self._fn = fn
+
+    def set(self, value):
+        self._value = value
+
+    def value(self):
+        if self._fn is not None:
+            try:
+                return self._fn()
+            except Exception:
+                return math.nan
+        return self._value
+
+    def samples(self, name, labels):
+        yield name, labels, self.value()
+
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        # one slot per bucket, +Inf, then the sum
+        self._data = _Sharded(len(self.buckets) + 2)
+
+    def observe(self, value):
+        shard = self._data.shard()
+        shard[bisect.bisect_left(self.buckets, value)] += 1
+        shard[-1] += value
+
+    def samples(self, name, labels):
+        values = self._data.values()
+        cumulative = 0
+        for bound, count in zip(self.buckets + (math.inf,), values):
+            cumulative += count
+            yield name + '_bucket', labels + (('le', _format_value(bound)),), cumulative
+        yield name + '_count', labels, cumulative
+        yield name + '_sum', labels, values[-1]
+
+
+class Family:
+    """
+    A named metric. Without label names it forwards inc()/set()/observe()
+    to its single child; otherwise children are created by labels().
+    Counters are exposed as <name>_total, HELP and TYPE lines included,
+    so the samples keep their counter type.
+    """
+    def __init__(self, name, kind, help_text, labelnames, factory):
+        self.name = name
+        self.kind = kind
+        self.exposed_name = name + '_total' if kind == 'counter' and not name.endswith('_total') else name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._factory = factory
+        self._children = {}
+        self._lock = threading.Lock()
+        if not self.labelnames:
+            self._default = self._children[()] = factory()
+
+    def labels(self, **labels):
+        key = tuple(str(labels[n]) for n in self.labelnames)
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(key, self._factory())
+        return child
+
+    def remove(self, **labels):
+        key = tuple(str(labels[n]) for n in self.labelnames)
+        with self._lock:
+            self._children.pop(key, None)
+
+    def __getattr__(self, attr):
+        # inc / set / observe / value of an unlabelled metric
+        if attr.startswith('_') or self.labelnames:
+            raise AttributeError(attr)
+        return getattr(self._default, attr)
+
+    def render(self, lines):
+        lines.append(f"# HELP {self.exposed_name} {self.help}")
+        lines.append(f"# TYPE {self.exposed_name} {self.kind}")
+        with self._lock:
+            children = list(self._children.items())
+        for key, child in children:
+            labels = tuple(zip(self.labelnames, key))
+            for name, sample_labels, value in child.samples(self.exposed_name, labels):
+                lines.append(f"{name}{_format_labels(sample_labels)} {_format_value(value)}")
+
+
+class Registry:
+    def __init__(self):
+        self._families = {}
+        self._lock = threading.Lock()
+
+    def _register(self, name, kind, help_text, labelnames, factory):
+        with self._lock:
+            family = self._families.get(name)
+            if family is None:
+                family = self._families[name] = Family(name, kind, help_text, labelnames, factory)
+            elif family.kind != kind:
+                raise ValueError(f"metric {name} already registered as {family.kind}")
+            return family
+
+    def counter(self, name, help_text, labelnames=(), fn=None) -> Family:
+        return self._register(name, 'counter', help_text, labelnames, lambda: Counter(fn))
+
+    def gauge(self, name, help_text, fn=None) -> Family:
+        return self._register(name, 'gauge', help_text, (), lambda: Gauge(fn))
+
+    def histogram(self, name, help_text, buckets=LATENCY_BUCKETS, labelnames=()) -> Family:
+        return self._register(name, 'histogram', help_text, labelnames, lambda: Histogram(buckets))
+
+    def render(self) -> str:
+        lines = []
+        with self._lock:
+            families = list(self._families.values())
+        for family in families:
+            family.render(lines)
+        return "\n".join(lines) + "\n"
+
+
+def _format_value(value):
+    if isinstance(value, float):
+        if math.isnan(value):
+            return "NaN"
+        if math.isinf(value):
+            return "+Inf" if value > 0 else "-Inf"
+        if value.is_integer():
+            return str(int(value))
+        return repr(value)
+    return str(value)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    body = ",".join('{}="{}"'.format(k, str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+                    for k, v in labels)
+    return "{" + body + "}"
+
+
+REGISTRY = Registry()
+
+
+def instrument_pdu_manager(pdu_manager, registry=REGISTRY):
+    """
+    Counts read()/write() calls and bytes of every PDU obtained through
+    pdu_manager.get_pdu(). Bytes are taken from the PDU's configured size
+    (pdu_size) when the PDU object exposes it. Safe to call more than once.
+    """
+    if pdu_manager is None or getattr(pdu_manager, '_metrics_instrumented', False):
+        return pdu_manager
+    get_pdu = getattr(pdu_manager, 'get_pdu', None)
+    if get_pdu is None:
+        return pdu_manager
+    ops = registry.counter('hako_pdu_ops', "PDU read/write calls", ('op', 'channel'))
+    nbytes = registry.counter('hako_pdu_bytes', "PDU bytes read/written", ('op', 'channel'))
+
+    def counted(method, op, channel, size):
+        calls = ops.labels(op=op, channel=channel)
+        moved = nbytes.labels(op=op, channel=channel)
+        def wrapper(*args, **kwargs):
+            calls.inc()
+            moved.inc(size)
+            return method(*args, **kwargs)
+        return wrapper
+
+    def instrumented_get_pdu(robot_name, channel_id):
+        pdu = get_pdu(robot_name, channel_id)
+        if pdu is None or getattr(pdu, '_metrics_instrumented', False):
+            return pdu
+        size = getattr(pdu, 'pdu_size', 0) or 0
+        try:
+            for op in ('read', 'write'):
+                if hasattr(pdu, op):
+                    setattr(pdu, op, counted(getattr(pdu, op), op, channel_id, size))
+            pdu._metrics_instrumented = True
+        except AttributeError:
+            pass
+        return pdu
+
+    pdu_manager.get_pdu = instrumented_get_pdu
+    pdu_manager._metrics_instrumented = True
+    return pdu_manager
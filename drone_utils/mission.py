@@ -0,0 +1,221 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import math
+import time
+from collections import namedtuple
+from drone_utils.geometry import yaw_deg
+
+Waypoint = namedtuple('Waypoint', ['x', 'y', 'z', 'speed', 'yaw_deg', 'blend', 'check'])
+Action = namedtuple('Action', ['name', 'value'])
+LegReport = namedtuple('LegReport', ['index', 'step', 'start', 'end', 'blended'])
+
+ACTIONS = ('grab_baggage',)
+
+
+class MissionError(Exception):
+    pass
+
+
+class Mission:
+    """
+    A waypoint/action sequence executed as one unit.
+
+    Waypoints followed by another waypoint are blended: the next move command
+    is sent as soon as the vehicle is within `blend` meters of the current
+    one, instead of waiting for it to stop. The last waypoint, waypoints with
+    an explicit yaw_deg and waypoints followed by an action are flown with
+    the blocking moveToPosition(), so turns complete and actions always
+    happen at rest.
+
+    Blending rewrites CMD_MOVE while the previous move is still running.
+    Every command written through get_packet() is a new request with
+    header.result = 0, and the simulator sets result = 1 when the vehicle
+    reaches the target. This class assumes the simulator re-reads CMD_MOVE
+    while a move runs, so a rewrite replaces the running target. That is
+    checked, not trusted: result = 1 reported away from the current target
+    is the completion of the replaced command (or a rewrite the simulator
+    ignored), so the flag is cleared and the current command is sent again.
+    The flag is always cleared with the same handshake as eval-ctrl's
+    reply_and_wait_res (reset to 0 and write back), so the next command
+    never starts with a stale result.
+    """
+    POLL_INTERVAL_SEC = 0.02
+    DEFAULT_BLEND = 0.5
+    LEG_TIMEOUT_SEC = 60.0
+    ARRIVAL_TOLERANCE = 0.5
+    MAX_RESENDS = 3
+
+    def __init__(self, client, vehicle_name=None, occupancy_map=None, check_radius=0.3):
+        self.client = client
+        self.vehicle_name = vehicle_name if vehicle_name is not None else client.default_drone_name
+        self.occupancy_map = occupancy_map
+        self.check_radius = check_radius
+        self.steps = []
+        self.reports = []
+        # CMD_MOVE of the last blended leg, still running in the simulator
+        self._running = None
+
+    def move(self, x, y, z, speed, yaw_deg=None, blend=None, check=True):
+        self.steps.append(Waypoint(x, y, z, speed, yaw_deg, self.DEFAULT_BLEND if blend is None else blend, check))
+        return self
+
+    def grab_baggage(self, grab):
+        self.steps.append(Action('grab_baggage', grab))
+        return self
+
+    def validate(self, start=None):
+        """
+        Checks every step before anything is sent to the vehicle.
+        With an occupancy map, the straight path between consecutive
+        waypoints (starting from `start`) is checked for collisions.
+        Raises MissionError on the first problem.
+        """
+        prev = start
+        for i, step in enumerate(self.steps):
+            if isinstance(step, Action):
+                if step.name not in ACTIONS:
+                    raise MissionError(f"step {i}: unknown action '{step.name}'")
+                if not isinstance(step.value, bool):
+                    raise MissionError(f"step {i}: {step.name} expects a bool")
+                continue
+            values = (step.x, step.y, step.z, step.speed)
+            if not all(isinstance(v, (int, float)) and math.isfinite(v) for v in values):
+                raise MissionError(f"step {i}: invalid waypoint {values}")
+            if step.speed < 0:
+                raise MissionError(f"step {i}: negative speed {step.speed}")
+            if step.blend < 0:
+                raise MissionError(f"step {i}: negative blend radius {step.blend}")
+            cur = (step.x, step.y, step.z)
+            if self.occupancy_map is not None and prev is not None and step.check:
+                hit = self.occupancy_map.segment_collides(prev, cur, self.check_radius)
+                if hit is not None:
+                    raise MissionError(f"step {i}: path to {cur} blocked near {hit}")
+            prev = cur
+
+    def _vehicle_kwargs(self):
+        # the client API falls back to default_drone_name when vehicle_name is omitted
+        if self.vehicle_name == self.client.default_drone_name:
+            return {}
+        return {'vehicle_name': self.vehicle_name}
+
+    def _position(self):
+        pose = self.client.simGetVehiclePose(**self._vehicle_kwargs())
+        return (pose.position.x_val, pose.position.y_val, pose.position.z_val)
+
+    def _distance(self, wp: Waypoint):
+        x, y, z = self._position()
+        return math.sqrt((x - wp.x) ** 2 + (y - wp.y) ** 2 + (z - wp.z) ** 2)
+
+    @staticmethod
+    def _take_result(command):
+        """
+        Consumes a completion: if result is 1, resets it to 0 and writes
+        the PDU back. Returns True if a completion was consumed.
+        """
+        pdu = command.read()
+        if pdu is None or pdu['header']['result'] != 1:
+            return False
+        pdu['header']['result'] = 0
+        command.write()
+        return True
+
+    def _send_move(self, wp: Waypoint):
+        # non-blocking move: write the command PDU and return immediately
+        import libs.pdu_info as pdu_info
+        command, pdu_cmd = self.client.get_packet(pdu_info.HAKO_AVATAR_CHANNEL_ID_CMD_MOVE,
+                                                  self.client.get_vehicle_name(self.vehicle_name))
+        pdu_cmd['x'] = wp.x
+        pdu_cmd['y'] = wp.y
+        pdu_cmd['z'] = wp.z
+        pdu_cmd['speed'] = wp.speed
+        if wp.yaw_deg is not None:
+            pdu_cmd['yaw_deg'] = wp.yaw_deg
+        else:
+            pdu_cmd['yaw_deg'] = yaw_deg(self.client.simGetVehiclePose(**self._vehicle_kwargs()).orientation)
+        if not command.write():
+            raise MissionError(f"failed to send move command to ({wp.x}, {wp.y}, {wp.z})")
+        return command
+
+    def _retarget(self, wp: Waypoint):
+        # clear a completion of the running command before replacing it
+        if self._running is not None:
+            self._take_result(self._running)
+        self._running = self._send_move(wp)
+        return self._running
+
+    def _fly(self, wp: Waypoint, radius, wait_result):
+        """
+        Sends wp and polls until the vehicle is within `radius` of it (and,
+        with wait_result, the simulator has reported completion).
+        """
+        command = self._retarget(wp)
+        resends = 0
+        deadline = time.perf_counter() + self.LEG_TIMEOUT_SEC
+        while time.perf_counter() < deadline:
+            distance = self._distance(wp)
+            if self._take_result(command):
+                if distance <= max(radius, self.ARRIVAL_TOLERANCE):
+                    self._running = None
+                    return True
+                # completion of the replaced command, or the rewrite was ignored
+                resends += 1
+                if resends > self.MAX_RESENDS:
+                    raise MissionError(f"simulator did not accept move to ({wp.x}, {wp.y}, {wp.z})")
+                print(f"WARNING: stale move result {distance:.2f} m from target, resending")
+                command = self._retarget(wp)
+            elif not wait_result and distance <= radius:
+                return True
+            time.sleep(self.POLL_INTERVAL_SEC)
+        return False
+
+    def _fly_blended(self, wp: Waypoint):
+        return self._fly(wp, wp.blend, wait_result=False)
+
+    def _fly_blocking(self, wp: Waypoint):
+        if self._running is not None:
+            # a blended move is still running: replace it and do the result handshake here,
+            # so its late completion cannot end this leg early
+            if not self._fly(wp, self.ARRIVAL_TOLERANCE, wait_result=True):
+                print(f"WARNING: move to ({wp.x}, {wp.y}, {wp.z}) timed out")
+                self._running = None
+                return False
+            return True
+        if wp.yaw_deg is None:
+            return self.client.moveToPosition(wp.x, wp.y, wp.z, wp.speed, **self._vehicle_kwargs())
+        return self.client.moveToPosition(wp.x, wp.y, wp.z, wp.speed, wp.yaw_deg, **self._vehicle_kwargs())
+
+    def run(self):
+        """
+        Validates and executes the mission. Returns the list of LegReport.
+        """
+        self.validate(self._position())
+        self.reports = []
+        self._running = None
+        for i, step in enumerate(self.steps):
+            start = time.perf_counter()
+            blended = False
+            if isinstance(step, Action):
+                self.client.grab_baggage(step.value, **self._vehicle_kwargs())
+            else:
+                following = self.steps[i + 1] if i + 1 < len(self.steps) else None
+                blended = isinstance(following, Waypoint) and step.blend > 0 and step.yaw_deg is None
+                if blended:
+                    if not self._fly_blended(step):
+                        print(f"WARNING: leg {i} timed out before reaching blend radius")
+                else:
+                    self._fly_blocking(step)
+            self.reports.append(LegReport(i, step, start, time.perf_counter(), blended))
+        return self.reports
+
+    def report(self):
+        total = 0.0
+        for r in self.reports:
+            duration = r.end - r.start
+            total += duration
+            if isinstance(r.step, Action):
+                desc = f"{r.step.name}({r.step.value})"
+            else:
+                desc = f"move({r.step.x}, {r.step.y}, {r.step.z}){' blended' if r.blended else ''}"
+            print(f"INFO: leg {r.index}: {desc} {duration:.2f} sec")
+        print(f"INFO: mission total {total:.2f} sec, {len(self.reports)} legs")
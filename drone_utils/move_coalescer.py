@@ -0,0 +1,138 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import asyncio
+
+
+class _Slot:
+    def __init__(self):
+        self.handle = None
+        self.waiter = None
+        self.pending = None
+        self.drainer = None
+        self.last_dispatch = None
+        self.requests = 0
+        self.dispatched = 0
+        self.retargeted = 0
+        self.merged = 0
+        self.cancelled = 0
+
+    def busy(self):
+        return self.waiter is not None and not self.waiter.done()
+
+
+class MoveCoalescer:
+    """
+    Latest-wins gate for motion commands, one slot per vehicle.
+
+    start(target) must begin a motion and return an awaitable with cancel()
+    (AsyncMultirotorClient.moveToPosition returns such a MotionHandle). At
+    most one motion per vehicle is in flight. A request that arrives while
+    one is running
+      - retargets it right away when `retarget` is set and the last command
+        was sent at least min_interval_sec ago, or
+      - becomes the pending target, replacing (merging) any earlier pending
+        one; it is sent when the running motion ends, or with `retarget`
+        once min_interval_sec has passed.
+    With cancellable=False (e.g. a blocking call run in a thread) cancel()
+    only drops the pending target and the running motion stays in flight
+    until it ends, so a new one is never started next to it.
+    Must be used from the event loop thread.
+    """
+    def __init__(self, start, retarget=True, min_interval_sec=0.2, on_merge=None, cancellable=True):
+        self.start = start
+        self.retarget = retarget
+        self.cancellable = cancellable
+        self.min_interval_sec = min_interval_sec
+        self.on_merge = on_merge
+        self._slots = {}
+
+    def _slot(self, key):
+        slot = self._slots.get(key)
+        if slot is None:
+            slot = self._slots[key] = _Slot()
+        return slot
+
+    @staticmethod
+    async def _wait(handle):
+        try:
+            return await handle
+        except asyncio.CancelledError:
+            return None
+        except Exception as e:
+            print(f"WARNING: motion command failed: {e}")
+            return False
+
+    def _dispatch(self, slot, target):
+        loop = asyncio.get_running_loop()
+        slot.handle = self.start(target)
+        slot.waiter = asyncio.ensure_future(self._wait(slot.handle))
+        slot.last_dispatch = loop.time()
+        slot.dispatched += 1
+
+    def submit(self, key, target) -> dict:
+        """
+        Offers a new target for vehicle `key`. Returns the outcome
+        ('started', 'retargeted' or 'queued') and the slot counters.
+        """
+        slot = self._slot(key)
+        slot.requests += 1
+        now = asyncio.get_running_loop().time()
+        if not slot.busy():
+            status = 'started'
+            self._dispatch(slot, target)
+        elif self.retarget and slot.pending is None and now - slot.last_dispatch >= self.min_interval_sec:
+            # the new command supersedes the running one in the simulator
+            status = 'retargeted'
+            slot.retargeted += 1
+            self._dispatch(slot, target)
+        else:
+            status = 'queued'
+            if slot.pending is not None:
+                slot.merged += 1
+                if self.on_merge is not None:
+                    self.on_merge(key)
+            slot.pending = target
+            if slot.drainer is None or slot.drainer.done():
+                slot.drainer = asyncio.ensure_future(self._drain(slot))
+        return dict(status=status, **self.stats(key))
+
+    async def _drain(self, slot):
+        loop = asyncio.get_running_loop()
+        while slot.pending is not None:
+            if slot.busy():
+                timeout = None
+                if self.retarget:
+                    timeout = max(0.0, slot.last_dispatch + self.min_interval_sec - loop.time())
+                await asyncio.wait({slot.waiter}, timeout=timeout)
+            if slot.pending is None:
+                break
+            target, slot.pending = slot.pending, None
+            if slot.busy():
+                slot.retargeted += 1
+            self._dispatch(slot, target)
+
+    def cancel(self, key) -> bool:
+        """
+        Drops the pending target and stops the running motion (the vehicle
+        holds its position when the handle supports it). Returns True if a
+        running motion was stopped.
+        """
+        slot = self._slots.get(key)
+        if slot is None:
+            return False
+        slot.pending = None
+        if slot.drainer is not None:
+            slot.drainer.cancel()
+            slot.drainer = None
+        if slot.busy() and self.cancellable:
+            slot.handle.cancel()
+            slot.cancelled += 1
+            return True
+        return False
+
+    def stats(self, key) -> dict:
+        slot = self._slot(key)
+        return {'in_flight': slot.busy(), 'pending': slot.pending is not None, 'requests': slot.requests,
+                'dispatched': slot.dispatched, 'retargeted': slot.retargeted, 'merged': slot.merged,
+                'cancelled': slot.cancelled}
@@ -0,0 +1,223 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import math
+from collections import OrderedDict
+import numpy
+
+# voxel indices are packed into one int64 key, 21 bits per axis
+_KEY_BITS = 21
+_KEY_OFFSET = 1 << (_KEY_BITS - 1)
+_KEY_MASK = (1 << _KEY_BITS) - 1
+# voxels are grouped in chunks of 2**_CHUNK_BITS cells per axis; clearing the
+# low bits of each packed field turns a voxel key into its chunk key (the key
+# offset is a multiple of the chunk size, so this floors negative indices too)
+_CHUNK_BITS = 4
+_CHUNK_CELLS = 1 << _CHUNK_BITS
+_CHUNK_LOW = (1 << _CHUNK_BITS) - 1
+_CHUNK_MASK = ~((_CHUNK_LOW << (2 * _KEY_BITS)) | (_CHUNK_LOW << _KEY_BITS) | _CHUNK_LOW)
+# approximate memory per voxel on 64-bit CPython 3.11, measured with tracemalloc
+# (OrderedDict item + int key + [hits, last_seen] list + chunk set entry):
+# ~230-245 bytes for dense scans; very sparse maps (about one voxel per chunk)
+# reach ~410. max_bytes is a budget based on this estimate, not an exact limit.
+APPROX_BYTES_PER_VOXEL = 240
+
+
+def _pack(ix, iy, iz):
+    return (((ix + _KEY_OFFSET) & _KEY_MASK) << (2 * _KEY_BITS)) | \
+           (((iy + _KEY_OFFSET) & _KEY_MASK) << _KEY_BITS) | \
+           ((iz + _KEY_OFFSET) & _KEY_MASK)
+
+
+def _unpack(key):
+    return (((key >> (2 * _KEY_BITS)) & _KEY_MASK) - _KEY_OFFSET,
+            ((key >> _KEY_BITS) & _KEY_MASK) - _KEY_OFFSET,
+            (key & _KEY_MASK) - _KEY_OFFSET)
+
+
+class OccupancyMap:
+    """
+    Incremental 3D voxel hash map fused from world-frame LiDAR points.
+
+    Voxels are kept in LRU order of the last scan that hit them. After each
+    scan, voxels outside a sliding window around the vehicle are dropped, and
+    the least recently seen ones are evicted until the map fits in max_bytes
+    (approximate, see APPROX_BYTES_PER_VOXEL). Voxels are also indexed by
+    chunk, so the window check costs one test per chunk plus the voxels of
+    chunks crossing the window edge, not a walk over the whole map.
+    """
+    def __init__(self, voxel_size=0.2, window_radius=50.0, max_bytes=64 * 1024 * 1024, min_hits=2):
+        self.voxel_size = voxel_size
+        self.window_radius = window_radius
+        self.max_voxels = max(1, max_bytes // APPROX_BYTES_PER_VOXEL)
+        self.min_hits = min_hits
+        self.scan_count = 0
+        self.evicted = 0
+        self._voxels = OrderedDict()
+        self._chunks = {}
+
+    def __len__(self):
+        return len(self._voxels)
+
+    def memory_bytes(self):
+        """
+        Approximate memory used by the voxels (len * APPROX_BYTES_PER_VOXEL).
+        """
+        return len(self._voxels) * APPROX_BYTES_PER_VOXEL
+
+    def _remove(self, key):
+        del self._voxels[key]
+        chunk_key = key & _CHUNK_MASK
+        chunk = self._chunks[chunk_key]
+        chunk.discard(key)
+        if not chunk:
+            del self._chunks[chunk_key]
+
+    def _index(self, x, y, z):
+        s = self.voxel_size
+        return (math.floor(x / s), math.floor(y / s), math.floor(z / s))
+
+    def integrate(self, world_points: numpy.ndarray, vehicle_position=None):
+        """
+        Fuses one scan of (N, 3) world-frame points into the map.
+        vehicle_position (x, y, z) centers the sliding window.
+        """
+        self.scan_count += 1
+        if world_points.shape[0] > 0:
+            idx = numpy.floor(world_points / self.voxel_size).astype(numpy.int64)
+            idx += _KEY_OFFSET
+            idx &= _KEY_MASK
+            keys = (idx[:, 0] << (2 * _KEY_BITS)) | (idx[:, 1] << _KEY_BITS) | idx[:, 2]
+            keys, counts = numpy.unique(keys, return_counts=True)
+            voxels = self._voxels
+            for key, count in zip(keys.tolist(), counts.tolist()):
+                entry = voxels.get(key)
+                if entry is None:
+                    voxels[key] = [count, self.scan_count]
+                    chunk = self._chunks.get(key & _CHUNK_MASK)
+                    if chunk is None:
+                        chunk = self._chunks[key & _CHUNK_MASK] = set()
+                    chunk.add(key)
+                else:
+                    entry[0] += count
+                    entry[1] = self.scan_count
+                    voxels.move_to_end(key)
+        if vehicle_position is not None:
+            self.evict_outside(vehicle_position)
+        self._enforce_cap()
+
+    def integrate_result(self, result, pose):
+        """
+        Fuses a LidarResult from LidarPipeline, centering the window on the LiDAR pose.
+        """
+        center = None
+        if pose is not None:
+            center = (pose.position.x_val, pose.position.y_val, pose.position.z_val)
+        self.integrate(result.world_points, center)
+
+    def evict_outside(self, center):
+        c = self._index(*center)
+        r = int(math.ceil(self.window_radius / self.voxel_size))
+        lo = [v - r for v in c]
+        hi = [v + r for v in c]
+        stale = []
+        for chunk_key, keys in self._chunks.items():
+            first = _unpack(chunk_key)
+            last = [v + _CHUNK_CELLS - 1 for v in first]
+            if all(lo[i] <= first[i] and last[i] <= hi[i] for i in range(3)):
+                continue
+            if any(last[i] < lo[i] or first[i] > hi[i] for i in range(3)):
+                stale.extend(keys)
+                continue
+            # chunk crosses the window edge: test its voxels
+            for key in keys:
+                ix, iy, iz = _unpack(key)
+                if not (lo[0] <= ix <= hi[0] and lo[1] <= iy <= hi[1] and lo[2] <= iz <= hi[2]):
+                    stale.append(key)
+        for key in stale:
+            self._remove(key)
+        self.evicted += len(stale)
+
+    def _enforce_cap(self):
+        voxels = self._voxels
+        while len(voxels) > self.max_voxels:
+            self._remove(next(iter(voxels)))
+            self.evicted += 1
+
+    def is_occupied(self, x, y, z):
+        entry = self._voxels.get(_pack(*self._index(x, y, z)))
+        return entry is not None and entry[0] >= self.min_hits
+
+    def _occupied_index(self, ix, iy, iz, inflate):
+        voxels = self._voxels
+        for dx in range(-inflate, inflate + 1):
+            for dy in range(-inflate, inflate + 1):
+                for dz in range(-inflate, inflate + 1):
+                    entry = voxels.get(_pack(ix + dx, iy + dy, iz + dz))
+                    if entry is not None and entry[0] >= self.min_hits:
+                        return True
+        return False
+
+    def segment_collides(self, start, end, radius=0.0):
+        """
+        Walks the voxels crossed by the segment start -> end (3D DDA) and
+        returns the center of the first blocked voxel on the path, or None
+        if the segment is free.
+        radius inflates every visited voxel by ceil(radius / voxel_size) cells.
+        """
+        s = self.voxel_size
+        inflate = int(math.ceil(radius / s)) if radius > 0 else 0
+        p0 = [float(v) for v in start]
+        p1 = [float(v) for v in end]
+        cur = list(self._index(*p0))
+        last = self._index(*p1)
+        d = [p1[i] - p0[i] for i in range(3)]
+        step = [0, 0, 0]
+        t_max = [math.inf, math.inf, math.inf]
+        t_delta = [math.inf, math.inf, math.inf]
+        for i in range(3):
+            if d[i] > 0:
+                step[i] = 1
+                t_max[i] = ((cur[i] + 1) * s - p0[i]) / d[i]
+                t_delta[i] = s / d[i]
+            elif d[i] < 0:
+                step[i] = -1
+                t_max[i] = (cur[i] * s - p0[i]) / d[i]
+                t_delta[i] = -s / d[i]
+
+        max_steps = sum(abs(last[i] - cur[i]) for i in range(3)) + 1
+        for _ in range(max_steps):
+            if self._occupied_index(cur[0], cur[1], cur[2], inflate):
+                return tuple((c + 0.5) * s for c in cur)
+            if tuple(cur) == last:
+                break
+            axis = t_max.index(min(t_max))
+            if t_max[axis] > 1.0:
+                break
+            cur[axis] += step[axis]
+            t_max[axis] += t_delta[axis]
+        return None
+
+    def path_collides(self, waypoints, radius=0.0):
+        """
+        Checks a polyline of (x, y, z) waypoints; returns the first hit or None.
+        """
+        for i in range(len(waypoints) - 1):
+            hit = self.segment_collides(waypoints[i], waypoints[i + 1], radius)
+            if hit is not None:
+                return hit
+        return None
+
+
+def checked_moveToPosition(client, occupancy_map: OccupancyMap, x, y, z, *args, radius=0.3, **kwargs):
+    """
+    moveToPosition() that first checks the straight path from the current
+    pose against the occupancy map. Returns False without moving if blocked.
+    """
+    pose = client.simGetVehiclePose()
+    start = (pose.position.x_val, pose.position.y_val, pose.position.z_val)
+    hit = occupancy_map.segment_collides(start, (x, y, z), radius)
+    if hit is not None:
+        print(f"WARNING: path to ({x}, {y}, {z}) blocked near {hit}")
+        return False
+    return client.moveToPosition(x, y, z, *args, **kwargs)
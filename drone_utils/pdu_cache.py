@@ -0,0 +1,419 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import glob
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import threading
+
+# Compiled, memory-mappable cache of the PDU channel config (custom.json) and
+# the offset files of every PDU type it uses (hako_binary/offset/*/*.offset).
+#
+# The PDU managers parse these on every start: the channel config when they
+# are constructed, and one offset file per type (found with a glob over the
+# offset directory) the first time a PDU of that type is converted.
+# CachedOffsetMap and cached_config_dict() serve the same data from the
+# cache, see drone_utils/pdu_manager.py for how the managers are built on it.
+#
+# The cache is written next to the config as <config>.pducache, or, if that
+# directory is read-only, into ~/.cache/hakoniwa under the sha1 of the config
+# content. It is written with an atomic rename and opened with
+# mmap(ACCESS_READ), so any number of processes share one page-cached copy.
+# It holds only struct records and UTF-8 text, nothing is executed on load.
+# Every source file is recorded with mtime, size and sha1; a changed
+# mtime/size costs a content hash, and only a changed hash forces a rebuild.
+#
+# File layout (little-endian):
+#   header    8s magic, u32 version, u32 offset dir, u32 flags,
+#             u32 counts x5 (sources, strings, types, robots, channels), u32 blob size
+#   sources   u32 path, u64 mtime_ns, u64 size, 20s sha1
+#   strings   u32 offset, u32 length (into the blob)
+#   types     u32 name (offset file name without .offset), u32 offset file text
+#   robots    u32 name, u32 first channel, u32 channel count
+#   channels  u32 type, u32 org_name, u32 name, u32 method_type,
+#             i32 channel_id, i32 pdu_size, i32 write_cycle, u8 writer, u8 keys, u16 pad
+#   blob      utf-8 string data
+# Strings are referred to by index into the string table.
+
+DEFAULT_OFFSET_DIR = '/usr/local/lib/hakoniwa/hako_binary/offset'
+CACHE_SUFFIX = '.pducache'
+
+_MAGIC = b'HKPDUC\x00\x02'
+_VERSION = 2
+_HEADER = struct.Struct('<8sIIIIIIIII')
+_SOURCE = struct.Struct('<IQQ20s')
+_STRING = struct.Struct('<II')
+_TYPE = struct.Struct('<II')
+_ROBOT = struct.Struct('<III')
+_CHANNEL = struct.Struct('<IIIIiiiBBH')
+
+# the channel map is stored only for configs in the legacy shape whose
+# entries use no keys beyond these; anything else is parsed by the manager
+FLAG_CHANNELS = 1
+_OPTIONAL_KEYS = ('org_name', 'name', 'pdu_size', 'write_cycle', 'method_type')
+_CHANNEL_KEYS = frozenset(('type', 'channel_id') + _OPTIONAL_KEYS)
+_IO_KEYS = ('shm_pdu_readers', 'shm_pdu_writers')
+
+
+class PduCacheError(Exception):
+    pass
+
+
+# --- source parsing ---
+
+def _sha1(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha1(f.read()).digest()
+
+
+def _source_entry(path):
+    st = os.stat(path)
+    return (os.path.abspath(path), st.st_mtime_ns, st.st_size, _sha1(path))
+
+
+def _type_file(offset_dir, type_name):
+    # same lookup as hako_binary.offset_map.OffsetMap.find_filepath()
+    base = type_name.split('/')[-1]
+    found = glob.glob(offset_dir + "/*/" + base + ".offset", recursive=True)
+    return base, (found[0] if found else None)
+
+
+def _channel_types(config, config_path, sources):
+    """
+    PDU types named by the config. Compact configs ("paths") list them in
+    separate pdutypes files, which become sources of the cache as well.
+    """
+    if 'paths' not in config:
+        return [entry['type'] for robot in config.get('robots', [])
+                for key in _IO_KEYS for entry in robot.get(key, []) if 'type' in entry]
+    base_dir = os.path.dirname(os.path.abspath(config_path))
+    types = []
+    for info in config['paths']:
+        path = info.get('path')
+        if not path:
+            continue
+        path = path if os.path.isabs(path) else os.path.join(base_dir, path)
+        with open(path, 'r', encoding='utf-8') as f:
+            types += [pdu['type'] for pdu in json.load(f) if 'type' in pdu]
+        sources.append(_source_entry(path))
+    return types
+
+
+def _cacheable_channels(config):
+    if 'paths' in config:
+        return False
+    for robot in config.get('robots', []):
+        if robot.get('rpc_pdu_readers') or robot.get('rpc_pdu_writers'):
+            return False
+        for key in _IO_KEYS:
+            for entry in robot.get(key, []):
+                if not _CHANNEL_KEYS.issuperset(entry) or 'type' not in entry or 'channel_id' not in entry:
+                    return False
+    return True
+
+
+def compile_tables(config_path, offset_dir=DEFAULT_OFFSET_DIR):
+    """
+    Reads the channel config and the offset files of every type reachable
+    from it. Returns (sources, config, types) where types maps an offset
+    file name to its text.
+    """
+    with open(config_path, 'r', encoding='utf-8') as f:
+        config = json.load(f)
+    sources = [_source_entry(config_path)]
+    types = {}
+    pending = _channel_types(config, config_path, sources)
+    while pending:
+        base, path = _type_file(offset_dir, pending.pop())
+        if base in types or path is None:
+            # unknown types are left to the manager's own offset map
+            continue
+        with open(path) as f:
+            lines = f.readlines()
+        sources.append(_source_entry(path))
+        types[base] = ''.join(lines)
+        for line in lines:
+            parts = line.split(':')
+            if len(parts) > 3 and parts[1] != 'primitive':
+                pending.append(parts[3])
+    return sources, config, types
+
+
+# --- binary encoding ---
+
+def encode_tables(sources, config, types, offset_dir):
+    strings = {}
+
+    def sid(text):
+        index = strings.get(text)
+        if index is None:
+            index = strings[text] = len(strings)
+        return index
+
+    source_recs = [_SOURCE.pack(sid(p), m, s, h) for p, m, s, h in sources]
+    type_recs = [_TYPE.pack(sid(name), sid(text)) for name, text in types.items()]
+    robot_recs = []
+    channel_recs = []
+    flags = 0
+    if _cacheable_channels(config):
+        flags |= FLAG_CHANNELS
+        for robot in config.get('robots', []):
+            first = len(channel_recs)
+            for writer, key in enumerate(_IO_KEYS):
+                for entry in robot.get(key, []):
+                    keys = sum(1 << i for i, k in enumerate(_OPTIONAL_KEYS) if k in entry)
+                    channel_recs.append(_CHANNEL.pack(
+                        sid(entry['type']), sid(str(entry.get('org_name', ''))), sid(str(entry.get('name', ''))),
+                        sid(str(entry.get('method_type', ''))), int(entry['channel_id']),
+                        int(entry.get('pdu_size', -1)), int(entry.get('write_cycle', 0)), writer, keys, 0))
+            robot_recs.append(_ROBOT.pack(sid(robot.get('name', '')), first, len(channel_recs) - first))
+    offset_dir_id = sid(os.path.abspath(offset_dir))
+
+    blob = bytearray()
+    string_recs = []
+    for text in strings:
+        data = text.encode('utf-8')
+        string_recs.append(_STRING.pack(len(blob), len(data)))
+        blob += data
+    header = _HEADER.pack(_MAGIC, _VERSION, offset_dir_id, flags, len(source_recs), len(string_recs),
+                          len(type_recs), len(robot_recs), len(channel_recs), len(blob))
+    return b''.join([header] + source_recs + string_recs + type_recs + robot_recs + channel_recs + [bytes(blob)])
+
+
+class PduTables:
+    """
+    Read-only view of a compiled cache. Offset texts are decoded from the
+    mmap on first use; only the type name index is built at open time.
+    """
+    def __init__(self, buffer, path=None):
+        self.path = path
+        self._buf = buffer
+        (magic, version, offset_dir, self.flags, n_sources, n_strings, n_types, n_robots, n_channels,
+         blob_size) = _HEADER.unpack_from(buffer, 0)
+        if magic != _MAGIC or version != _VERSION:
+            raise PduCacheError(f"not a PDU cache (version {_VERSION}): {path}")
+        pos = _HEADER.size
+        self._sources_at, pos = pos, pos + n_sources * _SOURCE.size
+        self._strings_at, pos = pos, pos + n_strings * _STRING.size
+        self._types_at, pos = pos, pos + n_types * _TYPE.size
+        self._robots_at, pos = pos, pos + n_robots * _ROBOT.size
+        self._channels_at, pos = pos, pos + n_channels * _CHANNEL.size
+        self._blob_at = pos
+        if pos + blob_size > len(buffer):
+            raise PduCacheError(f"truncated PDU cache: {path}")
+        self.n_sources = n_sources
+        self.n_types = n_types
+        self.n_robots = n_robots
+        self.n_channels = n_channels
+        self._string_cache = {}
+        self.offset_dir = self._string(offset_dir)
+        self._types = {}
+        for i in range(n_types):
+            name, text = _TYPE.unpack_from(buffer, self._types_at + i * _TYPE.size)
+            self._types[self._string(name)] = text
+
+    def _string(self, index):
+        text = self._string_cache.get(index)
+        if text is None:
+            offset, length = _STRING.unpack_from(self._buf, self._strings_at + index * _STRING.size)
+            start = self._blob_at + offset
+            text = self._string_cache[index] = bytes(self._buf[start:start + length]).decode('utf-8')
+        return text
+
+    def sources(self):
+        for i in range(self.n_sources):
+            path, mtime_ns, size, sha1 = _SOURCE.unpack_from(self._buf, self._sources_at + i * _SOURCE.size)
+            yield self._string(path), mtime_ns, size, sha1
+
+    def type_names(self):
+        return list(self._types)
+
+    def offset_lines(self, type_name):
+        """
+        Lines of the offset file of type_name ('pkg/Type' or 'Type'), as
+        readlines() returns them; None if the type is not in the cache.
+        """
+        text = self._types.get(type_name.split('/')[-1])
+        if text is None:
+            return None
+        parts = self._string(text).split('\n')
+        lines = [line + '\n' for line in parts[:-1]]
+        if parts[-1]:
+            lines.append(parts[-1])
+        return lines
+
+    def config_dict(self):
+        """
+        The channel config in the legacy shape (robots with shm_pdu_readers /
+        shm_pdu_writers), or None if it was not stored (see FLAG_CHANNELS).
+        """
+        if not self.flags & FLAG_CHANNELS:
+            return None
+        robots = []
+        for r in range(self.n_robots):
+            name, first, count = _ROBOT.unpack_from(self._buf, self._robots_at + r * _ROBOT.size)
+            robot = {'name': self._string(name), 'rpc_pdu_readers': [], 'rpc_pdu_writers': [],
+                     'shm_pdu_readers': [], 'shm_pdu_writers': []}
+            for i in range(first, first + count):
+                (type_name, org_name, pdu_name, method_type, channel_id, pdu_size, write_cycle, writer,
+                 keys, _) = _CHANNEL.unpack_from(self._buf, self._channels_at + i * _CHANNEL.size)
+                entry = {'type': self._string(type_name), 'channel_id': channel_id}
+                values = (self._string(org_name), self._string(pdu_name), pdu_size, write_cycle,
+                          self._string(method_type))
+                for bit, (key, value) in enumerate(zip(_OPTIONAL_KEYS, values)):
+                    if keys & (1 << bit):
+                        entry[key] = value
+                robot[_IO_KEYS[writer]].append(entry)
+            robots.append(robot)
+        return {'robots': robots}
+
+
+class CachedOffsetMap:
+    """
+    Drop-in for hako_binary.offset_map.OffsetMap (the offmap of a PDU
+    convertor) that serves offset files from PduTables. Types missing from
+    the cache are looked up by `fallback`, the manager's own offset map.
+    """
+    def __init__(self, tables, fallback):
+        self.tables = tables
+        self.fallback = fallback
+        self.off_path = fallback.off_path
+        self.map = {}
+
+    def get(self, typename):
+        lines = self.map.get(typename)
+        if lines is None:
+            lines = self.tables.offset_lines(typename)
+            if lines is None:
+                lines = self.fallback.get(typename)
+            self.map[typename] = lines
+        return lines
+
+    def align8(self, value):
+        return ((value + 7) // 8) * 8
+
+    def get_pdu_size(self, typename):
+        # same computation as OffsetMap.get_pdu_size()
+        last = self.get(typename)[-1].split(':')
+        last_size = 8 if last[0] == 'varray' else int(last[5])
+        return self.align8(int(last[4]) + last_size + 8)
+
+    def find_filepath(self, path, filename):
+        return self.fallback.find_filepath(path, filename)
+
+
+# --- cache files ---
+
+def cache_dir():
+    base = os.getenv('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'hakoniwa')
+
+
+def cache_path(config_path):
+    """
+    <config>.pducache when the config directory is writable, otherwise a
+    file in cache_dir() named after the sha1 of the config content.
+    """
+    config_path = os.path.abspath(config_path)
+    if os.access(os.path.dirname(config_path), os.W_OK):
+        return config_path + CACHE_SUFFIX
+    return os.path.join(cache_dir(), f"pdu-{_sha1(config_path).hex()}{CACHE_SUFFIX}")
+
+
+def _is_fresh(tables, offset_dir):
+    """
+    True while the cache was built for offset_dir and every source is
+    unchanged. mtime/size are checked first and only a mismatch costs a
+    content hash, so a touched but identical file does not force a rebuild.
+    """
+    if tables.offset_dir != os.path.abspath(offset_dir):
+        return False
+    for path, mtime_ns, size, sha1 in tables.sources():
+        try:
+            st = os.stat(path)
+        except OSError:
+            return False
+        if st.st_mtime_ns == mtime_ns and st.st_size == size:
+            continue
+        if st.st_size != size or _sha1(path) != sha1:
+            return False
+    return True
+
+
+def _open(path):
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            raise PduCacheError(f"empty PDU cache: {path}")
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    return PduTables(buffer, path)
+
+
+def build_cache(config_path, offset_dir=DEFAULT_OFFSET_DIR, path=None):
+    path = path or cache_path(config_path)
+    data = encode_tables(*compile_tables(config_path, offset_dir), offset_dir)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-pdu-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    return path
+
+
+_tables = {}
+_tables_lock = threading.Lock()
+
+def load_pdu_tables(config_path, offset_dir=None) -> PduTables:
+    """
+    Returns the compiled tables for config_path, building or rebuilding the
+    cache file when needed. Memoized per process.
+    Set HAKO_PDU_CACHE=0 to always compile in memory without touching disk.
+    """
+    offset_dir = offset_dir or os.getenv('HAKO_BINARY_PATH', DEFAULT_OFFSET_DIR)
+    key = (os.path.abspath(config_path), os.path.abspath(offset_dir))
+    with _tables_lock:
+        tables = _tables.get(key)
+        if tables is not None:
+            return tables
+        if os.getenv('HAKO_PDU_CACHE', '1') == '0':
+            tables = PduTables(encode_tables(*compile_tables(config_path, offset_dir), offset_dir))
+        else:
+            path = cache_path(config_path)
+            try:
+                tables = _open(path)
+                if not _is_fresh(tables, offset_dir):
+                    tables = None
+            except (OSError, PduCacheError, struct.error):
+                tables = None
+            if tables is None:
+                try:
+                    tables = _open(build_cache(config_path, offset_dir, path))
+                except OSError:
+                    # no writable location: keep the compiled tables in memory only
+                    tables = PduTables(encode_tables(*compile_tables(config_path, offset_dir), offset_dir))
+        _tables[key] = tables
+        return tables
+
+
+def main():
+    if len(sys.argv) not in (2, 3):
+        print(f"Usage: {sys.argv[0]} <config_path> [offset_dir]")
+        return 1
+    tables = load_pdu_tables(sys.argv[1], sys.argv[2] if len(sys.argv) == 3 else None)
+    channels = 'cached' if tables.flags & FLAG_CHANNELS else 'parsed by the manager'
+    print(f"INFO: {tables.path or '(memory)'}: {tables.n_types} types, {tables.n_channels} channels ({channels})")
+    for name in sorted(tables.type_names()):
+        print(f"  {name}: {len(tables.offset_lines(name))} fields")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,90 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import os
+import threading
+from drone_utils.pdu_cache import CachedOffsetMap, load_pdu_tables
+
+# PDU managers built on the compiled table cache (drone_utils/pdu_cache.py).
+# The managers come from outside this repo; both keep their offset map in
+# the offmap attribute of their convertor, which is replaced here by one that
+# reads the cache instead of globbing and parsing the offset directory.
+
+
+def use_pdu_tables(convertor, tables):
+    """
+    Makes a PDU convertor (hako_pdu's manager.conv or hakoniwa_pdu's
+    manager.pdu_convertor) read offset files from the compiled tables.
+    Returns False if the convertor has no offset map to replace.
+    """
+    offmap = getattr(convertor, 'offmap', None)
+    if offmap is None:
+        return False
+    if not isinstance(offmap, CachedOffsetMap):
+        convertor.offmap = CachedOffsetMap(tables, offmap)
+    return True
+
+
+def use_cached_offsets(manager, config_path, hako_binary_path=None):
+    """
+    Switches an already constructed manager (e.g. MultirotorClient.pdu_manager)
+    to the compiled tables of config_path.
+    """
+    convertor = getattr(manager, 'conv', None) or getattr(manager, 'pdu_convertor', None)
+    if convertor is None or not use_pdu_tables(convertor, load_pdu_tables(config_path, hako_binary_path)):
+        print(f"WARNING: {type(manager).__name__} has no offset map; PDU offsets are not read from the cache")
+        return False
+    return True
+
+
+_managers = {}
+_managers_lock = threading.Lock()
+
+def get_pdu_manager(hako_binary_path, config_path):
+    """
+    hako_pdu.HakoPduManager for (offset dir, config) reading its offset
+    tables from the compiled cache. One instance per process, so entry
+    points that need the manager in several places share it.
+    """
+    key = (os.path.abspath(hako_binary_path), os.path.abspath(config_path))
+    with _managers_lock:
+        manager = _managers.get(key)
+        if manager is None:
+            import hako_pdu
+            manager = _managers[key] = hako_pdu.HakoPduManager(hako_binary_path, config_path)
+            use_cached_offsets(manager, config_path, hako_binary_path)
+        return manager
+
+
+def create_pdu_manager(config_path, comm_service, **kwargs):
+    """
+    hakoniwa_pdu PduManager initialized from the compiled cache: the same
+    steps as PduManager.initialize(), with the channel config and offset
+    tables read from the cache. Configs the cache does not store the channel
+    map for (see pdu_cache.FLAG_CHANNELS) are parsed by initialize() itself.
+    """
+    from hakoniwa_pdu.pdu_manager import PduManager
+    from hakoniwa_pdu.impl.communication_buffer import CommunicationBuffer
+    from hakoniwa_pdu.impl.pdu_channel_config import PduChannelConfig
+    from hakoniwa_pdu.impl.pdu_convertor import PduConvertor
+
+    tables = load_pdu_tables(config_path)
+    manager = PduManager(**kwargs)
+    config_dict = tables.config_dict()
+    if config_dict is None:
+        manager.initialize(config_path=config_path, comm_service=comm_service)
+    else:
+        if comm_service is None:
+            raise ValueError("CommService is None")
+        pdu_config = PduChannelConfig.__new__(PduChannelConfig)
+        pdu_config._base_dir = os.path.dirname(os.path.abspath(config_path))
+        pdu_config.config_dict = config_dict
+        pdu_config._rebuild_indices()
+        manager.pdu_config = pdu_config
+        comm_service.set_channel_config(pdu_config)
+        manager.comm_buffer = CommunicationBuffer(pdu_config)
+        manager.comm_service = comm_service
+        manager.b_is_initialized = True
+        manager.pdu_convertor = PduConvertor(tables.offset_dir, pdu_config)
+    use_pdu_tables(manager.pdu_convertor, tables)
+    return manager
@@ -0,0 +1,117 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import threading
+import time
+
+
+class PoseCache:
+    """
+    Per-vehicle cache of decoded simGetVehiclePose() results.
+
+    A cached pose is reused while it is younger than max_age_sec and no new
+    simulation step has been announced. A step is announced either by
+    notify_step() or, if sim_time_fn is given, by a change of its value
+    (e.g. hakopy.simulation_time). Safe to share between threads.
+    """
+    def __init__(self, client, max_age_sec=0.02, sim_time_fn=None):
+        self.client = client
+        self.max_age_sec = max_age_sec
+        self.sim_time_fn = sim_time_fn
+        self.hits = 0
+        self.misses = 0
+        self._step = 0
+        self._last_sim_time = None
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def notify_step(self):
+        with self._lock:
+            self._step += 1
+
+    def invalidate(self, vehicle_name=None):
+        with self._lock:
+            if vehicle_name is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(vehicle_name, None)
+
+    def _current_step(self):
+        if self.sim_time_fn is not None:
+            sim_time = self.sim_time_fn()
+            if sim_time != self._last_sim_time:
+                self._last_sim_time = sim_time
+                self._step += 1
+        return self._step
+
+    def get(self, vehicle_name=None, max_age_sec=None):
+        """
+        max_age_sec overrides the cache's own limit for this read.
+        """
+        name = vehicle_name if vehicle_name is not None else self.client.default_drone_name
+        max_age = self.max_age_sec if max_age_sec is None else max_age_sec
+        now = time.monotonic()
+        with self._lock:
+            step = self._current_step()
+            entry = self._entries.get(name)
+            if entry is not None and entry[1] == step and (now - entry[2]) < max_age:
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+        # read outside the lock so a slow PDU read does not block other vehicles
+        if name == self.client.default_drone_name:
+            pose = self.client.simGetVehiclePose()
+        else:
+            pose = self.client.simGetVehiclePose(vehicle_name=name)
+        with self._lock:
+            self._entries[name] = (pose, step, now)
+        return pose
+
+
+class PoseCacheView:
+    """
+    A caller's handle on the shared PoseCache of a client: entries, steps
+    and counters are shared, max_age_sec is the caller's own.
+    """
+    def __init__(self, cache: PoseCache, max_age_sec):
+        self.cache = cache
+        self.max_age_sec = max_age_sec
+
+    @property
+    def hits(self):
+        return self.cache.hits
+
+    @property
+    def misses(self):
+        return self.cache.misses
+
+    def notify_step(self):
+        self.cache.notify_step()
+
+    def invalidate(self, vehicle_name=None):
+        self.cache.invalidate(vehicle_name)
+
+    def get(self, vehicle_name=None):
+        return self.cache.get(vehicle_name, self.max_age_sec)
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+def get_pose_cache(client, max_age_sec=0.02, sim_time_fn=None) -> PoseCacheView:
+    """
+    Returns a view with this caller's max_age_sec on the process-wide
+    PoseCache of `client`, creating the cache on first use. Raises
+    ValueError if a different sim_time_fn was already set for the client.
+    """
+    with _caches_lock:
+        cache = _caches.get(id(client))
+        if cache is None or cache.client is not client:
+            cache = PoseCache(client, max_age_sec, sim_time_fn)
+            _caches[id(client)] = cache
+        elif sim_time_fn is not None:
+            if cache.sim_time_fn is None:
+                cache.sim_time_fn = sim_time_fn
+            elif cache.sim_time_fn is not sim_time_fn:
+                raise ValueError("pose cache of this client already uses another sim_time_fn")
+        return PoseCacheView(cache, max_age_sec)
@@ -0,0 +1,256 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import bisect
+import mmap
+import os
+import queue
+import struct
+import sys
+import threading
+import time
+
+from drone_utils.flight_recorder import FlightLog
+
+# Synchronized camera + telemetry recording.
+#
+# A recording is a directory:
+#   frames.seg     JPEG frames back to back
+#   frames.idx     one record per frame: f64 time, u64 offset, u32 length, u32 sequence
+#   telemetry.flt  FlightRecorder log (drone_utils.flight_recorder)
+# Frames and telemetry share the same clock (time.time() in server.py), so
+# playback can pair every frame with the pose at its capture time.
+
+FRAMES_FILE = 'frames.seg'
+INDEX_FILE = 'frames.idx'
+TELEMETRY_FILE = 'telemetry.flt'
+
+_INDEX = struct.Struct('<dQII')
+
+
+class FrameRecorder:
+    """
+    Writes JPEG frames to frames.seg/frames.idx (replacing an earlier
+    recording, like FlightRecorder does) from a writer thread; add() never
+    blocks (frames are dropped if the writer falls behind).
+    """
+    def __init__(self, directory, max_pending=32):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.frames = 0
+        self.dropped = 0
+        self._seg = open(os.path.join(directory, FRAMES_FILE), 'wb')
+        self._idx = open(os.path.join(directory, INDEX_FILE), 'wb')
+        self._offset = 0
+        self._seq = 0
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._thread = threading.Thread(target=self._writer, name='frame-recorder', daemon=True)
+        self._thread.start()
+
+    def add(self, t, jpeg):
+        try:
+            self._queue.put_nowait((t, jpeg))
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+        self._seg.close()
+        self._idx.close()
+
+    def _writer(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            t, jpeg = item
+            self._seg.write(jpeg)
+            # the frame bytes go out before their index record, so a reader
+            # never sees an index entry pointing past the end of frames.seg
+            self._seg.flush()
+            self._idx.write(_INDEX.pack(t, self._offset, len(jpeg), self._seq))
+            self._idx.flush()
+            self._offset += len(jpeg)
+            self._seq += 1
+            self.frames += 1
+
+
+class Recording:
+    """
+    Random-access reader of a recording directory. Frames are served as
+    memoryview slices of a read-only mmap of frames.seg (no copy); the
+    telemetry log is loaded into memory on open.
+    """
+    def __init__(self, directory):
+        self.directory = directory
+        self._seg_file = open(os.path.join(directory, FRAMES_FILE), 'rb')
+        size = os.fstat(self._seg_file.fileno()).st_size
+        self._seg = mmap.mmap(self._seg_file.fileno(), 0, access=mmap.ACCESS_READ) if size else b''
+        self._view = memoryview(self._seg)
+        with open(os.path.join(directory, INDEX_FILE), 'rb') as f:
+            raw = f.read()
+        records = [r for r in _INDEX.iter_unpack(raw[:len(raw) - len(raw) % _INDEX.size])
+                   if r[1] + r[2] <= size]
+        self.frame_times = [r[0] for r in records]
+        self._frames = [(r[1], r[2]) for r in records]
+        telemetry_path = os.path.join(directory, TELEMETRY_FILE)
+        self.telemetry = None
+        self.events = []
+        if os.path.exists(telemetry_path):
+            with FlightLog(telemetry_path) as log:
+                self.telemetry = log.query()
+                self.events = log.events()
+        self.telemetry_times = list(self.telemetry['t']) if self.telemetry else []
+
+    def close(self):
+        self._view.release()
+        if isinstance(self._seg, mmap.mmap):
+            self._seg.close()
+        self._seg_file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+    def __len__(self):
+        return len(self._frames)
+
+    def time_range(self):
+        times = self.frame_times + self.telemetry_times[:1] + self.telemetry_times[-1:]
+        if not times:
+            return None
+        return min(times), max(times)
+
+    def frame(self, index):
+        offset, length = self._frames[index]
+        return self._view[offset:offset + length]
+
+    def frame_at(self, t):
+        """
+        (index, JPEG memoryview) of the last frame captured at or before t, or (None, None).
+        """
+        i = bisect.bisect_right(self.frame_times, t) - 1
+        if i < 0:
+            return None, None
+        return i, self.frame(i)
+
+    def telemetry_at(self, t):
+        """
+        Last telemetry row at or before t as {column: value}, or None.
+        """
+        i = bisect.bisect_right(self.telemetry_times, t) - 1
+        if i < 0:
+            return None
+        return {name: col[i] for name, col in self.telemetry.items()}
+
+
+# --- replay as a simulator client ---
+
+class _Vector3r:
+    def __init__(self, x_val=0.0, y_val=0.0, z_val=0.0):
+        self.x_val = x_val
+        self.y_val = y_val
+        self.z_val = z_val
+
+
+class _Quaternionr:
+    def __init__(self, x_val=0.0, y_val=0.0, z_val=0.0, w_val=1.0):
+        self.x_val = x_val
+        self.y_val = y_val
+        self.z_val = z_val
+        self.w_val = w_val
+
+
+class _Pose:
+    def __init__(self, position, orientation):
+        self.position = position
+        self.orientation = orientation
+
+
+class _ReplayVehicle:
+    def __init__(self, client, name):
+        self._client = client
+        self.name = name
+
+    @property
+    def arm(self):
+        row = self._client.current_row()
+        return bool(row and row['armed'])
+
+
+class ReplayClient:
+    """
+    Plays a Recording back through the parts of the hakosim.MultirotorClient
+    interface that server.py reads (pose, arm state, camera), so the live
+    /state and /stream.mjpg endpoints serve the recording unchanged.
+    The replay clock runs at `speed` x real time and loops at the end.
+    Flight commands are rejected.
+    """
+    def __init__(self, directory, default_drone_name="Drone", speed=1.0, loop=True):
+        self.recording = Recording(directory)
+        self.default_drone_name = default_drone_name
+        self.vehicles = {default_drone_name: _ReplayVehicle(self, default_drone_name)}
+        # server.py skips status updates while pdu_manager is None
+        self.pdu_manager = object()
+        self.speed = speed
+        self.loop = loop
+        span = self.recording.time_range()
+        if span is None:
+            raise ValueError(f"empty recording: {directory}")
+        self.t_begin, self.t_end = span
+        self._wall_start = time.monotonic()
+
+    def replay_time(self):
+        elapsed = (time.monotonic() - self._wall_start) * self.speed
+        duration = max(self.t_end - self.t_begin, 1e-6)
+        if self.loop:
+            elapsed %= duration
+        return self.t_begin + min(elapsed, duration)
+
+    def current_row(self):
+        return self.recording.telemetry_at(self.replay_time())
+
+    def confirmConnection(self):
+        return True
+
+    def enableApiControl(self, v, vehicle_name=None):
+        return True
+
+    def run_nowait(self):
+        pass
+
+    def simGetVehiclePose(self, vehicle_name=None):
+        row = self.current_row()
+        if row is None:
+            return _Pose(_Vector3r(), _Quaternionr())
+        return _Pose(_Vector3r(row['x'], row['y'], row['z']),
+                     _Quaternionr(row['qx'], row['qy'], row['qz'], row['qw']))
+
+    def simGetImage(self, camera_id, image_type, vehicle_name=None):
+        _, frame = self.recording.frame_at(self.replay_time())
+        return bytes(frame) if frame is not None else None
+
+    def _rejected(self, *args, **kwargs):
+        raise RuntimeError("replay mode: flight commands are not available")
+
+    armDisarm = takeoff = land = moveToPosition = grab_baggage = _rejected
+    getGameJoystickData = putGameJoystickData = _rejected
+
+
+def main():
+    if len(sys.argv) != 2:
+        print(f"Usage: {sys.argv[0]} <recording_dir>")
+        return 1
+    with Recording(sys.argv[1]) as rec:
+        span = rec.time_range()
+        print(f"INFO: frames={len(rec)} telemetry_rows={len(rec.telemetry_times)} events={len(rec.events)}")
+        if span:
+            print(f"INFO: time range {span[0]:.3f} - {span[1]:.3f} ({span[1] - span[0]:.1f}s)")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,242 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import os
+import struct
+import time
+from multiprocessing import shared_memory
+
+# Shared-memory state and frame bus between the simulator-owner process and
+# stateless HTTP workers (server.py, HAKO_SERVER_ROLE=owner/worker).
+#
+# Segment layout (little-endian):
+#   header      8s magic, u32 version, u32 slots, u32 slot capacity, u32 owner pid,
+#               u64 sequence of the latest committed frame
+#   state       u64 seqlock, then _STATE
+#   frame slots slots x (u64 seqlock, _SLOT, JPEG bytes up to slot capacity)
+#
+# There is one writer (the owner). Every block is guarded by a seqlock: the
+# writer makes the counter odd, writes, then makes it even again; a reader
+# copies the block and retries if the counter was odd or changed meanwhile.
+# Frames go to a ring of slots so readers copying the latest frame do not
+# collide with the writer filling the next one. Python has no memory fences;
+# this relies on stores becoming visible in program order (x86-64).
+
+_MAGIC = b'HKBUS\x00\x00\x01'
+_VERSION = 1
+_HEADER = struct.Struct('<8sIIIIQ')
+_SEQ = struct.Struct('<Q')
+_STATE = struct.Struct('<dBB6x7dQ')    # t, armed, flying, x y z, qw qx qy qz, updates
+_SLOT = struct.Struct('<QdI4x')        # frame sequence, t, length
+
+_HEADER_SIZE = 64
+_STATE_OFFSET = _HEADER_SIZE
+_SLOTS_OFFSET = _STATE_OFFSET + 128
+_LATEST_OFFSET = _HEADER.size - 8
+
+DEFAULT_SLOTS = 4
+DEFAULT_SLOT_CAPACITY = 1 << 20
+READ_RETRIES = 100
+
+
+class BusError(Exception):
+    pass
+
+
+def _slot_size(capacity):
+    return (_SEQ.size + _SLOT.size + capacity + 63) & ~63
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _attach(name):
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)   # Python 3.13+
+    except TypeError:
+        pass
+    shm = shared_memory.SharedMemory(name=name)
+    # before 3.13 the resource tracker of an attaching process unlinks the
+    # segment when that process exits; only the owner may remove it
+    try:
+        from multiprocessing import resource_tracker
+        resource_tracker.unregister(shm._name, 'shared_memory')
+    except Exception:
+        pass
+    return shm
+
+
+class BusWriter:
+    """
+    Owner side. Creates the segment (replacing one left behind by an owner
+    that died) and publishes state and JPEG frames. Frames larger than the
+    slot capacity are dropped and counted in oversize.
+    """
+    def __init__(self, name, slots=DEFAULT_SLOTS, slot_capacity=DEFAULT_SLOT_CAPACITY):
+        self.name = name
+        self.slots = slots
+        self.slot_capacity = slot_capacity
+        self.frames = 0
+        self.oversize = 0
+        self._updates = 0
+        self._slot_size = _slot_size(slot_capacity)
+        size = _SLOTS_OFFSET + slots * self._slot_size
+        try:
+            self._shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        except FileExistsError:
+            self._remove_stale(name)
+            self._shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        self._buf = self._shm.buf
+        self._buf[:_SLOTS_OFFSET] = bytes(_SLOTS_OFFSET)
+        _HEADER.pack_into(self._buf, 0, _MAGIC, _VERSION, slots, slot_capacity, os.getpid(), 0)
+
+    @staticmethod
+    def _remove_stale(name):
+        shm = _attach(name)
+        try:
+            magic, _, _, _, pid, _ = _HEADER.unpack_from(shm.buf, 0)
+            if magic == _MAGIC and pid != os.getpid() and _pid_alive(pid):
+                raise BusError(f"bus '{name}' is owned by running process {pid}")
+        finally:
+            shm.close()
+        shared_memory.SharedMemory(name=name).unlink()
+
+    def _begin(self, offset):
+        (seq,) = _SEQ.unpack_from(self._buf, offset)
+        _SEQ.pack_into(self._buf, offset, seq + 1)
+        return seq + 2
+
+    def publish_state(self, t, armed, flying, pose=None):
+        """
+        pose is a hakosim Pose (position/orientation); None stores zeros.
+        """
+        if pose is not None:
+            p = pose.position
+            q = pose.orientation
+            values = (p.x_val, p.y_val, p.z_val, q.w_val, q.x_val, q.y_val, q.z_val)
+        else:
+            values = (0.0,) * 7
+        self._updates += 1
+        end = self._begin(_STATE_OFFSET)
+        _STATE.pack_into(self._buf, _STATE_OFFSET + _SEQ.size, t, bool(armed), bool(flying), *values, self._updates)
+        _SEQ.pack_into(self._buf, _STATE_OFFSET, end)
+
+    def publish_frame(self, t, jpeg):
+        if len(jpeg) > self.slot_capacity:
+            self.oversize += 1
+            return False
+        self.frames += 1
+        offset = _SLOTS_OFFSET + (self.frames % self.slots) * self._slot_size
+        data = offset + _SEQ.size + _SLOT.size
+        end = self._begin(offset)
+        _SLOT.pack_into(self._buf, offset + _SEQ.size, self.frames, t, len(jpeg))
+        self._buf[data:data + len(jpeg)] = jpeg
+        _SEQ.pack_into(self._buf, offset, end)
+        # readers look for the newest frame here, so it moves only after the slot is complete
+        _SEQ.pack_into(self._buf, _LATEST_OFFSET, self.frames)
+        return True
+
+    def close(self):
+        self._buf = None
+        self._shm.close()
+        try:
+            self._shm.unlink()
+        except FileNotFoundError:
+            pass
+
+
+class BusReader:
+    """
+    Worker side. Attaches to an existing segment; safe to share between
+    threads. The last frame read is kept, so any number of viewers in one
+    process cost a single copy per new frame.
+    """
+    def __init__(self, name):
+        self.name = name
+        self.retries = 0
+        self._shm = _attach(name)
+        self._buf = self._shm.buf
+        magic, version, self.slots, self.slot_capacity, self.owner_pid, _ = _HEADER.unpack_from(self._buf, 0)
+        if magic != _MAGIC or version != _VERSION:
+            self.close()
+            raise BusError(f"'{name}' is not a hakoniwa bus segment (version {_VERSION})")
+        self._slot_size = _slot_size(self.slot_capacity)
+        self._frame = (0, None, 0.0)
+
+    @classmethod
+    def wait(cls, name, timeout_sec=10.0, interval_sec=0.2):
+        """
+        Attaches once the owner has created the segment, or raises BusError.
+        """
+        deadline = time.monotonic() + timeout_sec
+        while True:
+            try:
+                return cls(name)
+            except FileNotFoundError:
+                if time.monotonic() >= deadline:
+                    raise BusError(f"bus '{name}' not found after {timeout_sec:.0f}s; is the owner running?")
+                time.sleep(interval_sec)
+
+    def close(self):
+        self._buf = None
+        self._shm.close()
+
+    def owner_alive(self):
+        return _pid_alive(self.owner_pid)
+
+    def _read(self, offset, copy):
+        buf = self._buf
+        for _ in range(READ_RETRIES):
+            (start,) = _SEQ.unpack_from(buf, offset)
+            if start & 1:
+                self.retries += 1
+                time.sleep(0)
+                continue
+            value = copy(buf, offset + _SEQ.size)
+            (end,) = _SEQ.unpack_from(buf, offset)
+            if start == end:
+                return value
+            self.retries += 1
+        return None
+
+    def read_state(self):
+        """
+        Latest published state as a dict, or None before the first update.
+        """
+        values = self._read(_STATE_OFFSET, _STATE.unpack_from)
+        if values is None or values[-1] == 0:
+            return None
+        t, armed, flying, x, y, z, qw, qx, qy, qz, updates = values
+        return {'t': t, 'armed': bool(armed), 'flying': bool(flying), 'x': x, 'y': y, 'z': z,
+                'qw': qw, 'qx': qx, 'qy': qy, 'qz': qz, 'updates': updates}
+
+    def latest_frame(self):
+        """
+        (frame sequence, JPEG bytes, capture time) of the newest frame;
+        (0, None, 0.0) before the first one.
+        """
+        for _ in range(READ_RETRIES):
+            (latest,) = _SEQ.unpack_from(self._buf, _LATEST_OFFSET)
+            cached = self._frame
+            if latest == cached[0]:
+                return cached
+            offset = _SLOTS_OFFSET + (latest % self.slots) * self._slot_size
+
+            def copy(buf, pos):
+                seq, t, length = _SLOT.unpack_from(buf, pos)
+                data = pos + _SLOT.size
+                return seq, bytes(buf[data:data + min(length, self.slot_capacity)]), t
+
+            frame = self._read(offset, copy)
+            # if this reader fell a full ring behind, the slot already holds a newer frame, which is fine
+            if frame is not None and frame[0] >= latest:
+                self._frame = frame
+                return frame
+        return self._frame
@@ -0,0 +1,59 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import time
+
+
+def _process_age_sec():
+    """
+    Seconds since the process was started (Linux /proc only), so the report
+    also covers interpreter start-up before the first import of this module.
+    """
+    try:
+        with open("/proc/self/stat") as f:
+            start_ticks = int(f.read().rsplit(')', 1)[1].split()[19])
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+        return uptime - start_ticks / os.sysconf('SC_CLK_TCK')
+    except (OSError, IndexError, ValueError):
+        return None
+
+
+class StartupTimer:
+    """
+    Collects the duration of named start-up phases and prints them once.
+
+        timer = StartupTimer("server")
+        import heavy_module
+        timer.mark("import heavy_module")
+        ...
+        timer.report()
+
+    Set HAKO_STARTUP_REPORT=0 to silence the report.
+    """
+    def __init__(self, name):
+        self.name = name
+        self.t0 = time.perf_counter()
+        self.pre_sec = _process_age_sec()
+        self.phases = []
+        self._last = self.t0
+        self.reported = False
+
+    def mark(self, phase):
+        now = time.perf_counter()
+        self.phases.append((phase, now - self._last))
+        self._last = now
+
+    def total_sec(self):
+        return self._last - self.t0
+
+    def report(self):
+        if self.reported or os.getenv("HAKO_STARTUP_REPORT", "1") == "0":
+            return
+        self.reported = True
+        parts = [f"{phase}={sec * 1000:.0f}ms" for phase, sec in self.phases]
+        pre = f" (+{self.pre_sec * 1000:.0f}ms before timer)" if self.pre_sec is not None else ""
+        print(f"INFO: {self.name} startup {self.total_sec() * 1000:.0f}ms{pre}: " + " ".join(parts),
+              file=sys.stderr)
@@ -0,0 +1,134 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import asyncio
+import time
+from collections import deque
+from drone_utils.async_client import AsyncMultirotorClient
+
+
+class VehicleState:
+    def __init__(self, name):
+        self.name = name
+        self.position = None
+        self.steps = deque()
+        self.handle = None
+        self.completed = 0
+        self.failed = 0
+
+    def idle(self):
+        return self.handle is None and not self.steps
+
+
+class SwarmCoordinator:
+    """
+    Drives N vehicles from one client connection and one event loop.
+
+    Every tick the coordinator reads all vehicle poses in a single sweep,
+    resolves finished commands with those poses and then dispatches the
+    next queued step of every idle vehicle.
+    """
+    def __init__(self, client, vehicle_names=None, rate_hz=20, timeout_sec=60.0):
+        self.client = client
+        self.period = 1.0 / rate_hz
+        self.motion = AsyncMultirotorClient(client, poll_interval=self.period, timeout_sec=timeout_sec, auto_poll=False)
+        if vehicle_names is None:
+            vehicle_names = list(client.vehicles.keys())
+        self.vehicles = {name: VehicleState(name) for name in vehicle_names}
+        self.ticks = 0
+        self.overruns = 0
+
+    def add_vehicle(self, name):
+        if name not in self.vehicles:
+            self.vehicles[name] = VehicleState(name)
+        return self.vehicles[name]
+
+    def enqueue(self, name, kind, *args, **kwargs):
+        """
+        Queues a step for a vehicle: kind is 'takeoff', 'move', 'land' or 'grab'.
+        """
+        if kind not in ('takeoff', 'move', 'land', 'grab'):
+            raise ValueError(f"unknown step kind: {kind}")
+        self.vehicles[name].steps.append((kind, args, kwargs))
+        return self
+
+    def takeoff(self, name, height, speed=5):
+        return self.enqueue(name, 'takeoff', height, speed)
+
+    def move(self, name, x, y, z, speed, yaw_deg=None):
+        return self.enqueue(name, 'move', x, y, z, speed, yaw_deg)
+
+    def land(self, name, speed=5):
+        return self.enqueue(name, 'land', speed)
+
+    def grab_baggage(self, name, grab):
+        return self.enqueue(name, 'grab', grab)
+
+    def _sweep(self):
+        positions = {}
+        for name, state in self.vehicles.items():
+            state.position = self.motion._position(name)
+            positions[name] = state.position
+        return positions
+
+    def _dispatch(self, state: VehicleState):
+        kind, args, kwargs = state.steps.popleft()
+        if kind == 'takeoff':
+            state.handle = self.motion.takeoff(*args, vehicle_name=state.name, **kwargs)
+        elif kind == 'move':
+            state.handle = self.motion.moveToPosition(*args, vehicle_name=state.name, **kwargs)
+        elif kind == 'land':
+            state.handle = self.motion.land(*args, vehicle_name=state.name, **kwargs)
+        else:
+            state.handle = asyncio.ensure_future(self.motion.grab_baggage(*args, vehicle_name=state.name))
+
+    def _collect(self, state: VehicleState):
+        handle = state.handle
+        if handle is None or not handle.done():
+            return
+        state.handle = None
+        future = handle.future if hasattr(handle, 'future') else handle
+        if future.cancelled() or future.exception() is not None or future.result() is False:
+            state.failed += 1
+        else:
+            state.completed += 1
+
+    def tick(self):
+        self.ticks += 1
+        positions = self._sweep()
+        self.motion.poll_once(positions)
+        for state in self.vehicles.values():
+            self._collect(state)
+            if state.handle is None and state.steps:
+                self._dispatch(state)
+
+    def idle(self):
+        return all(state.idle() for state in self.vehicles.values())
+
+    async def run(self, until_idle=True):
+        """
+        Runs the scheduler at rate_hz; returns when every queue is empty
+        (until_idle) or when cancelled.
+        """
+        next_time = time.perf_counter()
+        while True:
+            try:
+                self.tick()
+            except Exception as e:
+                print(f"ERROR: swarm tick: {e}")
+            if until_idle and self.idle():
+                break
+            next_time += self.period
+            delay = next_time - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            else:
+                self.overruns += 1
+                next_time = time.perf_counter()
+                await asyncio.sleep(0)
+        await self.motion.stop()
+
+    def report(self):
+        print(f"INFO: swarm ticks={self.ticks} overruns={self.overruns}")
+        for state in self.vehicles.values():
+            print(f"INFO: {state.name}: completed={state.completed} failed={state.failed} pending={len(state.steps)}")
@@ -0,0 +1,158 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import itertools
+import json
+import os
+import signal
+import threading
+import time
+
+# Opt-in timing spans for the control and camera hot paths.
+#
+#   from drone_utils import trace
+#   with trace.span("sync.run_nowait"):
+#       client.run_nowait()
+#
+# Spans are recorded only after enable() (or with HAKO_TRACE=1 in the
+# environment). While disabled, trace.span is bound to a function returning
+# a shared no-op context manager, so an instrumented loop pays one call and
+# two empty method calls per span. Recorded spans go to a fixed-size ring
+# buffer and can be dumped as Chrome trace-event JSON (chrome://tracing,
+# Perfetto).
+
+DEFAULT_CAPACITY = 65536
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+def _null_span(name):
+    return _NULL_SPAN
+
+
+class _Span:
+    __slots__ = ('name', 't0')
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.t0 = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        t1 = time.perf_counter_ns()
+        _ring[next(_index) % _capacity] = (self.name, threading.get_ident(), self.t0, t1 - self.t0)
+        return False
+
+
+span = _null_span
+_capacity = DEFAULT_CAPACITY
+_ring = []
+_index = itertools.count()
+_origin_ns = time.perf_counter_ns()
+
+
+def enabled() -> bool:
+    return span is not _null_span
+
+
+def enable(capacity: int = DEFAULT_CAPACITY):
+    """
+    Starts recording into a new ring buffer holding the last `capacity` spans.
+    """
+    global span, _capacity, _ring, _index
+    _capacity = max(1, int(capacity))
+    _ring = [None] * _capacity
+    _index = itertools.count()
+    span = _Span
+
+
+def disable():
+    global span
+    span = _null_span
+
+
+def record(name, start_ns, duration_ns):
+    """
+    Adds a span measured by the caller (perf_counter_ns clock).
+    """
+    if enabled():
+        _ring[next(_index) % _capacity] = (name, threading.get_ident(), start_ns, duration_ns)
+
+
+def spans():
+    """
+    Recorded spans, oldest first, as (name, thread_id, start_ns, duration_ns).
+    """
+    return sorted((s for s in list(_ring) if s is not None), key=lambda s: s[2])
+
+
+def chrome_trace() -> dict:
+    pid = os.getpid()
+    names = {t.ident: t.name for t in threading.enumerate()}
+    events = []
+    tids = set()
+    for name, tid, start_ns, duration_ns in spans():
+        tids.add(tid)
+        events.append({'name': name, 'ph': 'X', 'pid': pid, 'tid': tid,
+                       'ts': (start_ns - _origin_ns) / 1000.0, 'dur': duration_ns / 1000.0})
+    for tid in tids:
+        events.append({'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid,
+                       'args': {'name': names.get(tid, str(tid))}})
+    return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+
+def dump(path: str) -> str:
+    with open(path, 'w') as f:
+        json.dump(chrome_trace(), f)
+    return path
+
+
+def default_path(prefix: str = 'hako_trace') -> str:
+    return os.getenv('HAKO_TRACE_PATH') or f"{prefix}_{os.getpid()}_{int(time.time())}.json"
+
+
+def install_signal_handler(signum=None, prefix: str = 'hako_trace'):
+    """
+    Dumps the ring buffer to default_path() on SIGUSR1 (or `signum`).
+    Does nothing where the signal does not exist (Windows) or off the main
+    thread.
+    """
+    signum = signum if signum is not None else getattr(signal, 'SIGUSR1', None)
+    if signum is None:
+        return False
+
+    def handler(sig, frame):
+        path = dump(default_path(prefix))
+        print(f"INFO: trace written to {path}")
+
+    try:
+        signal.signal(signum, handler)
+    except ValueError:
+        return False
+    return True
+
+
+def configure_from_env(prefix: str = 'hako_trace') -> bool:
+    """
+    Enables tracing when HAKO_TRACE is set (its value, if numeric, is the
+    ring capacity) and installs the dump signal handler.
+    """
+    value = os.getenv('HAKO_TRACE')
+    if not value or value == '0':
+        return False
+    enable(int(value) if value.isdigit() and int(value) > 1 else DEFAULT_CAPACITY)
+    install_signal_handler(prefix=prefix)
+    return True
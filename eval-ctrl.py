@@ -3,19 +3,31 @@
 
 import sys
 import hakopy
-import hako_pdu
 import libs.hakosim as hakosim
 import libs.pdu_info as pdu_info
+from drone_utils.geometry import yaw_deg
+from drone_utils import trace
+from drone_utils.pdu_manager import get_pdu_manager
 import os
 import time
 
 config_path = ''
 
+# Simulation-time budget of each control phase [usec] when no stop time is given,
+# and convergence tolerances.
+# Override with EVAL_PHASE_BUDGET_SEC / EVAL_POS_TOLERANCE / EVAL_VEL_TOLERANCE.
+PHASE_BUDGET_USEC = int(float(os.getenv('EVAL_PHASE_BUDGET_SEC', '60')) * 1_000_000)
+POS_TOLERANCE = float(os.getenv('EVAL_POS_TOLERANCE', '0.1'))
+VEL_TOLERANCE = float(os.getenv('EVAL_VEL_TOLERANCE', '0.01'))
+CONVERGE_TICKS = 10
+CONTROL_PERIOD_USEC = 30000
+
 def my_on_initialize(context):
     global config_path
     robot_name = 'Drone'
     hako_binary_path = os.getenv('HAKO_BINARY_PATH', '/usr/local/lib/hakoniwa/hako_binary/offset')
-    pdu_manager = hako_pdu.HakoPduManager(hako_binary_path, config_path)
+    # same instance as client.pdu_manager, so the config is parsed only once
+    pdu_manager = get_pdu_manager(hako_binary_path, config_path)
     pdu = pdu_manager.get_pdu(robot_name, pdu_info.HAKO_AVATAR_CHANNLE_ID_COLLISION)
     pdu_data = pdu.get()
     pdu_data['collision'] = False
@@ -57,24 +69,85 @@ def button_event(client, index):
     data['button'][index] = False
     client.putGameJoystickData(data)
 
-def takeoff(client, height):
+class AxisWriter:
+    """
+    Keeps the last joystick axis values written and only touches the PDU
+    when one of them actually changes.
+    """
+    def __init__(self, client):
+        self.client = client
+        self.axis = None
+        self.write_count = 0
+
+    def write(self, heading=0.0, up_down=0.0, roll=0.0, pitch=0.0):
+        values = [heading, up_down, roll, pitch]
+        if values == self.axis:
+            return False
+        data = self.client.getGameJoystickData()
+        data['axis'] = list(data['axis'])
+        data['axis'][0:4] = values
+        self.client.putGameJoystickData(data)
+        self.axis = values
+        self.write_count += 1
+        return True
+
+axis_writer = None
+
+def phase_deadline(budget_usec = None):
+    """
+    Returns the simulation time [usec] at which the current phase must end:
+    the evaluation stop time when one was given on the command line, otherwise
+    the phase budget from now.
+    """
+    stop_time = target_values.stop_time_usec
+    if stop_time > 0:
+        return stop_time
+    if budget_usec is None:
+        budget_usec = PHASE_BUDGET_USEC
+    return hakopy.simulation_time() + budget_usec
+
+class ConvergenceMonitor:
+    """
+    Reports convergence once the pose has stayed within the tolerances
+    for CONVERGE_TICKS consecutive control periods.
+    """
+    def __init__(self, target = None, pos_tolerance = POS_TOLERANCE, vel_tolerance = VEL_TOLERANCE):
+        self.target = target
+        self.pos_tolerance = pos_tolerance
+        self.vel_tolerance = vel_tolerance
+        self.last = None
+        self.count = 0
+
+    def update(self, pose):
+        p = (pose.position.x_val, pose.position.y_val, pose.position.z_val)
+        ok = True
+        if self.target is not None:
+            ok = all(abs(p[i] - self.target[i]) <= self.pos_tolerance for i in range(len(self.target)))
+        if self.last is not None:
+            step = max(abs(p[i] - self.last[i]) for i in range(3))
+            ok = ok and (step <= self.vel_tolerance * CONTROL_PERIOD_USEC * 1e-06)
+        else:
+            ok = False
+        self.last = p
+        self.count = self.count + 1 if ok else 0
+        return self.count >= CONVERGE_TICKS
+
+def takeoff(client, height, budget_usec = None):
     print("START TAKEOFF: ", height)
+    deadline = phase_deadline(budget_usec)
     pose = client.simGetVehiclePose()
     while (pose.position.z_val) < height:
-        pose = client.simGetVehiclePose()
-        data = client.getGameJoystickData()
-        data['axis'] = list(data['axis']) 
-        data['axis'][1] = -0.5
-        #data['axis'][0] = 1.0 #heading
-        #data['axis'][2] = 1.0 #vy
-        #data['axis'][3] = 1.0 #vx
-        client.putGameJoystickData(data)
-        hakopy.usleep(30000)
+        with trace.span("takeoff.write"):
+            axis_writer.write(up_down=-0.5)
+        with trace.span("takeoff.usleep"):
+            hakopy.usleep(CONTROL_PERIOD_USEC)
+        if hakopy.simulation_time() >= deadline:
+            print("WARNING: takeoff budget expired")
+            break
+        with trace.span("takeoff.simGetVehiclePose"):
+            pose = client.simGetVehiclePose()
 
-    data = client.getGameJoystickData()
-    data['axis'] = list(data['axis']) 
-    data['axis'][1] = 0
-    client.putGameJoystickData(data)
+    axis_writer.write()
     print("DONE")
 
 def reply_and_wait_res(command):
@@ -101,7 +174,7 @@ def takeoff_wait(client, height):
     command, pdu_cmd = client.get_packet(pdu_info.HAKO_AVATAR_CHANNEL_ID_CMD_TAKEOFF, client.get_vehicle_name(client.default_drone_name))
     pdu_cmd['height'] = height
     pdu_cmd['speed'] = 5
-    pdu_cmd['yaw_deg'] = client._get_yaw_degree(client.default_drone_name)
+    pdu_cmd['yaw_deg'] = yaw_deg(client.simGetVehiclePose().orientation)
     return reply_and_wait_res(command)
 
 def almost_equal_deg(target_deg, real_deg, diff_deg):
@@ -110,61 +183,58 @@ def almost_equal_deg(target_deg, real_deg, diff_deg):
     else:
         return False
 
-def stop_control(client):
-    while True:
-        data = client.getGameJoystickData()
-        data['axis'] = list(data['axis'])
-        data['axis'][0] = 0.0 #heading
-        data['axis'][1] = 0.0 #up/down
-        data['axis'][2] = 0.0
-        data['axis'][3] = 0.0
-        client.putGameJoystickData(data)
-        hakopy.usleep(30000)
+def stop_control(client, budget_usec = None):
+    deadline = phase_deadline(budget_usec)
+    monitor = ConvergenceMonitor()
+    axis_writer.write()
+    while hakopy.simulation_time() < deadline:
+        with trace.span("stop_control.usleep"):
+            hakopy.usleep(CONTROL_PERIOD_USEC)
+        with trace.span("stop_control.update"):
+            converged = monitor.update(client.simGetVehiclePose())
+        if converged:
+            print("INFO: stop control converged")
+            break
+    print(f"INFO: stop control exit (pdu writes: {axis_writer.write_count})")
 
-def do_control(client, v1 = 0, v2 = 0, type = 'angular'):
+def do_control(client, v1 = 0, v2 = 0, type = 'angular', budget_usec = None):
     global target_values
     print(f"START CONTROL: v1({v1}) v2({v2})")
+    deadline = phase_deadline(budget_usec)
+    roll = 0.0
+    pitch = 0.0
+    if v1 > 0:
+        if type == 'angular':
+            roll = target_values.get_ctrl_value('Rx')
+        elif type == 'speed':
+            pitch = -target_values.get_ctrl_value('Vx')
+    elif v1 < 0:
+        if type == 'angular':
+            roll = -target_values.get_ctrl_value('Rx')
+        elif type == 'speed':
+            pitch = target_values.get_ctrl_value('Vx')
+
+    if v2 > 0:
+        if type == 'angular':
+            pitch = -target_values.get_ctrl_value('Ry')
+        elif type == 'speed':
+            roll = target_values.get_ctrl_value('Vy')
+    elif v2 < 0:
+        if type == 'angular':
+            pitch = target_values.get_ctrl_value('Ry')
+        elif type == 'speed':
+            roll = -target_values.get_ctrl_value('Vy')
+    #print("axis2: ", roll)
+    #print("axis3: ", pitch)
     while True:
-        data = client.getGameJoystickData()
-        data['axis'] = list(data['axis'])
-        data['axis'][0] = 0.0 #heading
-        data['axis'][1] = 0.0 #up/down
-        #data['axis'][2] = 0.0 #roll
-        #print(f"v1: {v1}, v2: {v2}")
-        #print("vx: ",  target_values.get_ctrl_value('Vx'))
-        #print("vy: ",  target_values.get_ctrl_value('Vy'))
-
-        data['axis'][2] = 0.0
-        data['axis'][3] = 0.0
-        if v1 > 0:
-            if type == 'angular':
-                data['axis'][2] = target_values.get_ctrl_value('Rx')
-            elif type == 'speed':
-                data['axis'][3] = -target_values.get_ctrl_value('Vx')
-        elif v1 < 0:
-            if type == 'angular':
-                data['axis'][2] = -target_values.get_ctrl_value('Rx')
-            elif type == 'speed':
-                data['axis'][3] = target_values.get_ctrl_value('Vx')
-
-        if v2 > 0:
-            if type == 'angular':
-                data['axis'][3] = -target_values.get_ctrl_value('Ry')
-            elif type == 'speed':
-                data['axis'][2] = target_values.get_ctrl_value('Vy')
-        elif v2 < 0:
-            if type == 'angular':
-                data['axis'][3] = target_values.get_ctrl_value('Ry')
-            elif type == 'speed':
-                data['axis'][2] = -target_values.get_ctrl_value('Vy')
-        #print("axis2: ", data['axis'][2])
-        #print("axis3: ", data['axis'][3])
-        client.putGameJoystickData(data)
-        hakopy.usleep(30000)
+        # the target does not change during the phase, so this only hits the PDU once
+        with trace.span("do_control.write"):
+            axis_writer.write(roll=roll, pitch=pitch)
+        with trace.span("do_control.usleep"):
+            hakopy.usleep(CONTROL_PERIOD_USEC)
 
-        stop_time = target_values.stop_time_usec
-        if (stop_time > 0) and (hakopy.simulation_time() >= stop_time):
-            break 
+        if hakopy.simulation_time() >= deadline:
+            break
 
 pdu_manager = None
 client = None
@@ -207,9 +277,10 @@ class TargetValues:
 
 target_values = TargetValues()
 
-def pos_control(client, X = 0, Y = 0, speed = 5):
+def pos_control(client, X = 0, Y = 0, speed = 5, budget_usec = None):
     global target_values
     print(f"START CONTROL: X({X}) Y({Y}) S({speed})")
+    deadline = phase_deadline(budget_usec)
     #call api
     pose = client.simGetVehiclePose()
     command, pdu_cmd = client.get_packet(pdu_info.HAKO_AVATAR_CHANNEL_ID_CMD_MOVE, client.get_vehicle_name(client.default_drone_name))
@@ -220,18 +291,23 @@ def pos_control(client, X = 0, Y = 0, speed = 5):
     pdu_cmd['yaw_deg'] = 0
     reply_and_wait_res(command)
     print("reply done")
-    while True:
-        hakopy.usleep(30000)
-
-        stop_time = target_values.stop_time_usec
-        if (stop_time > 0) and (hakopy.simulation_time() >= stop_time):
-            break 
+    monitor = ConvergenceMonitor(target=(X, Y))
+    while hakopy.simulation_time() < deadline:
+        with trace.span("pos_control.usleep"):
+            hakopy.usleep(CONTROL_PERIOD_USEC)
+        with trace.span("pos_control.update"):
+            converged = monitor.update(client.simGetVehiclePose())
+        if converged:
+            print("INFO: pos control converged")
+            break
 
 def my_on_manual_timing_control(context):
     global pdu_manager
     global client
     global target_values
+    global axis_writer
     print("INFO: on_manual_timing_control enter")
+    axis_writer = AxisWriter(client)
 
     # takeoff
     if (target_values.has_key('X')):
@@ -273,6 +349,8 @@ def my_on_manual_timing_control(context):
     #for _ in range(0,3):
     #    # sleep 1sec
     #    hakopy.usleep(1000000)
+    if trace.enabled():
+        print(f"INFO: trace written to {trace.dump(trace.default_path('eval_trace'))}")
     print("INFO: on_manual_timing_control exit")
     return 0
 
@@ -322,10 +400,14 @@ def main():
         else:
             target_values.set_target('S', 5)
 
+    if trace.configure_from_env(prefix="eval_trace"):
+        print("INFO: timing trace enabled (dump with SIGUSR1 or at the end of the run)")
+
     # connect to the HakoSim simulator
     client = hakosim.MultirotorClient(config_path)
     client.default_drone_name = "Drone"
-    client.pdu_manager = hako_pdu.HakoPduManager('/usr/local/lib/hakoniwa/hako_binary/offset', config_path)
+    hako_binary_path = os.getenv('HAKO_BINARY_PATH', '/usr/local/lib/hakoniwa/hako_binary/offset')
+    client.pdu_manager = get_pdu_manager(hako_binary_path, config_path)
     client.enableApiControl(True)
     client.armDisarm(True)
 
@@ -3,24 +3,30 @@
 
 import sys
 import asyncio
-import pygame
 import time
 import os
 import argparse
 import base64
+from typing import TYPE_CHECKING
+from drone_utils.startup import StartupTimer
+startup_timer = StartupTimer("rc-custom-pdu")
 from rc_utils.rc_utils import RcConfig, StickMonitor
-from hakoniwa_pdu.pdu_manager import PduManager
-from hakoniwa_pdu.impl.websocket_communication_service import WebSocketCommunicationService
+from drone_utils import trace
+if TYPE_CHECKING:
+    from hakoniwa_pdu.pdu_manager import PduManager
+
+# pygame と PDU マネージャは引数・設定ファイルの確認後に読み込む (main)
+pygame = None
 
 # デフォルトのJSONファイルパス
 DEFAULT_CONFIG_PATH = "rc_config/ps4-control.json"
 
-async def send_pdu(manager: PduManager, robot_name: str, data: dict):
+async def send_pdu(manager: "PduManager", robot_name: str, data: dict):
     binary = manager.pdu_convertor.convert_json_to_binary(robot_name, "hako_cmd_game", data)
     await manager.flush_pdu_raw_data(robot_name, "hako_cmd_game", binary)
 
 
-async def read_pdu_on_demand(manager: PduManager, robot_name: str, pdu_name: str) -> dict:
+async def read_pdu_on_demand(manager: "PduManager", robot_name: str, pdu_name: str) -> dict:
     binary_data = await manager.request_pdu_read(robot_name, pdu_name)
     if binary_data is None:
         print(f"[ERROR] Failed to read PDU data for {robot_name}/{pdu_name}")
@@ -90,7 +96,7 @@ def save_pdu_to_file(task: asyncio.Task):
     print(f"[INFO] PDU data saved to {filename}")
 
 
-async def joystick_control(manager: PduManager, robot_name: str, joystick, stick_monitor: StickMonitor):
+async def joystick_control(manager: "PduManager", robot_name: str, joystick, stick_monitor: StickMonitor):
     try:
         if not await manager.declare_pdu_for_write(robot_name, "hako_cmd_game"):
             raise RuntimeError(f"[FAIL] Could not declare PDU for WRITE: {robot_name}/hako_cmd_game")
@@ -104,15 +110,17 @@ async def joystick_control(manager: PduManager, robot_name: str, joystick, stick
             start_time = time.perf_counter()
 
             camera_shot_triggered = False
-            for event in pygame.event.get():
-                if process_joystick_event(event, data, stick_monitor):
-                    camera_shot_triggered = True
+            with trace.span("rc.events"):
+                for event in pygame.event.get():
+                    if process_joystick_event(event, data, stick_monitor):
+                        camera_shot_triggered = True
 
             if camera_shot_triggered:
                 task = asyncio.create_task(delayed_read_pdu(manager, robot_name, "hako_camera_data", 2.0))
                 task.add_done_callback(save_pdu_to_file)
 
-            await send_pdu(manager, robot_name, data)
+            with trace.span("rc.send_pdu"):
+                await send_pdu(manager, robot_name, data)
 
             # 次の予定時刻までの残り時間をsleep
             next_time += period
@@ -126,6 +134,8 @@ async def joystick_control(manager: PduManager, robot_name: str, joystick, stick
     except KeyboardInterrupt:
         pygame.joystick.quit()
         pygame.quit()
+        if trace.enabled():
+            print(f"INFO: trace written to {trace.dump(trace.default_path('rc_trace'))}")
 
 
 
@@ -139,6 +149,8 @@ async def main():
     args = parser.parse_args()
 
     print(f"Config Path: {args.config}")
+    if trace.configure_from_env(prefix="rc_trace"):
+        print("INFO: timing trace enabled (dump with SIGUSR1 or on exit)")
 
     robot_name = args.name if args.name else "Drone"
     
@@ -160,7 +172,13 @@ async def main():
     print("Controller: ", rc_config_path)
     print("Mode: ", rc_config.config['mode'])
     stick_monitor = StickMonitor(rc_config)
+    startup_timer.mark("config")
 
+    global pygame
+    import pygame
+    from hakoniwa_pdu.impl.websocket_communication_service import WebSocketCommunicationService
+    from drone_utils.pdu_manager import create_pdu_manager
+    startup_timer.mark("import_runtime")
     pygame.init()
     pygame.joystick.init()
 
@@ -181,14 +199,16 @@ async def main():
     # 通信サービス（WebSocket）を生成
     service = WebSocketCommunicationService()
 
-    # PDUマネージャ初期化
-    manager = PduManager()
-    manager.initialize(config_path=args.config, comm_service=service)
+    # PDUマネージャ初期化（チャネル設定とオフセット表はディスクキャッシュから読む）
+    manager = create_pdu_manager(args.config, service)
+    startup_timer.mark("pdu_tables")
 
     # 通信開始
     if not await manager.start_service(args.uri):
         print("[ERROR] Failed to start communication service.")
         sys.exit(1)
+    startup_timer.mark("connect")
+    startup_timer.report()
 
 
     try:
@@ -2,32 +2,48 @@
 # -*- coding: utf-8 -*-
 
 import sys
-import libs.hakosim as hakosim
-from hakoniwa_pdu.pdu_msgs.hako_msgs.pdu_pytype_GameControllerOperation import GameControllerOperation
-import pygame
 import time
 import os
 import argparse
+from typing import TYPE_CHECKING
+from drone_utils.startup import StartupTimer
+startup_timer = StartupTimer("rc-custom")
 from rc_utils.rc_utils import RcConfig, StickMonitor
+from drone_utils import trace
 #from return_to_home import DroneController
+if TYPE_CHECKING:
+    from hakoniwa_pdu.pdu_msgs.hako_msgs.pdu_pytype_GameControllerOperation import GameControllerOperation
+
+# pygame と hakosim は引数・設定ファイルの確認後に読み込む (_import_runtime)
+hakosim = None
+pygame = None
 
 # デフォルトのJSONファイルパス
 DEFAULT_CONFIG_PATH = "rc_config/ps4-control.json"
 
+def _import_runtime():
+    global hakosim, pygame
+    import libs.hakosim as hakosim
+    import pygame
+
 def saveCameraImage(client):
     png_image = client.simGetImage("0", hakosim.ImageType.Scene)
     if png_image:
         with open("scene.png", "wb") as f:
             f.write(png_image)
 
-def joystick_control(client: hakosim.MultirotorClient, joystick, stick_monitor: StickMonitor):
+def joystick_control(client: "hakosim.MultirotorClient", joystick, stick_monitor: StickMonitor):
     try:
         while True:
-            client.run_nowait()
-            data : GameControllerOperation = client.getGameJoystickData()
+            with trace.span("rc.run_nowait"):
+                client.run_nowait()
+            with trace.span("rc.getGameJoystickData"):
+                data : GameControllerOperation = client.getGameJoystickData()
             data.axis = list(data.axis)
             data.button = list(data.button)
-            for event in pygame.event.get():
+            with trace.span("rc.events"):
+                events = pygame.event.get()
+            for event in events:
                 if event.type == pygame.JOYAXISMOTION:
                     if event.axis < 6:
                         op_index = stick_monitor.rc_config.get_op_index(event.axis)
@@ -52,10 +68,13 @@ def joystick_control(client: hakosim.MultirotorClient, joystick, stick_monitor:
                     else:
                         print(f'ERROR: not supported button index: {event.button}')
             #print("data: button", data['button'])
-            client.putGameJoystickData(data)
+            with trace.span("rc.putGameJoystickData"):
+                client.putGameJoystickData(data)
     except KeyboardInterrupt:
         pygame.joystick.quit()
         pygame.quit()
+        if trace.enabled():
+            print(f"INFO: trace written to {trace.dump(trace.default_path('rc_trace'))}")
 
 def main():
     parser = argparse.ArgumentParser(description="Drone RC")
@@ -66,6 +85,8 @@ def main():
     args = parser.parse_args()
 
     print(f"Config Path: {args.config_path}")
+    if trace.configure_from_env(prefix="rc_trace"):
+        print("INFO: timing trace enabled (dump with SIGUSR1 or on exit)")
     
     config_path = args.config_path
     rc_config_path = os.getenv("RC_CONFIG_PATH", DEFAULT_CONFIG_PATH)
@@ -85,7 +106,10 @@ def main():
     print("Controller: ", rc_config_path)
     print("Mode: ", rc_config.config['mode'])
     stick_monitor = StickMonitor(rc_config)
+    startup_timer.mark("config")
 
+    _import_runtime()
+    startup_timer.mark("import_runtime")
     pygame.init()
     pygame.joystick.init()
 
@@ -103,6 +127,10 @@ def main():
         return 1
 
     client = hakosim.MultirotorClient(config_path)
+    # PDU のオフセット表はディスクキャッシュから読む
+    from drone_utils.pdu_manager import use_cached_offsets
+    use_cached_offsets(client.pdu_manager, config_path)
+    startup_timer.mark("pdu_tables")
     if args.name:
         print(f"Name: {args.name}")
         client.default_drone_name = args.name
@@ -111,6 +139,8 @@ def main():
     client.confirmConnection()
     client.enableApiControl(True)
     client.armDisarm(True)
+    startup_timer.mark("connect")
+    startup_timer.report()
     joystick_control(client, joystick, stick_monitor)
     return 0
 
@@ -8,6 +8,185 @@ import libs.pdu_info as pdu_info
 # Declare the global variable for delta_time_usec
 delta_time_usec = 0
 config_path = ''
+pacer = None
+
+# interval of the pacing report [sec, wall time]
+REPORT_INTERVAL_SEC = 10.0
+# if the simulation falls behind by more than this, the deadline is re-based
+# instead of running the missed steps back-to-back
+MAX_LAG_SEC = 0.5
+# the last part of every wait is spin-waited instead of slept, because
+# time.sleep() overshoots by up to a millisecond on Linux.
+# Override with HAKO_SYNC_SPIN_USEC (0 disables spinning).
+SPIN_BUDGET_USEC = int(os.getenv('HAKO_SYNC_SPIN_USEC', '1500'))
+
+
+class Histogram:
+    """
+    Fixed-bucket histogram of durations in microseconds.
+    """
+    BUCKETS_USEC = [10, 50, 100, 250, 500, 1000, 2000, 5000, 10000]
+
+    def __init__(self, name: str):
+        self.name = name
+        self.reset()
+
+    def reset(self):
+        self.counts = [0] * (len(self.BUCKETS_USEC) + 1)
+        self.count = 0
+        self.sum_usec = 0.0
+        self.max_usec = 0.0
+
+    def add(self, value_usec: float):
+        index = len(self.BUCKETS_USEC)
+        for i, upper in enumerate(self.BUCKETS_USEC):
+            if value_usec <= upper:
+                index = i
+                break
+        self.counts[index] += 1
+        self.count += 1
+        self.sum_usec += value_usec
+        self.max_usec = max(self.max_usec, value_usec)
+
+    def mean_usec(self):
+        return (self.sum_usec / self.count) if self.count > 0 else 0.0
+
+    def to_dict(self):
+        labels = [f"<={b}us" for b in self.BUCKETS_USEC] + [f">{self.BUCKETS_USEC[-1]}us"]
+        return {
+            'count': self.count,
+            'mean_usec': self.mean_usec(),
+            'max_usec': self.max_usec,
+            'buckets': dict(zip(labels, self.counts)),
+        }
+
+    def report(self):
+        buckets = ' '.join(f"{k}:{v}" for k, v in self.to_dict()['buckets'].items() if v > 0)
+        print(f"INFO: {self.name}: n={self.count} mean={self.mean_usec():.1f}us max={self.max_usec:.1f}us [{buckets}]")
+
+
+def wait_until(deadline: float, spin_budget_sec: float):
+    """
+    Waits until the perf_counter() deadline: sleeps coarsely until
+    spin_budget_sec before it and then spin-waits for the rest.
+    Returns the wake-up time.
+    """
+    remaining = deadline - time.perf_counter()
+    if remaining > spin_budget_sec:
+        time.sleep(remaining - spin_budget_sec)
+    now = time.perf_counter()
+    while now < deadline:
+        now = time.perf_counter()
+    return now
+
+
+class StepPacer:
+    """
+    Paces simulation steps against a monotonic wall-clock deadline so that
+    sim_time / wall_time tracks speed_ratio (0 means unlimited).
+
+    The deadline of step N is start + N * delta / speed_ratio, so the time
+    spent inside the step itself is automatically subtracted from the wait.
+    Deadlines are absolute, so sleep overshoot of one step does not
+    accumulate into drift.
+    """
+    def __init__(self, delta_time_usec: int, speed_ratio: float = 1.0, spin_budget_usec: int = SPIN_BUDGET_USEC):
+        self.delta_sec = delta_time_usec / 1_000_000
+        self.speed_ratio = speed_ratio
+        self.spin_budget_sec = spin_budget_usec / 1_000_000
+        self.drift_hist = Histogram('drift')
+        self.overshoot_hist = Histogram('overshoot')
+        self.reset()
+
+    def reset(self):
+        self.start_wall = None
+        self.base_wall = None
+        self.base_steps = 0
+        self.steps = 0
+        self.late_steps = 0
+        self.rebase_count = 0
+        self.lag_sum = 0.0
+        self.lag_max = 0.0
+        self.last_report = None
+        self.drift_hist.reset()
+        self.overshoot_hist.reset()
+
+    def step(self):
+        now = time.perf_counter()
+        if self.start_wall is None:
+            self.start_wall = now
+            self.base_wall = now
+            self.last_report = now
+        self.steps += 1
+        if self.speed_ratio <= 0:
+            return
+
+        deadline = self.base_wall + (self.steps - self.base_steps) * self.delta_sec / self.speed_ratio
+        lag = now - deadline
+        self.drift_hist.add(max(lag, 0.0) * 1_000_000)
+        if lag > 0:
+            self.late_steps += 1
+            self.lag_sum += lag
+            self.lag_max = max(self.lag_max, lag)
+            if lag > MAX_LAG_SEC:
+                # too far behind: forget the missed time rather than bursting
+                self.base_wall = now
+                self.base_steps = self.steps
+                self.rebase_count += 1
+            return
+        woke = wait_until(deadline, self.spin_budget_sec)
+        self.overshoot_hist.add((woke - deadline) * 1_000_000)
+
+    def sim_elapsed(self):
+        return self.steps * self.delta_sec
+
+    def wall_elapsed(self):
+        if self.start_wall is None:
+            return 0.0
+        return time.perf_counter() - self.start_wall
+
+    def achieved_ratio(self):
+        wall = self.wall_elapsed()
+        if wall <= 0:
+            return 0.0
+        return self.sim_elapsed() / wall
+
+    def stats(self):
+        return {
+            'steps': self.steps,
+            'target_ratio': self.speed_ratio,
+            'achieved_ratio': self.achieved_ratio(),
+            'late_steps': self.late_steps,
+            'lag_mean_msec': (self.lag_sum / self.late_steps * 1000) if self.late_steps > 0 else 0.0,
+            'lag_max_msec': self.lag_max * 1000,
+            'rebase_count': self.rebase_count,
+            'drift': self.drift_hist.to_dict(),
+            'overshoot': self.overshoot_hist.to_dict(),
+        }
+
+    def report(self):
+        st = self.stats()
+        target = 'unlimited' if st['target_ratio'] <= 0 else f"{st['target_ratio']:.2f}x"
+        print(f"INFO: steps={st['steps']} target={target} achieved={st['achieved_ratio']:.3f}x "
+              f"late={st['late_steps']} lag_mean={st['lag_mean_msec']:.3f}ms "
+              f"lag_max={st['lag_max_msec']:.3f}ms rebase={st['rebase_count']}")
+        self.drift_hist.report()
+        self.overshoot_hist.report()
+
+    def report_if_due(self):
+        now = time.perf_counter()
+        if self.last_report is not None and (now - self.last_report) >= REPORT_INTERVAL_SEC:
+            self.last_report = now
+            self.report()
+
+
+def parse_speed_ratio(value: str) -> float:
+    if value.lower() in ('max', 'unlimited', 'inf'):
+        return 0.0
+    ratio = float(value)
+    if ratio < 0:
+        raise ValueError(f"speed ratio must be >= 0: {value}")
+    return ratio
 
 def my_on_initialize(context):
 
@@ -15,11 +194,13 @@ def my_on_initialize(context):
 
 def my_on_reset(context):
     print("INFO: RESET EVENT OCCURRED")
+    pacer.report()
+    pacer.reset()
     return 0
 
 def my_on_simulation_step(context):
-    global delta_time_usec
-    time.sleep(delta_time_usec / 1_000_000)  # Convert microseconds to seconds for sleep
+    pacer.step()
+    pacer.report_if_due()
     return 0
 
 my_callback = {
@@ -32,22 +213,32 @@ my_callback = {
 def main():
     global delta_time_usec
     global config_path
-    
-    if len(sys.argv) != 3:
-        print(f"Usage: {sys.argv[0]} <config_path> <delta_time_msec>")
+    global pacer
+
+    if len(sys.argv) != 3 and len(sys.argv) != 4:
+        print(f"Usage: {sys.argv[0]} <config_path> <delta_time_msec> [speed_ratio|max]")
         return 1
 
     asset_name = 'RealTimeSyncher'
     config_path = sys.argv[1]
     delta_time_usec = int(sys.argv[2]) * 1000
+    speed_ratio = 1.0
+    if len(sys.argv) == 4:
+        try:
+            speed_ratio = parse_speed_ratio(sys.argv[3])
+        except ValueError as e:
+            print(f"ERROR: {e}")
+            return 1
+    pacer = StepPacer(delta_time_usec, speed_ratio)
     my_callback['on_simulation_step'] = my_on_simulation_step
 
     ret = hakopy.asset_register(asset_name, config_path, my_callback, delta_time_usec, hakopy.HAKO_ASSET_MODEL_PLANT)
     if ret == False:
         print(f"ERROR: hako_asset_register() returns {ret}.")
         return 1
-    
+
     ret = hakopy.start()
+    pacer.report()
     print(f"INFO: DONE {ret}")
 
     return 0
@@ -3,21 +3,47 @@
 
 import sys
 import libs.hakosim as hakosim
-import hako_pdu
 import math
 import os
 import hakopy
 import time
+from drone_utils.pose_cache import get_pose_cache
+from drone_utils.geometry import quaternion_to_euler
+from drone_utils.pdu_manager import get_pdu_manager
+
+class PID:
+    def __init__(self, kp, ki=0.0, kd=0.0, limit=1.0, i_limit=0.5):
+        self.kp = kp
+        self.ki = ki
+        self.kd = kd
+        self.limit = limit
+        self.i_limit = i_limit
+        self.reset()
+
+    def reset(self):
+        self.integral = 0.0
+        self.prev_error = None
+
+    def update(self, error, dt):
+        self.integral = max(-self.i_limit, min(self.i_limit, self.integral + error * dt))
+        derivative = 0.0 if self.prev_error is None or dt <= 0 else (error - self.prev_error) / dt
+        self.prev_error = error
+        out = self.kp * error + self.ki * self.integral + self.kd * derivative
+        return max(-self.limit, min(self.limit, out))
 
 class DroneController:
     HEADING_AXIS = 0
     UP_DOWN_AXIS = 1
     ROLL_AXIS = 2
     PITCH_AXIS = 3
-    YAW_TOLERANCE = 0.01
+    YAW_TOLERANCE = 0.5
     POSITION_TOLERANCE = 0.2
-    CLOSE_YAW_RANGE = 10
-    CLOSE_RANGE = 30
+    CONTROL_RATE_HZ = 50   # control tick; axes are flushed at most once per tick
+    TIMEOUT_SEC = 120.0
+    # gains (stick value per meter / per degree)
+    POS_GAINS = (0.2, 0.02, 0.15)
+    Z_GAINS = (0.5, 0.05, 0.2)
+    YAW_GAINS = (0.02, 0.0, 0.002)
 
     def __init__(self, client, default_drone_name="Drone", height=3.0, power=0.1, yaw_power=0.9):
         self.client = client
@@ -25,6 +51,16 @@ class DroneController:
         self.height = height
         self.power = power
         self.yaw_power = yaw_power
+        self.pid_x = PID(*self.POS_GAINS, limit=power)
+        self.pid_y = PID(*self.POS_GAINS, limit=power)
+        self.pid_z = PID(*self.Z_GAINS, limit=power)
+        self.pid_yaw = PID(*self.YAW_GAINS, limit=yaw_power)
+        # local copy of the joystick PDU; axes are edited here and flushed once per tick
+        self._joystick = None
+        self._dirty = False
+        self.counters = {'pose_reads': 0, 'pdu_reads': 0, 'pdu_writes': 0, 'ticks': 0}
+        # poses younger than half a tick are shared with other readers (e.g. debug_pos)
+        self.pose_cache = get_pose_cache(client, max_age_sec=0.5 / self.CONTROL_RATE_HZ)
 
     def _print_progress(self, message):
         sys.stdout.write(f"\r{message}")
@@ -32,68 +68,114 @@ class DroneController:
 
 
     def _get_pose(self):
-        return self.client.simGetVehiclePose()
-
-    def _update_joystick(self, axis, value):
-        data = self.client.getGameJoystickData()
-        data['axis'] = list(data['axis'])
-        data['axis'][axis] = value
-        self.client.putGameJoystickData(data)
+        self.counters['pose_reads'] += 1
+        return self.pose_cache.get()
+
+    def _load_joystick(self):
+        if self._joystick is None:
+            data = self.client.getGameJoystickData()
+            self.counters['pdu_reads'] += 1
+            data['axis'] = list(data['axis'])
+            self._joystick = data
+
+    def _set_axes(self, heading, up_down, roll, pitch):
+        self._load_joystick()
+        axis = self._joystick['axis']
+        values = ((self.HEADING_AXIS, heading), (self.UP_DOWN_AXIS, up_down),
+                  (self.ROLL_AXIS, roll), (self.PITCH_AXIS, pitch))
+        for index, value in values:
+            if axis[index] != value:
+                axis[index] = value
+                self._dirty = True
+
+    def _flush(self):
+        if self._dirty:
+            self.client.putGameJoystickData(self._joystick)
+            self.counters['pdu_writes'] += 1
+            self._dirty = False
 
     def debug_pos(self):
         pose = self._get_pose()
         print(f"POS  : {pose.position.x_val} {pose.position.y_val} {pose.position.z_val}")
-        roll, pitch, yaw = hakosim.hakosim_types.Quaternionr.quaternion_to_euler(pose.orientation)
+        roll, pitch, yaw = quaternion_to_euler(pose.orientation)
         print(f"ANGLE: {math.degrees(roll)} {math.degrees(pitch)} {math.degrees(yaw)}")
 
-    def adjust_heading(self):
+    def move_to(self, target_x=0.0, target_y=0.0, target_z=None, target_yaw_deg=0.0):
+        """
+        Drives heading, X, Y and Z simultaneously with one PID per axis.
+        The pose is read once per tick and all four axes are written together.
+        Returns True when every axis is within tolerance, False on timeout.
+        """
+        if target_z is None:
+            target_z = self.height
+        for pid in (self.pid_x, self.pid_y, self.pid_z, self.pid_yaw):
+            pid.reset()
+
+        period = 1.0 / self.CONTROL_RATE_HZ
+        start_time = time.perf_counter()
+        next_time = start_time
+        last_time = start_time
+        reached = False
         while True:
+            now = time.perf_counter()
+            dt = now - last_time
+            last_time = now
+            if now - start_time > self.TIMEOUT_SEC:
+                break
+
+            self.counters['ticks'] += 1
+            # one fresh pose per control tick; later reads in the same tick reuse it
+            self.pose_cache.notify_step()
             pose = self._get_pose()
-            _, _, yaw = hakosim.hakosim_types.Quaternionr.quaternion_to_euler(pose.orientation)
+            x_val = pose.position.x_val
+            y_val = pose.position.y_val
+            z_val = pose.position.z_val
+            _, _, yaw = quaternion_to_euler(pose.orientation)
             yaw_deg = math.degrees(yaw)
-            if abs(yaw_deg) <= self.YAW_TOLERANCE:
+
+            err_x = target_x - x_val
+            err_y = target_y - y_val
+            err_z = target_z - z_val
+            err_yaw = (target_yaw_deg - yaw_deg + 180.0) % 360.0 - 180.0
+            if (abs(err_x) <= self.POSITION_TOLERANCE and abs(err_y) <= self.POSITION_TOLERANCE
+                    and abs(err_z) <= self.POSITION_TOLERANCE and abs(err_yaw) <= self.YAW_TOLERANCE):
+                reached = True
                 break
-            power = 0.05 if abs(yaw_deg) < self.CLOSE_YAW_RANGE else self.power
-            self._update_joystick(self.HEADING_AXIS, power if yaw_deg > 0 else -power)
-            self._print_progress(f"Adjusting Heading... yaw_val: {yaw_deg:.5f} power: {power}")
-
-        self._update_joystick(self.HEADING_AXIS, 0.0)
-        self._print_progress("Heading adjustment complete\n")
-
-    def move_z(self):
-        while self._get_pose().position.z_val > self.height - 0.1:
-            z_val = self._get_pose().position.z_val
-            self._update_joystick(self.UP_DOWN_AXIS, self.power)
-            self._print_progress(f"Moving to target height... z_val: {z_val:.2f}, power: {self.power}")
-
-        self._update_joystick(self.UP_DOWN_AXIS, 0.0)
-        self._print_progress("Reached target height\n")
-
-    def move_x(self, target_x=0.0):
-        while abs(self._get_pose().position.x_val - target_x) > self.POSITION_TOLERANCE:
-            x_val = self._get_pose().position.x_val
-            power = 0.05 if abs(x_val - target_x) < self.CLOSE_RANGE else self.power
-            self._update_joystick(self.PITCH_AXIS, power if x_val > target_x else -power)
-            self._print_progress(f"Moving to target X... x_val: {x_val:.2f}, power: {power}")
-
-        self._update_joystick(self.PITCH_AXIS, 0.0)
-        self._print_progress("X position reached\n")
-
-    def move_y(self, target_y=0.0):
-        while abs(self._get_pose().position.y_val - target_y) > self.POSITION_TOLERANCE:
-            y_val = self._get_pose().position.y_val
-            power = 0.05 if abs(y_val - target_y) < self.CLOSE_RANGE else self.power
-            self._update_joystick(self.ROLL_AXIS, power if y_val > target_y else -power)
-            self._print_progress(f"Moving to target Y... y_val: {y_val:.2f}, power: {power}")
-
-        self._update_joystick(self.ROLL_AXIS, 0.0)
-        self._print_progress("Y position reached\n")
+
+            # world frame error -> body frame (forward / right) error
+            cos_yaw = math.cos(yaw)
+            sin_yaw = math.sin(yaw)
+            err_fwd = cos_yaw * err_x + sin_yaw * err_y
+            err_side = -sin_yaw * err_x + cos_yaw * err_y
+
+            # positive stick values move the vehicle towards -X / -Y / down / -yaw
+            pitch = -self.pid_x.update(err_fwd, dt)
+            roll = -self.pid_y.update(err_side, dt)
+            up_down = -self.pid_z.update(err_z, dt)
+            heading = -self.pid_yaw.update(err_yaw, dt)
+            self._set_axes(heading, up_down, roll, pitch)
+            self._flush()
+            self._print_progress(f"Returning... pos: ({x_val:.2f}, {y_val:.2f}, {z_val:.2f}) yaw: {yaw_deg:.2f}")
+
+            next_time += period
+            sleep_duration = next_time - time.perf_counter()
+            if sleep_duration > 0:
+                time.sleep(sleep_duration)
+            else:
+                next_time = time.perf_counter()
+
+        self._set_axes(0.0, 0.0, 0.0, 0.0)
+        self._flush()
+        if reached:
+            self._print_progress("Target reached\n")
+        else:
+            self._print_progress("Timeout before reaching target\n")
+        print(f"INFO: ticks={self.counters['ticks']} pose_reads={self.counters['pose_reads']} "
+              f"pdu_reads={self.counters['pdu_reads']} pdu_writes={self.counters['pdu_writes']}")
+        return reached
 
     def return_to_home(self):
-        self.adjust_heading()
-        self.move_x()
-        self.move_y()
-        self.move_z()
+        return self.move_to(0.0, 0.0, self.height, 0.0)
 
 def main():
     if len(sys.argv) != 2:
@@ -102,7 +184,7 @@ def main():
 
     client = hakosim.MultirotorClient(sys.argv[1])
     hako_binary_path = os.getenv('HAKO_BINARY_PATH', '/usr/local/lib/hakoniwa/hako_binary/offset')
-    client.pdu_manager = hako_pdu.HakoPduManager(hako_binary_path, sys.argv[1])
+    client.pdu_manager = get_pdu_manager(hako_binary_path, sys.argv[1])
 
     client.confirmConnection()
     client.enableApiControl(True)
@@ -5,36 +5,35 @@ import sys
 import libs.hakosim as hakosim
 import time
 import math
-import numpy
 import pprint
-
-def transport(client, baggage_pos, transfer_pos):
-    client.moveToPosition(baggage_pos['x'], baggage_pos['y'], 3, 5, -90)
-    client.moveToPosition(baggage_pos['x'], baggage_pos['y'], 3, 5)
-    client.moveToPosition(baggage_pos['x'], baggage_pos['y'], 3, 5, 0)
-    client.moveToPosition(baggage_pos['x'], baggage_pos['y'], 0.3, 5, 0)
-    client.grab_baggage(True)
-    client.moveToPosition(baggage_pos['x'], baggage_pos['y'], 3, 5)
-    client.moveToPosition(transfer_pos['x'], transfer_pos['y'], 3, 5)
-    client.moveToPosition(transfer_pos['x'], transfer_pos['y'], transfer_pos['z'], 5)
-    client.grab_baggage(False)
-    client.moveToPosition(transfer_pos['x'], transfer_pos['y'], 3, 5)
+from drone_utils.geometry import quaternion_to_euler
+from drone_utils.lidar import getLidarScan
+from drone_utils.lidar_pipeline import LidarPipeline
+from drone_utils.occupancy_map import OccupancyMap
+from drone_utils.mission import Mission
+
+def transport(client, baggage_pos, transfer_pos, occupancy_map=None):
+    mission = Mission(client, occupancy_map=occupancy_map)
+    mission.move(baggage_pos['x'], baggage_pos['y'], 3, 5, -90)
+    mission.move(baggage_pos['x'], baggage_pos['y'], 3, 5)
+    mission.move(baggage_pos['x'], baggage_pos['y'], 3, 5, 0)
+    # descending onto the baggage: the baggage itself is in the map
+    mission.move(baggage_pos['x'], baggage_pos['y'], 0.3, 5, 0, check=False)
+    mission.grab_baggage(True)
+    mission.move(baggage_pos['x'], baggage_pos['y'], 3, 5, check=False)
+    mission.move(transfer_pos['x'], transfer_pos['y'], 3, 5)
+    mission.move(transfer_pos['x'], transfer_pos['y'], transfer_pos['z'], 5, check=False)
+    mission.grab_baggage(False)
+    mission.move(transfer_pos['x'], transfer_pos['y'], 3, 5, check=False)
+    mission.run()
+    mission.report()
 
 def debug_pos(client):
     pose = client.simGetVehiclePose()
     print(f"POS  : {pose.position.x_val} {pose.position.y_val} {pose.position.z_val}")
-    roll, pitch, yaw = hakosim.hakosim_types.Quaternionr.quaternion_to_euler(pose.orientation)
+    roll, pitch, yaw = quaternion_to_euler(pose.orientation)
     print(f"ANGLE: {math.degrees(roll)} {math.degrees(pitch)} {math.degrees(yaw)}")
 
-def parse_lidarData(data):
-
-    # reshape array of floats to array of [X,Y,Z]
-    points = numpy.array(data.point_cloud, dtype=numpy.dtype('f4'))
-    points = numpy.reshape(points, (int(points.shape[0]/3), 3))
-    
-    return points
-
-
 def main():
     if len(sys.argv) != 2:
         print(f"Usage: {sys.argv[0]} <config_path>")
@@ -46,21 +45,22 @@ def main():
     client.enableApiControl(True)
     client.armDisarm(True)
 
-    lidarData = client.getLidarData()
-    if (len(lidarData.point_cloud) < 3):
+    lidar_pipeline = LidarPipeline(max_range=2.0)
+    occupancy_map = OccupancyMap(voxel_size=0.2)
+    lidarData = getLidarScan(client)
+    if lidarData is None or len(lidarData.points) < 1:
         print("\tNo points received from Lidar data")
     else:
-        print(f"len: {len(lidarData.point_cloud)}")
-        points = parse_lidarData(lidarData)
+        points = lidarData.points
+        print(f"len: {points.size}")
         print("\tReading: time_stamp: %d number_of_points: %d" % (lidarData.time_stamp, len(points)))
         print("\t\tlidar position: %s" % (pprint.pformat(lidarData.pose.position)))
         print("\t\tlidar orientation: %s" % (pprint.pformat(lidarData.pose.orientation)))
     
-        #lidar_z = lidarData.pose.position.z_val
-        condition = numpy.logical_and(points <= 2, points > 0)
-        filtered_points = points[numpy.any(condition, axis=1)]
-
-        print(filtered_points)
+        result = lidar_pipeline.process(lidarData)
+        print(result.points)
+        print("\t\tnearest obstacle: %.2f m" % result.nearest)
+        occupancy_map.integrate_result(result, lidarData.pose)
 
     client.takeoff(3)
 
@@ -73,14 +73,14 @@ def main():
 
     baggage_pos = { "x": 0, "y": -3 }
     transfer_pos = { "x": 0, "y": 1, "z": 0.2 }
-    transport(client, baggage_pos, transfer_pos)
+    transport(client, baggage_pos, transfer_pos, occupancy_map)
     debug_pos(client)
 
     client.simSetCameraOrientation("0",15)
 
     baggage_pos = { "x": 0, "y": -4 }
     transfer_pos = { "x": 0, "y": 1, "z": 0.2 }
-    transport(client, baggage_pos, transfer_pos)
+    transport(client, baggage_pos, transfer_pos, occupancy_map)
     debug_pos(client)
 
     client.moveToPosition(-2, 1, 3, 5)
@@ -90,21 +90,19 @@ def main():
     debug_pos(client)
     time.sleep(3)
 
-    lidarData = client.getLidarData()
-    if (len(lidarData.point_cloud) < 3):
+    lidarData = getLidarScan(client)
+    if lidarData is None or len(lidarData.points) < 1:
         print("\tNo points received from Lidar data")
     else:
-        print(f"len: {len(lidarData.point_cloud)}")
-        points = parse_lidarData(lidarData)
+        points = lidarData.points
+        print(f"len: {points.size}")
         print("\tReading: time_stamp: %d number_of_points: %d" % (lidarData.time_stamp, len(points)))
         print("\t\tlidar position: %s" % (pprint.pformat(lidarData.pose.position)))
         print("\t\tlidar orientation: %s" % (pprint.pformat(lidarData.pose.orientation)))
     
-        #lidar_z = lidarData.pose.position.z_val
-        condition = numpy.logical_and(points <= 2, points > 0)
-        filtered_points = points[numpy.any(condition, axis=1)]
-
-        print(filtered_points)
+        result = lidar_pipeline.process(lidarData)
+        print(result.points)
+        print("\t\tnearest obstacle: %.2f m" % result.nearest)
 
     client.simSetCameraOrientation("0",0)
 
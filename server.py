@@ -5,24 +5,79 @@ import time
 import base64
 import math
 import threading
+import itertools
+from typing import TYPE_CHECKING, Literal
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.append(os.path.abspath(os.path.dirname(__file__)))
+from drone_utils.startup import StartupTimer
+startup_timer = StartupTimer("server")
 
 # ---必要なライブラリをインポート---
-from fastapi import FastAPI, APIRouter, HTTPException, BackgroundTasks, Response
+from fastapi import FastAPI, APIRouter, HTTPException, BackgroundTasks, Response, Header
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel, Field
 from fastapi.responses import JSONResponse, StreamingResponse
-import uvicorn
+startup_timer.mark("import_fastapi")
 
 # ---Hakoniwaシミュレータ連携部分---
-sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
-import libs.hakosim as hakosim
-import libs.hakosim_types as hakosim_types
-from hakoniwa_pdu.pdu_msgs.hako_msgs.pdu_pytype_GameControllerOperation import GameControllerOperation
+# libs.hakosim と PDU 型は起動イベントで初めて読み込む（import だけで数百ms かかるため）
+if TYPE_CHECKING:
+    import libs.hakosim as hakosim
+    import libs.hakosim_types as hakosim_types
+from drone_utils.pose_cache import get_pose_cache
+from drone_utils.move_coalescer import MoveCoalescer
+from drone_utils import metrics
+from drone_utils import trace
+startup_timer.mark("import_drone_utils")
 
 # ---グローバル変数---
-hako: hakosim.MultirotorClient = None
+hako: "hakosim.MultirotorClient" = None
 drone_controller = None
 camera_hub: "CameraHub | None" = None
+replay_mode = False
+
+# ---マルチプロセス構成 (HAKO_SERVER_ROLE)---
+#   single (既定): このプロセスがシミュレータに接続し HTTP も提供する
+#   owner : single と同じに加え、状態と最新フレームを共有メモリ (drone_utils/shm_bus.py) に公開し、
+#           worker からの指令をローカルソケット (drone_utils/command_channel.py) で受け付ける
+#   worker: シミュレータに接続しない。共有メモリを読み、指令は owner へ転送する
+#           （uvicorn --workers N で起動すればシミュレータの負荷を増やさずに HTTP/配信の処理能力を増やせる）
+SERVER_ROLE = os.getenv("HAKO_SERVER_ROLE", "single")
+BUS_NAME = os.getenv("HAKO_BUS_NAME", "hako_bus")
+BUS_SOCKET = os.getenv("HAKO_BUS_SOCKET", "/tmp/hako_bus.sock")
+# owner の状態更新がこの時間 [秒] 途絶えたら worker は /state に 503 を返す
+BUS_STALE_SEC = 2.0
+bus_writer = None
+bus_reader = None
+command_server = None
+
+# ---メトリクス (/metrics)---
+_registry = metrics.REGISTRY
+SYNC_LOOP_SECONDS = _registry.histogram("hako_sync_loop_seconds", "Duration of one sync loop iteration")
+SYNC_LOOP_OVERRUNS = _registry.counter("hako_sync_loop_overruns", "Sync loop iterations longer than the target interval")
+SYNC_LOOP_ERRORS = _registry.counter("hako_sync_loop_errors", "Exceptions raised in the sync loop")
+CAMERA_FETCH_SECONDS = _registry.histogram("hako_camera_fetch_seconds", "simGetImage latency")
+CAMERA_FETCH_FAILURES = _registry.counter("hako_camera_fetch_failures", "simGetImage calls that raised or returned no image")
+CAMERA_FRAMES = _registry.counter("hako_camera_frames_captured", "Frames captured by CameraHub")
+CAMERA_BYTES = _registry.counter("hako_camera_bytes", "JPEG bytes captured by CameraHub")
+MJPEG_FRAMES_SENT = _registry.counter("hako_mjpeg_frames_sent", "Frames sent per MJPEG viewer", ("viewer",))
+MJPEG_FRAMES_DROPPED = _registry.counter("hako_mjpeg_frames_dropped", "Captured frames a MJPEG viewer never received", ("viewer",))
+MOVE_SECONDS = _registry.histogram("hako_move_seconds", "/api/control/move latency")
+MOVE_MERGED = _registry.counter("hako_move_merged", "/move requests replaced by a newer one before being sent")
+# /move の指令を送る最短間隔 [秒]（これより速い要求は最新のものだけが送られる）
+MOVE_MIN_INTERVAL_SEC = float(os.getenv("HAKO_MOVE_MIN_INTERVAL_SEC", "0.2"))
+# 速度モード: この時間 [秒] 入力が途絶えたらスティックを中立に戻す（デッドマン）
+DEADMAN_TIMEOUT_SEC = float(os.getenv("HAKO_DEADMAN_TIMEOUT_SEC", "0.5"))
+DEADMAN_TRIPS = _registry.counter("hako_deadman_trips", "Velocity-mode inputs zeroed by the deadman timeout")
+_mjpeg_viewer_ids = itertools.count(1)
+_mjpeg_viewers = set()
+_mjpeg_viewers_lock = threading.Lock()
+_registry.gauge("hako_mjpeg_viewers", "Connected MJPEG viewers", fn=lambda: len(_mjpeg_viewers))
+_registry.counter("hako_pose_cache_hits", "Pose reads served from the pose cache",
+                  fn=lambda: drone_controller.pose_cache.hits if isinstance(drone_controller, DroneController) else 0)
+_registry.counter("hako_pose_cache_misses", "Pose reads that went to the PDU",
+                  fn=lambda: drone_controller.pose_cache.misses if isinstance(drone_controller, DroneController) else 0)
 
 # ---Pydanticモデル定義---
 class DroneStatus(BaseModel):
@@ -38,14 +93,55 @@ class JoystickInput(BaseModel):
     dz: float = Field(..., ge=-1.0, le=1.0)
     yaw: float = Field(..., ge=-1.0, le=1.0)
 
+class ControlMode(BaseModel):
+    mode: Literal["position", "velocity"]
+
 # ---ドローン制御ロジックのクラス---
 class DroneController:
-    def __init__(self, hako_instance: hakosim.MultirotorClient):
+    def __init__(self, hako_instance: "hakosim.MultirotorClient"):
+        from hakoniwa_pdu.pdu_msgs.hako_msgs.pdu_pytype_GameControllerOperation import GameControllerOperation
         self.hako = hako_instance
         self.status = DroneStatus(armed=False, flying=False)
         self.control_input = JoystickInput(dx=0.0, dy=0.0, dz=0.0, yaw=0.0)
+        # 速度モード: control_input を 20ms ごとにゲームコントローラの軸へ書き込む
+        # 操作できるのは速度モードに切り替えたセッション (velocity_owner) 1つだけ
+        self.session_modes: dict[str, str] = {}
+        self.velocity_owner: str | None = None
+        self._last_input_time = 0.0
+        self._deadman_tripped = False
         self._is_running = False
         self._sync_task = None
+        # 状態の共有メモリ公開 (HAKO_SERVER_ROLE=owner 時に startup_event で設定)
+        self.bus = None
+        # フライトレコーダ（HAKO_FLIGHT_LOG にファイルパス、または HAKO_RECORD_DIR を指定すると有効）
+        # 再生モードでは記録しない（再生中の記録を上書きしないため）
+        self.recorder = None
+        flight_log = os.getenv("HAKO_FLIGHT_LOG")
+        record_dir = os.getenv("HAKO_RECORD_DIR")
+        if not flight_log and record_dir:
+            from drone_utils.recording import TELEMETRY_FILE
+            os.makedirs(record_dir, exist_ok=True)
+            flight_log = os.path.join(record_dir, TELEMETRY_FILE)
+        if flight_log and not replay_mode:
+            from drone_utils.flight_recorder import FlightRecorder
+            self.recorder = FlightRecorder(flight_log)
+            print(f"情報: フライトログを記録します: {flight_log}")
+        # 同期ループ・/move など同一ステップ内の姿勢取得を共有する
+        self.pose_cache = get_pose_cache(hako_instance, max_age_sec=0.02)
+        # /move の合流: 機体ごとに実行中の移動指令は1つ、後から来た目標が優先
+        self.motion = None
+        if hasattr(hako_instance, "get_packet"):
+            from drone_utils.async_client import AsyncMultirotorClient
+            # 指令の完了確認は同期ループが姿勢と一緒に行う (auto_poll=False)
+            self.motion = AsyncMultirotorClient(hako_instance, auto_poll=False)
+            start = lambda target: self.motion.moveToPosition(*target)
+            retarget = True
+        else:
+            # 非同期指令が使えないクライアントではブロッキング API をスレッドで実行（途中変更・中断なし）
+            start = lambda target: asyncio.ensure_future(asyncio.to_thread(hako_instance.moveToPosition, *target))
+            retarget = False
+        self.mover = MoveCoalescer(start, retarget=retarget, min_interval_sec=MOVE_MIN_INTERVAL_SEC,
+                                   on_merge=lambda key: MOVE_MERGED.inc(), cancellable=retarget)
         self.pdu_game_controller = GameControllerOperation()
         if hasattr(self.pdu_game_controller, 'axis'):
             self.pdu_game_controller.axis = [0.0] * 8
@@ -63,51 +159,137 @@ class DroneController:
         self._is_running = False
         if self._sync_task:
             self._sync_task.cancel()
+        if self.recorder:
+            self.recorder.close()
+            print(f"情報: フライトログを保存しました: {self.recorder.path} "
+                  f"(行数={self.recorder.rows}, 破棄チャンク={self.recorder.dropped_chunks})")
+            self.recorder = None
         print("情報: ドローン制御ループを停止しました。")
+
+    def _record_event(self, name, **data):
+        if self.recorder:
+            self.recorder.event(time.time(), name, **data)
         
     async def _synchronize(self):
         TARGET_INTERVAL = 0.02
         while self._is_running:
             loop_start_time = time.time()
+            t0_ns = time.perf_counter_ns()
             try:
-                self.hako.run_nowait()
+                with trace.span("sync.run_nowait"):
+                    self.hako.run_nowait()
+                self.pose_cache.notify_step()
                 if self.hako.pdu_manager is None:
                     await asyncio.sleep(0.1)
                     continue
+                metrics.instrument_pdu_manager(self.hako.pdu_manager)
 
                 drone_obj = self.hako.vehicles.get(self.hako.default_drone_name)
                 if drone_obj:
                     self.status.armed = drone_obj.arm
-                    pose: hakosim_types.Pose = self.hako.simGetVehiclePose()
-                    if pose and hasattr(pose, 'position'):
-                        self.status.is_flying = pose.position.z_val > 0.1
-
-                if self.status.armed:
-                    pass
-                    # self.pdu_game_controller.axis[1] = -self.control_input.dz 
-                    # self.pdu_game_controller.axis[0] = self.control_input.yaw
-                    # self.pdu_game_controller.axis[4] = -self.control_input.dy
-                    # self.pdu_game_controller.axis[3] = self.control_input.dx
-                    # self.hako.putGameJoystickData(self.pdu_game_controller)
+                    with trace.span("sync.simGetVehiclePose"):
+                        pose: hakosim_types.Pose = self.pose_cache.get()
+                    with trace.span("sync.update_status"):
+                        if pose and hasattr(pose, 'position'):
+                            self.status.is_flying = pose.position.z_val > 0.1
+                    if self.motion is not None and pose and hasattr(pose, 'position'):
+                        with trace.span("sync.poll_motion"):
+                            p = pose.position
+                            self.motion.poll_once({self.hako.default_drone_name: (p.x_val, p.y_val, p.z_val)})
+                    if self.recorder:
+                        self.recorder.record(loop_start_time, pose, self.control_input,
+                                             self.status.armed, self.status.is_flying)
+                    if self.bus:
+                        with trace.span("sync.publish_state"):
+                            self.bus.publish_state(loop_start_time, self.status.armed, self.status.is_flying,
+                                                   pose if pose and hasattr(pose, 'position') else None)
+
+                if self.status.armed and self.velocity_owner is not None:
+                    with trace.span("sync.write_axes"):
+                        self._write_velocity_axes()
 
             except asyncio.CancelledError:
                 break
             except Exception as e:
+                SYNC_LOOP_ERRORS.inc()
                 print(f"同期ループでエラーが発生しました: {e}")
                 await asyncio.sleep(0.1)
 
             loop_duration = time.time() - loop_start_time
+            SYNC_LOOP_SECONDS.observe(loop_duration)
+            trace.record("sync.iteration", t0_ns, time.perf_counter_ns() - t0_ns)
             wait_time = TARGET_INTERVAL - loop_duration
             if wait_time > 0:
                 await asyncio.sleep(wait_time)
             else:
+                SYNC_LOOP_OVERRUNS.inc()
                 print(f"警告: 同期ループの実行時間が {loop_duration:.4f}秒で、目標間隔を超えています。")
 
+    # ---速度モード---
+    def _write_velocity_axes(self):
+        if time.monotonic() - self._last_input_time > DEADMAN_TIMEOUT_SEC:
+            if not self._deadman_tripped:
+                self._deadman_tripped = True
+                DEADMAN_TRIPS.inc()
+                self._record_event("deadman")
+                print("警告: 速度モードの入力が途絶えたためスティックを中立に戻しました。")
+            self.control_input = JoystickInput(dx=0.0, dy=0.0, dz=0.0, yaw=0.0)
+        ci = self.control_input
+        axis = self.pdu_game_controller.axis
+        # 軸の向き: axis[0] 正で機首を右(yaw減), axis[1] 正で下降, axis[2] 正で -Y, axis[3] 正で -X
+        # move_to_position と同じく dx 正で +X, dy 正で -Y, dz 正で下降, yaw 正で yaw 増
+        axis[0] = -ci.yaw
+        axis[1] = ci.dz
+        axis[2] = ci.dy
+        axis[3] = -ci.dx
+        self.hako.putGameJoystickData(self.pdu_game_controller)
+
+    def mode_of(self, session: str) -> str:
+        return self.session_modes.get(session, "position")
+
+    def get_mode(self, session: str):
+        return {"mode": self.mode_of(session), "velocity_owner": self.velocity_owner}
+
+    def set_mode(self, session: str, mode: str):
+        if mode == self.mode_of(session):
+            return {"message": f"モードは既に {mode} です", "mode": mode}
+        if mode == "velocity":
+            if self.velocity_owner is not None and self.velocity_owner != session:
+                raise HTTPException(status_code=409, detail=f"別のセッション ({self.velocity_owner}) が速度モードで操作中です。")
+            # 実行中・保留中の位置指令を止めてから軸操作に切り替える
+            name = self.hako.default_drone_name
+            self.mover.cancel(name)
+            if not self.mover.cancellable and self.mover.stats(name)["in_flight"]:
+                # スレッドで実行中の moveToPosition は止められないので、軸操作と競合させない
+                raise HTTPException(status_code=409, detail="実行中の移動指令が完了するまで速度モードに切り替えられません。")
+            self.control_input = JoystickInput(dx=0.0, dy=0.0, dz=0.0, yaw=0.0)
+            self.pdu_game_controller.axis = [0.0] * len(self.pdu_game_controller.axis)
+            self.velocity_owner = session
+            self._last_input_time = time.monotonic()
+        else:
+            self.velocity_owner = None
+            self.control_input = JoystickInput(dx=0.0, dy=0.0, dz=0.0, yaw=0.0)
+            self.pdu_game_controller.axis = [0.0] * len(self.pdu_game_controller.axis)
+            self.hako.putGameJoystickData(self.pdu_game_controller)
+        self.session_modes[session] = mode
+        self._record_event("mode", session=session, mode=mode)
+        return {"message": f"モードを {mode} に切り替えました", "mode": mode}
+
+    def set_velocity(self, session: str, new_input: JoystickInput):
+        if self.velocity_owner != session:
+            raise HTTPException(status_code=409, detail="速度モードではありません。先に /mode で velocity に切り替えてください。")
+        self.control_input = new_input
+        self._last_input_time = time.monotonic()
+        self._deadman_tripped = False
+        return {"message": "速度入力を受け付けました"}
+
     def arm(self):
+        self._record_event("arm")
         self.hako.armDisarm(True)
         return {"message": "ドローンのアーム指令を送信しました"}
 
     def disarm(self):
+        self._record_event("disarm")
         self.hako.armDisarm(False)
         return {"message": "ドローンのディスアーム指令を送信しました"}
 
@@ -129,22 +311,27 @@ class DroneController:
 
     def takeoff(self, background_tasks: BackgroundTasks):
         if self.status.armed and not self.status.is_flying:
+            self._record_event("takeoff")
             background_tasks.add_task(self._takeoff_task)
             return {"message": "離陸指令を受け付けました。"}
         raise HTTPException(status_code=400, detail="離陸できません。ドローンはアーム状態で地上にある必要があります。")
 
     def land(self, background_tasks: BackgroundTasks):
         if self.status.is_flying:
+            self._record_event("land")
             background_tasks.add_task(self._land_task)
             return {"message": "着陸指令を受け付けました。"}
         raise HTTPException(status_code=400, detail="着陸できません。ドローンは飛行中ではありません。")
 
     def _quat_to_yaw_rad(self, q) -> float:
-        w, x, y, z = q.w_val, q.x_val, q.y_val, q.z_val
-        return math.atan2(2.0*(w*z + x*y), 1.0 - 2.0*(y*y + z*z))
+        from drone_utils import geometry
+        return geometry.yaw_rad(q)
         
-    def move_to_position(self, new_input: JoystickInput):
-        pose: hakosim_types.Pose = self.hako.simGetVehiclePose()
+    def move_to_position(self, new_input: JoystickInput, session: str = "default"):
+        if self.velocity_owner is not None:
+            # 位置指令と軸操作が同じ機体を奪い合わないよう、速度モード中は全セッションで拒否する
+            raise HTTPException(status_code=409, detail="速度モードで操作中のため /move を使えません。/velocity を使用してください。")
+        pose: hakosim_types.Pose = self.pose_cache.get()
         if not pose or not hasattr(pose, 'position'):
             raise HTTPException(status_code=500, detail="現在の姿勢を取得できません。")
 
@@ -163,11 +350,18 @@ class DroneController:
         target_y = pose.position.y_val - dy
         target_z = pose.position.z_val - dz
         yaw = float(new_input.yaw) * YAW_DEG
+        self._record_event("move", x=target_x, y=target_y, z=target_z, yaw_deg=yaw)
         try:
-            self.hako.moveToPosition(target_x, target_y, target_z, 2.0, yaw)
+            result = self.mover.submit(self.hako.default_drone_name, (target_x, target_y, target_z, 2.0, yaw))
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"moveToPositionが失敗しました: {e}")
-        return {"message": "moveToPositionを実行しました"}
+        return {"message": "moveToPositionを受け付けました", **result}
+
+    def cancel_move(self):
+        self._record_event("move_cancel")
+        cancelled = self.mover.cancel(self.hako.default_drone_name)
+        return {"message": "移動指令を取り消しました" if cancelled else "実行中の移動指令はありません",
+                **self.mover.stats(self.hako.default_drone_name)}
 
 
 class CameraHub:
@@ -178,8 +372,13 @@ class CameraHub:
         self.interval = max(1, int(1000 / max(1, fps))) / 1000.0  # 秒
         self._lock = threading.Lock()
         self._frame_jpeg: bytes | None = None
+        self._frame_seq = 0
         self._stop = threading.Event()
         self._thread: threading.Thread | None = None
+        # カメラ映像の記録（HAKO_RECORD_DIR 指定時に startup_event で設定）
+        self.recorder = None
+        # worker への最新フレーム公開（HAKO_SERVER_ROLE=owner 時に startup_event で設定）
+        self.bus = None
 
     def start(self):
         if self._thread and self._thread.is_alive():
@@ -193,6 +392,10 @@ class CameraHub:
         self._stop.set()
         if self._thread and self._thread.is_alive():
             self._thread.join(timeout=1.0)
+        if self.recorder:
+            self.recorder.close()
+            print(f"[情報] CameraHub: 記録フレーム数={self.recorder.frames}, 破棄={self.recorder.dropped}")
+            self.recorder = None
         print("[情報] CameraHub: 停止")
 
     def _run(self):
@@ -201,24 +404,193 @@ class CameraHub:
             t0 = time.time()
             try:
                 # 直接 JPEG を取得（最軽量）
-                img = self.hako.simGetImage(self.cam_id, "jpeg", self.vehicle)
+                with trace.span("camera.simGetImage"):
+                    img = self.hako.simGetImage(self.cam_id, "jpeg", self.vehicle)
+                CAMERA_FETCH_SECONDS.observe(time.time() - t0)
                 if img:
-                    with self._lock:
-                        self._frame_jpeg = img
-                # たまに PDU が空を返すことがあるので、空なら前回のフレームを維持
+                    CAMERA_FRAMES.inc()
+                    CAMERA_BYTES.inc(len(img))
+                    if self.recorder:
+                        self.recorder.add(t0, img)
+                    if self.bus:
+                        self.bus.publish_frame(t0, img)
+                    with trace.span("camera.publish"):
+                        with self._lock:
+                            self._frame_jpeg = img
+                            self._frame_seq += 1
+                else:
+                    # たまに PDU が空を返すことがあるので、空なら前回のフレームを維持
+                    CAMERA_FETCH_FAILURES.inc()
             except Exception as e:
                 # 連続エラーでも本体を止めない
+                CAMERA_FETCH_FAILURES.inc()
                 print(f"[警告] CameraHub: 取得中に例外: {e}")
             # FPS 調整
             elapsed = time.time() - t0
             delay = self.interval - elapsed
             if delay > 0:
-                time.sleep(delay)
+                with trace.span("camera.sleep"):
+                    time.sleep(delay)
 
     def get_latest_jpeg(self) -> bytes | None:
         with self._lock:
             return self._frame_jpeg
 
+    def get_latest_frame(self) -> tuple[int, bytes | None]:
+        """
+        (通し番号, JPEG) を返す。番号の飛びで配信側の取りこぼしを数える
+        """
+        with self._lock:
+            return self._frame_seq, self._frame_jpeg
+
+    def get_latest_image(self, scale: int = 1, grayscale: bool = False, roi=None, out=None):
+        """
+        最新フレームをデコードして返す（縮小・グレースケール・ROI 指定可）
+        out（image_decode.output_shape() の大きさ）を渡すとそこへコピーし、その view を返す。
+        同じ out を毎回渡せばフレームごとの確保は起きない
+        """
+        from drone_utils.image_decode import decode_jpeg
+        frame = self.get_latest_jpeg()
+        if frame is None:
+            return None
+        return decode_jpeg(frame, scale, grayscale, roi, out)
+
+class RemoteController:
+    """
+    worker 用: DroneController と同じ操作を owner プロセスへ転送する。状態は共有メモリから読む
+    """
+    def __init__(self, client):
+        self.client = client
+
+    @property
+    def status(self) -> DroneStatus:
+        global bus_reader
+        state = bus_reader.read_state()
+        if (state is None or time.time() - state["t"] > BUS_STALE_SEC) and not bus_reader.owner_alive():
+            # owner が再起動していれば新しい共有メモリに付け直す
+            from drone_utils.shm_bus import BusReader, BusError
+            try:
+                reader = BusReader(BUS_NAME)
+            except (OSError, BusError):
+                reader = None
+            if reader is not None and reader.owner_alive():
+                # 古い方は配信スレッドが読み途中かもしれないので閉じずに手放す
+                bus_reader = camera_hub.bus = reader
+                state = reader.read_state()
+            elif reader is not None:
+                reader.close()
+        if state is None or time.time() - state["t"] > BUS_STALE_SEC:
+            raise HTTPException(status_code=503, detail="シミュレータ所有プロセス (owner) から状態が届いていません")
+        return DroneStatus(armed=state["armed"], flying=state["flying"])
+
+    async def _call(self, op, **args):
+        try:
+            status, body = await self.client.call(op, **args)
+        except OSError as e:
+            raise HTTPException(status_code=503, detail=f"シミュレータ所有プロセス (owner) に接続できません: {e}")
+        if status != 200:
+            raise HTTPException(status_code=status, detail=body)
+        return body
+
+    def arm(self):
+        return self._call("arm")
+
+    def disarm(self):
+        return self._call("disarm")
+
+    def takeoff(self, background_tasks: BackgroundTasks):
+        # 離陸処理は owner 側のバックグラウンドタスクで実行される
+        return self._call("takeoff")
+
+    def land(self, background_tasks: BackgroundTasks):
+        return self._call("land")
+
+    def move_to_position(self, new_input: JoystickInput, session: str = "default"):
+        return self._call("move", session=session, input=_input_dict(new_input))
+
+    def cancel_move(self):
+        return self._call("move_cancel")
+
+    def get_mode(self, session: str):
+        return self._call("mode_get", session=session)
+
+    def set_mode(self, session: str, mode: str):
+        return self._call("mode_set", session=session, mode=mode)
+
+    def set_velocity(self, session: str, new_input: JoystickInput):
+        return self._call("velocity", session=session, input=_input_dict(new_input))
+
+
+class BusCameraHub:
+    """
+    worker 用: owner が共有メモリに公開した最新フレームを CameraHub と同じ形で返す
+    """
+    def __init__(self, bus):
+        self.bus = bus
+
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+    def get_latest_jpeg(self) -> bytes | None:
+        return self.bus.latest_frame()[1]
+
+    def get_latest_frame(self) -> tuple[int, bytes | None]:
+        seq, frame, _ = self.bus.latest_frame()
+        return seq, frame
+
+    get_latest_image = CameraHub.get_latest_image
+
+
+def _input_dict(joystick_input: JoystickInput) -> dict:
+    return {"dx": joystick_input.dx, "dy": joystick_input.dy, "dz": joystick_input.dz, "yaw": joystick_input.yaw}
+
+async def _invoke(method, *args):
+    # DroneController はその場で結果を返し、RemoteController は owner の応答を待つコルーチンを返す
+    result = method(*args)
+    if asyncio.iscoroutine(result):
+        result = await result
+    return result
+
+_background_commands = set()
+
+async def _handle_command(request: dict):
+    """
+    owner 側: worker から転送された指令を DroneController で実行して (HTTPステータス, 本文) を返す
+    """
+    op = request.get("op")
+    session = request.get("session", "default")
+    try:
+        if op == "mode_get":
+            return 200, drone_controller.get_mode(session)
+        _require_live()
+        if op == "arm":
+            body = drone_controller.arm()
+        elif op == "disarm":
+            body = drone_controller.disarm()
+        elif op in ("takeoff", "land"):
+            tasks = BackgroundTasks()
+            body = getattr(drone_controller, op)(tasks)
+            # 応答は先に返し、離着陸の完了待ちはスレッドで行う
+            task = asyncio.ensure_future(tasks())
+            _background_commands.add(task)
+            task.add_done_callback(_background_commands.discard)
+        elif op == "move":
+            body = drone_controller.move_to_position(JoystickInput(**request["input"]), session)
+        elif op == "move_cancel":
+            body = drone_controller.cancel_move()
+        elif op == "mode_set":
+            body = drone_controller.set_mode(session, ControlMode(mode=request["mode"]).mode)
+        elif op == "velocity":
+            body = drone_controller.set_velocity(session, JoystickInput(**request["input"]))
+        else:
+            return 400, f"不明な指令です: {op}"
+    except HTTPException as e:
+        return e.status_code, e.detail
+    return 200, body
+
 # ---FastAPIアプリケーションのセットアップ---
 app = FastAPI(
     title="Hakoniwa Drone Controller API",
@@ -229,6 +601,19 @@ app = FastAPI(
 async def ping():
     return {"message": "pong"}
 
+@app.get("/metrics")
+async def get_metrics():
+    return Response(content=_registry.render(), media_type=metrics.CONTENT_TYPE)
+
+@app.get("/debug/trace")
+async def get_trace():
+    """
+    記録済みのタイミングスパンを Chrome trace-event JSON で返す（HAKO_TRACE=1 で有効）
+    """
+    if not trace.enabled():
+        raise HTTPException(status_code=404, detail="トレースは無効です。環境変数HAKO_TRACE=1で有効にしてください。")
+    return JSONResponse(trace.chrome_trace())
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["http://localhost:3000"],
@@ -245,37 +630,79 @@ async def get_drone_state():
         raise HTTPException(status_code=503, detail="コントローラーの準備ができていません")
     return drone_controller.status
 
+def _require_controller():
+    if drone_controller is None:
+        raise HTTPException(status_code=503, detail="コントローラーの準備ができていません")
+
+def _require_live():
+    if replay_mode:
+        raise HTTPException(status_code=409, detail="再生モードではドローンを操作できません。")
+
 @router.post("/arm")
 async def arm_drone(): 
-    return drone_controller.arm()
+    _require_live()
+    return await _invoke(drone_controller.arm)
 
 @router.post("/disarm")
 async def disarm_drone(): 
-    return drone_controller.disarm()
+    _require_live()
+    return await _invoke(drone_controller.disarm)
 
 @router.post("/takeoff")
 async def takeoff_drone(background_tasks: BackgroundTasks): 
-    return drone_controller.takeoff(background_tasks)
+    _require_live()
+    return await _invoke(drone_controller.takeoff, background_tasks)
 
 @router.post("/land")
 async def land_drone(background_tasks: BackgroundTasks): 
-    return drone_controller.land(background_tasks)
+    _require_live()
+    return await _invoke(drone_controller.land, background_tasks)
 
 @router.post("/move")
-async def move_position(joystick_input: JoystickInput):
-    return drone_controller.move_to_position(joystick_input)
+async def move_position(joystick_input: JoystickInput, x_session_id: str = Header(default="default")):
+    _require_live()
+    t0 = time.perf_counter()
+    try:
+        return await _invoke(drone_controller.move_to_position, joystick_input, x_session_id)
+    finally:
+        MOVE_SECONDS.observe(time.perf_counter() - t0)
+
+@router.post("/move/cancel")
+async def cancel_move():
+    _require_live()
+    return await _invoke(drone_controller.cancel_move)
+
+@router.get("/mode")
+async def get_mode(x_session_id: str = Header(default="default")):
+    _require_controller()
+    return await _invoke(drone_controller.get_mode, x_session_id)
+
+@router.post("/mode")
+async def set_mode(control_mode: ControlMode, x_session_id: str = Header(default="default")):
+    """
+    セッション (X-Session-Id ヘッダ) ごとの操作モード切り替え: position (/move) または velocity (/velocity)
+    """
+    _require_live()
+    return await _invoke(drone_controller.set_mode, x_session_id, control_mode.mode)
+
+@router.post("/velocity")
+async def set_velocity(joystick_input: JoystickInput, x_session_id: str = Header(default="default")):
+    """
+    速度モードのスティック入力。DEADMAN_TIMEOUT_SEC 以内に送り続けないと中立に戻る
+    """
+    _require_live()
+    return await _invoke(drone_controller.set_velocity, x_session_id, joystick_input)
 
 @router.get("/stream.mjpg")
 def stream_mjpeg(vehicle: str | None = None, cam_id: int = 0, fps: int = 15):
     """
     MJPEG ストリームを返す（CameraHubの最新フレームを配るだけ）
     """
-    if hako is None:
-        raise HTTPException(status_code=503, detail="シミュレータに接続されていません")
-
     # ここで hub を起動（vehicle/cam_id/fps 指定があれば優先）
     global camera_hub
     if camera_hub is None:
+        if hako is None:
+            raise HTTPException(status_code=503, detail="シミュレータに接続されていません")
         v = vehicle or getattr(hako, "default_drone_name", None) or "Drone"
         camera_hub = CameraHub(hako, v, cam_id=cam_id, fps=fps)
         camera_hub.start()
@@ -285,12 +712,22 @@ def stream_mjpeg(vehicle: str | None = None, cam_id: int = 0, fps: int = 15):
 
     def frame_generator():
         import time
+        viewer = next(_mjpeg_viewer_ids)
+        sent = MJPEG_FRAMES_SENT.labels(viewer=viewer)
+        dropped = MJPEG_FRAMES_DROPPED.labels(viewer=viewer)
+        with _mjpeg_viewers_lock:
+            _mjpeg_viewers.add(viewer)
+        last_seq = None
         print(f"[情報] /stream.mjpg: クライアント接続 (fps={fps})")
         try:
             while True:
                 t0 = time.time()
-                frame = camera_hub.get_latest_jpeg() if camera_hub else None
+                seq, frame = camera_hub.get_latest_frame() if camera_hub else (0, None)
+                if last_seq is not None and seq > last_seq + 1:
+                    dropped.inc(seq - last_seq - 1)
+                last_seq = seq
                 if frame:
+                    sent.inc()
                     yield (
                         b"--" + boundary.encode() + b"\r\n"
                         b"Content-Type: image/jpeg\r\n"
@@ -305,6 +742,11 @@ def stream_mjpeg(vehicle: str | None = None, cam_id: int = 0, fps: int = 15):
                     time.sleep(delay)
         except Exception as e:
             print(f"[情報] /stream.mjpg: 切断/例外: {e}")
+        finally:
+            with _mjpeg_viewers_lock:
+                _mjpeg_viewers.discard(viewer)
+            MJPEG_FRAMES_SENT.remove(viewer=viewer)
+            MJPEG_FRAMES_DROPPED.remove(viewer=viewer)
 
     return StreamingResponse(
         frame_generator(),
@@ -315,37 +757,126 @@ def stream_mjpeg(vehicle: str | None = None, cam_id: int = 0, fps: int = 15):
 app.include_router(router)
 
 # ---サーバーのライフサイクルイベント---
-@app.on_event("startup")
-def startup_event():
-    global drone_controller, hako, camera_hub
-    pdu_config_path = os.getenv("HAKO_PDU_CONFIG_PATH")
-    if pdu_config_path is None:
-        print("エラー: 環境変数HAKO_PDU_CONFIG_PATHが設定されていません。")
+def _start_worker():
+    global drone_controller, camera_hub, bus_reader
+    # worker はシミュレータに接続せず、owner の共有メモリとソケットだけを使う
+    from drone_utils.shm_bus import BusReader, BusError
+    from drone_utils.command_channel import CommandClient
+    try:
+        bus_reader = BusReader.wait(BUS_NAME, timeout_sec=float(os.getenv("HAKO_BUS_WAIT_SEC", "10")))
+    except BusError as e:
+        print(f"エラー: 共有メモリに接続できません: {e}")
+        sys.exit(1)
+    print(f"情報: worker として起動します (共有メモリ={BUS_NAME}, owner pid={bus_reader.owner_pid}, 指令={BUS_SOCKET})")
+    drone_controller = RemoteController(CommandClient(BUS_SOCKET))
+    camera_hub = BusCameraHub(bus_reader)
+    startup_timer.mark("attach_bus")
+    print("情報: FastAPIサーバーが正常に起動しました。")
+    startup_timer.report()
+
+async def _start_owner_bus():
+    global bus_writer, command_server
+    from drone_utils.shm_bus import BusWriter, BusError
+    from drone_utils.command_channel import serve
+    try:
+        bus_writer = BusWriter(BUS_NAME, slot_capacity=int(os.getenv("HAKO_BUS_FRAME_BYTES", str(1 << 20))))
+    except BusError as e:
+        print(f"エラー: 共有メモリを作成できません: {e}")
         sys.exit(1)
+    drone_controller.bus = bus_writer
+    camera_hub.bus = bus_writer
+    command_server = await serve(BUS_SOCKET, _handle_command)
+    print(f"情報: owner として状態と映像を公開します (共有メモリ={BUS_NAME}, 指令={BUS_SOCKET})")
 
-    print(f"情報: PDU設定ファイルを使用します: {pdu_config_path}")
-    hako = hakosim.MultirotorClient(pdu_config_path)
+@app.on_event("startup")
+async def startup_event():
+    global drone_controller, hako, camera_hub, replay_mode
+    startup_timer.mark("app_setup")
+    if trace.configure_from_env(prefix="server_trace"):
+        print("情報: タイミングトレースを有効にしました (/debug/trace, SIGUSR1 でダンプ)")
+    if SERVER_ROLE not in ("single", "owner", "worker"):
+        print(f"エラー: HAKO_SERVER_ROLE は single / owner / worker のいずれかです: {SERVER_ROLE}")
+        sys.exit(1)
+    if SERVER_ROLE == "worker":
+        _start_worker()
+        return
+    pdu_config_path = os.getenv("HAKO_PDU_CONFIG_PATH")
+    replay_dir = os.getenv("HAKO_REPLAY_DIR")
+    if replay_dir:
+        # 記録済みフライトの再生: /state と /stream.mjpg が記録内容を配信する
+        from drone_utils.recording import ReplayClient
+        speed = float(os.getenv("HAKO_REPLAY_SPEED", "1.0"))
+        print(f"情報: 記録を再生します: {replay_dir} (速度 x{speed})")
+        hako = ReplayClient(replay_dir, speed=speed)
+        replay_mode = True
+    elif os.getenv("HAKO_FAKE_SIM"):
+        # ベンチマーク用: シミュレータの代わりに擬似クライアントを使う (bench/fake_hakosim.py)
+        from bench.fake_hakosim import FakeMultirotorClient
+        print("情報: 擬似シミュレータ (HAKO_FAKE_SIM) を使用します")
+        hako = FakeMultirotorClient(pdu_config_path)
+    else:
+        if pdu_config_path is None:
+            print("エラー: 環境変数HAKO_PDU_CONFIG_PATHが設定されていません。")
+            sys.exit(1)
+
+        print(f"情報: PDU設定ファイルを使用します: {pdu_config_path}")
+        import libs.hakosim as hakosim
+        startup_timer.mark("import_hakosim")
+        hako = hakosim.MultirotorClient(pdu_config_path)
+        # PDU のオフセット表はディスクキャッシュから読む
+        from drone_utils.pdu_manager import use_cached_offsets
+        use_cached_offsets(hako.pdu_manager, pdu_config_path)
+        startup_timer.mark("pdu_tables")
     if not hako.confirmConnection():
         print("エラー: Hakoniwaへの接続に失敗しました。")
         sys.exit(1)
 
     hako.enableApiControl(True)
+    startup_timer.mark("connect")
     drone_controller = DroneController(hako)
     drone_controller.start_sync_loop()
     camera_hub = CameraHub(hako, getattr(hako, "default_drone_name", None) or "Drone", cam_id=0, fps=12)
+    record_dir = os.getenv("HAKO_RECORD_DIR")
+    if record_dir and not replay_mode:
+        from drone_utils.recording import FrameRecorder
+        camera_hub.recorder = FrameRecorder(record_dir)
+        print(f"情報: カメラ映像とテレメトリを記録します: {record_dir}")
+    if SERVER_ROLE == "owner":
+        await _start_owner_bus()
     camera_hub.start()
+    startup_timer.mark("start_loops")
     print("情報: FastAPIサーバーが正常に起動しました。")
+    startup_timer.report()
 
 @app.on_event("shutdown")
-def shutdown_event():
-    global camera_hub
-    if drone_controller: 
+async def shutdown_event():
+    global camera_hub, bus_writer, bus_reader, command_server
+    if command_server:
+        command_server.close()
+        await command_server.wait_closed()
+        if os.path.exists(BUS_SOCKET):
+            os.remove(BUS_SOCKET)
+        command_server = None
+    if isinstance(drone_controller, DroneController):
         drone_controller.stop_sync_loop()
+    elif drone_controller:
+        drone_controller.client.close()
     if camera_hub:
         camera_hub.stop()
+    if bus_writer:
+        if isinstance(drone_controller, DroneController):
+            drone_controller.bus = None
+        print(f"情報: 共有メモリを解放しました (公開フレーム数={bus_writer.frames}, サイズ超過={bus_writer.oversize})")
+        bus_writer.close()
+        bus_writer = None
+    if bus_reader:
+        bus_reader.close()
+        bus_reader = None
     print("情報: FastAPIサーバーをシャットダウンしました。")
 
 if __name__ == "__main__":
     print("エラー: このスクリプトは直接実行できません。uvicornコマンドを使用してください。")
     print("例: uvicorn drone_api.rc.server:app --reload")
+    print("複数プロセス: HAKO_SERVER_ROLE=owner uvicorn server:app --port 8000")
+    print("          と HAKO_SERVER_ROLE=worker uvicorn server:app --port 8001 --workers 4")
     sys.exit(1)
\ No newline at end of file